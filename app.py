@@ -1,17 +1,66 @@
+import logging
 from flask import Flask, redirect, url_for, render_template
 from flask_login import LoginManager, current_user
-from models import db, User
+from models import db
+from converter import conversion_pool
+from preview_cache import preview_cache
+from preview_jobs import preview_jobs
+from storage import storage
+from images import image_pipeline
+from expiry import expiry_scheduler
+from file_gc import file_sweeper
+from dashboard import dashboard_reconciler
+from user_cache import user_cache
+from login_service import login_service
+from metrics import metrics_exporter
 from routes.auth import auth_bp
 from routes.temp_spec import temp_spec_bp
 from routes.upload import upload_bp
 from routes.admin import admin_bp
+from routes.dashboard import dashboard_bp
+from routes.api import api_bp
 
 app = Flask(__name__)
 app.config.from_object('config.Config')
 
+logging.basicConfig(level=app.config['LOG_LEVEL'], format='%(asctime)s %(levelname)s [%(name)s] %(message)s')
+
 # 初始化資料庫
 db.init_app(app)
 
+# 初始化 PDF 轉檔 worker 池 (實際 worker 於第一次轉檔時啟動)
+conversion_pool.init_app(app)
+
+# 初始化預覽 PDF 快取
+preview_cache.init_app(app)
+
+# 初始化非同步預覽工作佇列
+preview_jobs.init_app(app)
+
+# 初始化檔案儲存 (本機分層資料夾或 S3 相容儲存)
+storage.init_app(app)
+
+# 初始化圖片上傳處理 (去重、縮小、縮圖)
+image_pipeline.init_app(app)
+
+# 初始化規範到期排程 (EXPIRY_SCHEDULER_ENABLED 時於各 worker 背景執行)
+expiry_scheduler.init_app(app)
+
+# 初始化檔案清除 (FILE_GC_ENABLED 時於各 worker 背景清除已刪除規範的檔案與未被引用的圖片)
+file_sweeper.init_app(app)
+
+# 初始化儀表板統計校正 (DASHBOARD_RECONCILE_ENABLED 時於各 worker 背景以 GROUP BY 修正 spec_stat 的偏差)
+dashboard_reconciler.init_app(app)
+
+# 初始化登入使用者快取
+user_cache.init_app(app)
+
+# 初始化密碼驗證執行緒池與 last_login 批次寫入
+login_service.init_app(app)
+
+# 初始化效能指標 (/metrics、請求與資料庫查詢統計)
+metrics_exporter.init_app(app)
+
 # 初始化登入管理
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -24,16 +73,18 @@ login_manager.login_message_category = "info"
 def index():
     return redirect(url_for('auth.login'))
 
-# 載入登入使用者
+# 載入登入使用者 (由行程內快取取得，快取未命中才查詢資料庫)
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 # 註冊 Blueprint 模組路由
 app.register_blueprint(auth_bp)
 app.register_blueprint(temp_spec_bp)
 app.register_blueprint(upload_bp)
 app.register_blueprint(admin_bp)
+app.register_blueprint(dashboard_bp)
+app.register_blueprint(api_bp)
 
 # 註冊錯誤處理函式
 @app.errorhandler(404)
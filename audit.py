@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+操作歷史紀錄 (稽核)
+
+- record_history: 紀錄先暫存在目前的 app context，commit 前以單一批次 INSERT 寫入，
+  與規範的變更在同一個交易中生效；交易 rollback 時一併捨棄。
+- iter_history_export: 以 id 游標分批讀取 (只取欄位值，不建立 ORM 物件) 並逐列產生 CSV / JSONL，
+  匯出任意數量的紀錄時記憶體用量維持固定。
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from flask import g, has_app_context
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from models import db, SpecHistory, TempSpec, User
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ('id', 'timestamp', 'spec_code', 'action', 'username', 'details')
+
+
+def record_history(spec_id, action, details="", user_id=None):
+    """暫存一筆歷史紀錄，於 db.session.commit() 前寫入"""
+    buffer = g.setdefault('_audit_buffer', [])
+    buffer.append({
+        'spec_id': spec_id,
+        'user_id': user_id,
+        'action': action,
+        'details': details,
+        'timestamp': datetime.utcnow(),
+    })
+
+
+def flush_history(session=None):
+    """立即寫入暫存的歷史紀錄 (不 commit)，回傳寫入的筆數"""
+    if not has_app_context():
+        return 0
+    buffer = g.pop('_audit_buffer', None)
+    if not buffer:
+        return 0
+    (session or db.session).execute(insert(SpecHistory), buffer)
+    return len(buffer)
+
+
+@event.listens_for(Session, 'before_commit')
+def _flush_before_commit(session):
+    if has_app_context() and g.get('_audit_buffer') and session is db.session():
+        flush_history(session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    if has_app_context() and '_audit_buffer' in g and session is db.session():
+        g.pop('_audit_buffer', None)
+
+
+def _export_query(spec_id=None, start=None, end=None):
+    query = db.session.query(
+        SpecHistory.id, SpecHistory.timestamp, TempSpec.spec_code, SpecHistory.action,
+        User.username, SpecHistory.details,
+    ).join(TempSpec, SpecHistory.spec_id == TempSpec.id).outerjoin(User, SpecHistory.user_id == User.id)
+    if spec_id is not None:
+        query = query.filter(SpecHistory.spec_id == spec_id)
+    if start is not None:
+        query = query.filter(SpecHistory.timestamp >= start)
+    if end is not None:
+        query = query.filter(SpecHistory.timestamp < end)
+    return query
+
+
+def iter_history_rows(spec_id=None, start=None, end=None, batch_size=EXPORT_BATCH_SIZE):
+    """依 id 遞增分批產生歷史紀錄列 (tuple)，每批查詢只取 batch_size 筆"""
+    query = _export_query(spec_id, start, end)
+    last_id = 0
+    while True:
+        rows = query.filter(SpecHistory.id > last_id).order_by(SpecHistory.id).limit(batch_size).all()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1].id
+
+
+def _format_row(row):
+    timestamp = row.timestamp.strftime('%Y-%m-%d %H:%M:%S') if row.timestamp else ''
+    return (row.id, timestamp, row.spec_code, row.action,
+            row.username or ('系統' if row.action == '過期' else ''), row.details or '')
+
+
+def iter_history_export(fmt, spec_id=None, start=None, end=None):
+    """產生匯出檔的內容片段；fmt 為 'csv' 或 'jsonl'"""
+    if fmt == 'jsonl':
+        for row in iter_history_rows(spec_id, start, end):
+            yield json.dumps(dict(zip(EXPORT_COLUMNS, _format_row(row))), ensure_ascii=False) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM 讓 Excel 以 UTF-8 開啟中文內容
+    yield '\ufeff'
+    writer.writerow(EXPORT_COLUMNS)
+    for i, row in enumerate(iter_history_rows(spec_id, start, end), 1):
+        writer.writerow(_format_row(row))
+        if i % 200 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+登入尖峰基準測試
+
+模擬交接班時 N 位使用者同時登入 (以 --concurrency 個執行緒代表 WSGI worker 執行緒)，比較：
+
+- inline: 原本的做法，在請求執行緒上計算密碼雜湊並立即 commit last_login
+- pooled: login_service 的做法，雜湊交給有上限的執行緒池，last_login 批次寫入
+
+同時有一個探測執行緒持續執行輕量查詢 (代表其他頁面的請求)，記錄登入尖峰期間的延遲。
+
+    python benchmarks/bench_login.py
+    python benchmarks/bench_login.py --users 200 --concurrency 32 --method pbkdf2:sha256:600000 --json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+
+from login_service import LoginService  # noqa: E402
+from models import db, User  # noqa: E402
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def make_app(db_path, args):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{db_path}",
+        SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}},
+        PASSWORD_HASH_METHOD=args.method,
+        PASSWORD_VERIFY_WORKERS=args.verify_workers,
+        PASSWORD_VERIFY_MAX_PENDING=args.users,
+        LAST_LOGIN_FLUSH_INTERVAL=1,
+    )
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        password_hash = generate_password_hash('password', method=args.stored_method or args.method)
+        db.session.add_all([User(username=f"op{i:04d}", password_hash=password_hash, role='viewer')
+                            for i in range(args.users)])
+        db.session.commit()
+    return app
+
+
+def login_inline(app, username):
+    with app.app_context():
+        user = User.query.filter_by(username=username).first()
+        if user and check_password_hash(user.password_hash, 'password'):
+            user.last_login = datetime.now()
+            db.session.commit()
+            return True
+        return False
+
+
+def login_pooled(app, service, username):
+    with app.app_context():
+        user = User.query.filter_by(username=username).first()
+        if user and service.verify(user, 'password'):
+            service.record_login(user.id)
+            return True
+        return False
+
+
+def probe(app, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        with app.app_context():
+            db.session.get(User, 1)
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.01)
+
+
+def run(mode, args):
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        app = make_app(db_path, args)
+        service = LoginService(app)
+        latencies, probe_latencies = [], []
+        stop = threading.Event()
+        prober = threading.Thread(target=probe, args=(app, stop, probe_latencies), daemon=True)
+        prober.start()
+
+        def one(username):
+            start = time.perf_counter()
+            ok = login_inline(app, username) if mode == 'inline' else login_pooled(app, service, username)
+            latencies.append((time.perf_counter() - start) * 1000)
+            return ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(one, [f"op{i:04d}" for i in range(args.users)]))
+        if mode == 'pooled':
+            service.flush()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        prober.join()
+
+        with app.app_context():
+            recorded = User.query.filter(User.last_login.isnot(None)).count()
+            rehashed = User.query.filter(User.password_hash.like(service.current_parameters + '$%')).count()
+        return {
+            'logins': sum(results),
+            'last_login_recorded': recorded,
+            'hashes_current': rehashed,
+            'elapsed_s': round(elapsed, 3),
+            'logins_per_s': round(args.users / elapsed, 1),
+            'login_p50_ms': round(percentile(latencies, 50), 1),
+            'login_p95_ms': round(percentile(latencies, 95), 1),
+            'probe_p50_ms': round(percentile(probe_latencies, 50), 2),
+            'probe_p95_ms': round(percentile(probe_latencies, 95), 2),
+        }
+    finally:
+        os.remove(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=60, help='同時登入的使用者數')
+    parser.add_argument('--concurrency', type=int, default=16, help='模擬的 WSGI 執行緒數')
+    parser.add_argument('--verify-workers', type=int, default=2, help='pooled 模式的驗證執行緒數')
+    parser.add_argument('--method', default='scrypt', help='目前的密碼雜湊方法')
+    parser.add_argument('--stored-method', help='資料庫中既有雜湊使用的方法 (用來測試登入時重新雜湊)')
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出結果')
+    args = parser.parse_args()
+
+    results = {mode: run(mode, args) for mode in ('inline', 'pooled')}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.users} 位使用者、{args.concurrency} 個請求執行緒、雜湊方法 {args.method}")
+    for mode, r in results.items():
+        print(f"  {mode:7s} {r['logins_per_s']:7.1f} 登入/秒  登入 p50 {r['login_p50_ms']:7.1f} ms  "
+              f"p95 {r['login_p95_ms']:7.1f} ms  其他請求 p95 {r['probe_p95_ms']:6.2f} ms  "
+              f"last_login {r['last_login_recorded']}  新參數雜湊 {r['hashes_current']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Markdown → sections 基準測試
+
+比較原本的路徑 (mistune.html + BeautifulSoup/lxml，建立規範時還會先轉一次 HTML)
+與單次走訪 mistune AST 的新路徑 (含與不含內容雜湊快取)，並確認兩者輸出相同。
+
+    python benchmarks/bench_markdown_sections.py
+    python benchmarks/bench_markdown_sections.py --paragraphs 2000 --repeat 20 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mistune  # noqa: E402
+import utils  # noqa: E402
+
+
+def make_change_description(paragraphs):
+    """產生接近實際「變更前/變更後」內容的大型 Markdown。"""
+    parts = []
+    for i in range(paragraphs):
+        parts.append(
+            f"第 {i} 段：調整 **Lot {i:05d}** 的 *製程參數*，設備 `EQ-{i % 37:03d}` "
+            f"溫度由 250℃ 改為 255℃ & 壓力維持不變。\n參考 [規範](http://example/spec/{i})。"
+        )
+        if i % 10 == 0:
+            parts.append(f"![圖{i}](/static/uploads/images/sample_{i}.png)")
+        if i % 25 == 0:
+            rows = "\n".join(f"| {r} | EQ-{r:03d} | **{r * 1.5:.1f}** |" for r in range(20))
+            parts.append("| 項目 | 設備 | 數值 |\n|---|---|---|\n" + rows)
+    return "\n\n".join(parts)
+
+
+def legacy_sections(md_content):
+    return utils._html_sections(mistune.html(md_content))
+
+
+def legacy_create_sections(md_content):
+    # 建立規範時原本會先在 route 中轉成 HTML，fill_template 再轉一次
+    return utils._html_sections(mistune.html(mistune.html(md_content)))
+
+
+def ast_sections(md_content):
+    return utils._markdown_ast_sections(md_content)
+
+
+def memoized_sections(md_content):
+    return list(utils._markdown_section_specs(md_content))
+
+
+def measure(func, arg, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        'min_ms': timings[0] * 1000,
+        'median_ms': timings[len(timings) // 2] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--paragraphs', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出結果')
+    args = parser.parse_args()
+
+    md_content = make_change_description(args.paragraphs)
+
+    expected = legacy_sections(md_content)
+    assert ast_sections(md_content) == expected, "AST 路徑輸出與 HTML 路徑不同"
+    assert legacy_create_sections(md_content) == expected, "建立路徑 (雙重轉換) 輸出不同"
+
+    results = {
+        'input_bytes': len(md_content.encode('utf-8')),
+        'sections': len(expected),
+        'legacy_html': measure(legacy_sections, md_content, args.repeat),
+        'legacy_create_double_html': measure(legacy_create_sections, md_content, args.repeat),
+        'ast_single_pass': measure(ast_sections, md_content, args.repeat),
+        'ast_memoized': measure(memoized_sections, md_content, args.repeat),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"輸入 {results['input_bytes']} bytes, {results['sections']} sections")
+    for name in ('legacy_html', 'legacy_create_double_html', 'ast_single_pass', 'ast_memoized'):
+        r = results[name]
+        print(f"  {name:28s} min {r['min_ms']:8.2f} ms   median {r['median_ms']:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
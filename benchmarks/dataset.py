@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+基準測試用的 SQLite 資料集
+
+產生接近正式環境分布的資料：數年份的規範 (每月流水號、各種狀態)、每筆規範的歷史紀錄
+(少數規範有數百筆，用來測試歷史紀錄分頁)、已生效規範的簽核上傳、圖片中繼資料與引用，
+以及全文檢索索引、編號計數列與儀表板統計。固定亂數種子，相同參數每次產生的資料相同。
+
+產生的資料庫與儲存資料夾會保留，參數與資料庫版本相同時直接重複使用。
+
+    python benchmarks/dataset.py                      # 產生 100k 筆規範的資料集
+    python benchmarks/dataset.py --specs 10000 --rebuild
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from dashboard import reconcile_stats  # noqa: E402
+from migrations import MIGRATIONS, stamp_latest  # noqa: E402
+from models import db, User, TempSpec, Upload, SpecHistory, ImageAsset, SpecImage, SpecCodeSequence  # noqa: E402
+from search import rebuild_search_index  # noqa: E402
+from storage import storage, image_key  # noqa: E402
+
+DEFAULT_SPECS = 100_000
+DEFAULT_SEED = 20240501
+
+# 圖片中繼資料的筆數與實際寫入儲存空間的張數 (圖片較多的 Markdown 輸入使用)
+IMAGE_ASSETS = 5000
+IMAGE_FILES = 64
+# 每隔幾筆規範有一筆大量歷史紀錄的規範
+LONG_HISTORY_EVERY = 1000
+LONG_HISTORY_ENTRIES = 300
+
+_INSERT_CHUNK = 5000
+
+_EQUIPMENT = ('Die Bonder', 'Wire Bonder', 'Molding', 'Plating', 'Trim Form', 'Marking', 'Saw', 'Reflow')
+_TOPICS = ('製程參數調整', '治具變更', '材料替代', '設備移機', '檢驗條件放寬', '作業流程變更', '暫時停用量測')
+_STATIONS = ('DB', 'WB', 'MD', 'PL', 'TF', 'MK')
+
+
+def default_data_dir(specs=DEFAULT_SPECS, seed=DEFAULT_SEED):
+    """資料集的預設位置 (依規範數、種子與資料庫版本區分)"""
+    version = MIGRATIONS[-1][0]
+    return os.path.join(tempfile.gettempdir(), f"spec_bench_{specs}_{seed}_v{version}")
+
+
+def dataset_paths(data_dir):
+    return {
+        'db': os.path.join(data_dir, 'bench.db'),
+        'storage': os.path.join(data_dir, 'storage'),
+        'meta': os.path.join(data_dir, 'dataset.json'),
+    }
+
+
+def load_meta(data_dir):
+    """已完成的資料集描述，不存在 (或產生到一半中斷) 時回傳 None"""
+    try:
+        with open(dataset_paths(data_dir)['meta'], encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _spec_code(created_at, sequence):
+    return f"PE{created_at.year - 1911}{created_at.strftime('%m')}{sequence:04d}"
+
+
+def _chunked_insert(model, rows):
+    for start in range(0, len(rows), _INSERT_CHUNK):
+        db.session.execute(insert(model), rows[start:start + _INSERT_CHUNK])
+
+
+def _png_bytes(rng, index):
+    width, height = rng.choice(((640, 480), (1024, 768), (1600, 900), (320, 240)))
+    color = (index * 37 % 256, index * 91 % 256, index * 53 % 256)
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'PNG')
+    return buffer.getvalue(), width, height
+
+
+def _content(rng, spec_code, equipment, images):
+    lines = [
+        "變更前：",
+        f"**{equipment}** 參數依標準書設定，Lot 依序投入。",
+        "",
+        "變更後：",
+        f"{equipment} 溫度由 {rng.randint(150, 260)}℃ 調整為 {rng.randint(150, 260)}℃，"
+        f"適用編號 {spec_code}。",
+    ]
+    for filename in images:
+        lines.append(f"![附圖](/static/uploads/images/{filename})")
+    lines += ["", "資料收集需求：", f"每批抽測 {rng.randint(3, 20)} 顆，記錄於 SPC。"]
+    return '\n'.join(lines)
+
+
+def build_dataset(app, specs=DEFAULT_SPECS, seed=DEFAULT_SEED, months=36, now=None, log=print):
+    """在 app 目前設定的資料庫與儲存空間中產生資料集，回傳資料集描述 (dict)"""
+    rng = random.Random(seed)
+    now = now or datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=30 * months)
+    span = (now - start).total_seconds()
+    started = time.perf_counter()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        stamp_latest()
+
+        users = [{'id': 1, 'username': 'admin', 'password_hash': 'x', 'role': 'admin'}]
+        users += [{'id': i, 'username': f"editor{i:02d}", 'password_hash': 'x', 'role': 'editor'} for i in range(2, 21)]
+        users += [{'id': i, 'username': f"viewer{i:02d}", 'password_hash': 'x', 'role': 'viewer'} for i in range(21, 61)]
+        _chunked_insert(User, users)
+
+        # 圖片：全部有中繼資料，前 IMAGE_FILES 張實際寫入儲存空間
+        assets = []
+        for i in range(IMAGE_ASSETS):
+            if i < IMAGE_FILES:
+                data, width, height = _png_bytes(rng, i)
+            else:
+                data, width, height = b'', 1024, 768
+            filename = f"{rng.getrandbits(128):032x}.png"
+            if data:
+                storage.save_bytes(image_key(filename), data)
+            assets.append({'filename': filename, 'width': width, 'height': height,
+                           'size_bytes': len(data) or 150_000, 'sha256': f"{i:064x}",
+                           'created_at': start, 'last_uploaded_at': start})
+        _chunked_insert(ImageAsset, assets)
+        image_names = [asset['filename'] for asset in assets]
+
+        created = sorted(start + timedelta(seconds=rng.random() * span) for _ in range(specs))
+        sequences = {}
+        spec_rows, history_rows, upload_rows, image_rows = [], [], [], []
+        for spec_id, created_at in enumerate(created, start=1):
+            prefix_key = (created_at.year, created_at.month)
+            sequences[prefix_key] = sequences.get(prefix_key, 0) + 1
+            spec_code = _spec_code(created_at, sequences[prefix_key])
+            equipment = rng.choice(_EQUIPMENT)
+            images = rng.sample(image_names, rng.choice((0, 0, 1, 1, 2, 3)))
+            start_date = created_at.date()
+            end_date = start_date + timedelta(days=30)
+            user_id = rng.randint(2, 20)
+
+            age_days = (now - created_at).days
+            if age_days < 14:
+                status = rng.choice(('pending_approval', 'pending_approval', 'active'))
+            elif age_days < 60:
+                status = rng.choice(('active', 'active', 'terminated', 'expired'))
+            else:
+                status = rng.choice(('expired', 'expired', 'expired', 'terminated'))
+
+            events = [(created_at, user_id, '建立', f"建立暫時規範，編號為 {spec_code}")]
+            if status != 'pending_approval':
+                activated = created_at + timedelta(hours=rng.randint(2, 72))
+                events.append((activated, 1, '啟用', '上傳簽核文件並啟用'))
+                upload_rows.append({'temp_spec_id': spec_id, 'filename': f"{spec_code}_signed.pdf",
+                                    'upload_time': activated, 'sha256': f"{spec_id:064x}",
+                                    'size_bytes': rng.randint(80_000, 900_000)})
+            extensions = 0
+            if status in ('active', 'expired', 'terminated') and rng.random() < 0.3:
+                extensions = rng.randint(1, 2)
+                end_date += timedelta(days=30 * extensions)
+                for n in range(extensions):
+                    events.append((created_at + timedelta(days=20 + 30 * n), user_id, '展延',
+                                   f"展延至 {end_date.isoformat()}"))
+            if status == 'terminated':
+                events.append((created_at + timedelta(days=rng.randint(5, 40)), user_id, '終止', '提前結束'))
+            elif status == 'expired':
+                events.append((datetime.combine(end_date, datetime.min.time()) + timedelta(days=1), None,
+                               '過期', '結束日期已過，自動設為過期'))
+            if spec_id % LONG_HISTORY_EVERY == 0:
+                for n in range(LONG_HISTORY_ENTRIES):
+                    events.append((created_at + timedelta(minutes=n + 1), rng.randint(1, 20), '編輯', f"修訂 #{n}"))
+
+            spec_rows.append({
+                'id': spec_id, 'spec_code': spec_code, 'applicant': f"申請人{user_id:02d}",
+                'title': f"{equipment} {rng.choice(_TOPICS)} {spec_code[-4:]}",
+                'content': _content(rng, spec_code, equipment, images),
+                'start_date': start_date, 'end_date': end_date, 'status': status,
+                'created_at': created_at, 'extension_count': extensions,
+                'termination_reason': '提前結束' if status == 'terminated' else None,
+                'lot_number': f"LOT{rng.randint(0, 99999):05d}",
+                'equipment_type': f"{equipment} EQ-{rng.randint(1, 60):03d}",
+                'render_inputs': json.dumps({'serial_number': spec_code, 'station': rng.choice(_STATIONS)},
+                                            ensure_ascii=False),
+            })
+            history_rows += [{'spec_id': spec_id, 'user_id': uid, 'action': action, 'details': details,
+                              'timestamp': timestamp} for timestamp, uid, action, details in events]
+            image_rows += [{'spec_id': spec_id, 'filename': filename} for filename in images]
+
+            if len(spec_rows) >= _INSERT_CHUNK:
+                _chunked_insert(TempSpec, spec_rows)
+                spec_rows = []
+        _chunked_insert(TempSpec, spec_rows)
+        _chunked_insert(SpecHistory, history_rows)
+        _chunked_insert(Upload, upload_rows)
+        _chunked_insert(SpecImage, image_rows)
+
+        # 與正式環境相同：每個月份都有計數列 (升級前的月份由第一次配發時建立)
+        _chunked_insert(SpecCodeSequence, [
+            {'prefix': f"PE{year - 1911}{month:02d}", 'last_value': value}
+            for (year, month), value in sequences.items()
+        ])
+        db.session.commit()
+        rebuild_search_index()
+        reconcile_stats()
+
+        long_history_ids = [spec_id for spec_id in range(LONG_HISTORY_EVERY, specs + 1, LONG_HISTORY_EVERY)]
+        meta = {
+            'specs': specs,
+            'seed': seed,
+            'months': months,
+            'schema_version': MIGRATIONS[-1][0],
+            'generated_at': now.isoformat(),
+            'history': len(history_rows),
+            'uploads': len(upload_rows),
+            'image_assets': len(assets),
+            'spec_images': len(image_rows),
+            'image_files': image_names[:IMAGE_FILES],
+            'long_history_spec_id': long_history_ids[0] if long_history_ids else specs,
+            'build_seconds': round(time.perf_counter() - started, 1),
+        }
+    log(f"   - {specs} 筆規範、{meta['history']} 筆歷史紀錄、{meta['uploads']} 筆上傳、"
+        f"{meta['spec_images']} 筆圖片引用 ({meta['build_seconds']} 秒)")
+    return meta
+
+
+def make_app(data_dir):
+    """指向資料集資料庫與儲存空間的最小 Flask app (只產生資料時使用)"""
+    from flask import Flask
+
+    paths = dataset_paths(data_dir)
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{paths['db']}", STORAGE_ROOT=paths['storage'],
+                      STORAGE_LEGACY_FALLBACK=False)
+    db.init_app(app)
+    storage.init_app(app)
+    return app
+
+
+def ensure_dataset(app, data_dir, specs=DEFAULT_SPECS, seed=DEFAULT_SEED, rebuild=False, log=print):
+    """
+    確認 data_dir 中有對應參數的資料集，沒有 (或 rebuild) 時重新產生。
+    app 的資料庫與 STORAGE_ROOT 需指向 dataset_paths(data_dir)。
+    """
+    meta = load_meta(data_dir)
+    if meta and not rebuild and meta.get('specs') == specs and meta.get('seed') == seed \
+            and meta.get('schema_version') == MIGRATIONS[-1][0]:
+        return meta
+
+    log(f"🔄 產生基準測試資料集: {data_dir}")
+    paths = dataset_paths(data_dir)
+    for path in (paths['meta'], paths['db']):
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.exists(paths['storage']):
+        shutil.rmtree(paths['storage'])
+    os.makedirs(data_dir, exist_ok=True)
+    meta = build_dataset(app, specs=specs, seed=seed, log=log)
+    # 描述檔最後寫入，產生到一半中斷時下次會重新產生
+    with open(paths['meta'], 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--specs', type=int, default=DEFAULT_SPECS, help='規範筆數')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='亂數種子')
+    parser.add_argument('--data-dir', help='資料集位置 (預設在系統暫存資料夾)')
+    parser.add_argument('--rebuild', action='store_true', help='即使已存在也重新產生')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or default_data_dir(args.specs, args.seed)
+    app = make_app(data_dir)
+    meta = ensure_dataset(app, data_dir, args.specs, args.seed, rebuild=args.rebuild)
+    print(f"✅ 資料集: {dataset_paths(data_dir)['db']} ({meta['specs']} 筆規範)")
+
+
+if __name__ == '__main__':
+    main()
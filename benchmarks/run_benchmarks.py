@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+渲染與查詢熱點的基準測試
+
+在 Linux + SQLite 上離線執行 (不需要 MySQL、Word 或 LibreOffice)：
+
+- markdown.*:     _process_markdown_sections，分為少量文字、大量段落、大量表格、大量圖片四種輸入，
+                  各測冷快取 (清除 section / 圖片尺寸快取) 與熱快取
+- fill_template.*: 完整的文件產生流程，PDF 轉檔使用不啟動外部程式的 stub 後端
+- spec_list.* / spec_history.*: 以測試用 client 請求實際路由 (含查詢與模板渲染)，
+                  對 dataset.py 產生的資料集 (預設 100k 筆規範) 執行
+- spec_code.*:    編號配發 allocate_spec_code / peek_next_spec_code (含計數列不存在時的起始值查詢)
+
+每項結果包含 min / median / p95 / mean 耗時與每次執行的資料庫查詢數；
+--output 輸出 JSON，--baseline 與先前的 JSON 比較，median 變慢超過門檻或查詢數增加時以代碼 1 結束。
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --specs 10000 --only markdown,spec_list
+    python benchmarks/run_benchmarks.py --baseline bench.json --threshold 0.2
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sqlalchemy  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import converter  # noqa: E402
+import dataset  # noqa: E402
+
+STUB_BACKEND = 'bench-stub'
+_STUB_PDF = b"%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n"
+
+
+@converter.register_backend
+class StubBackend(converter.ConverterBackend):
+    """不啟動 Word/LibreOffice，只寫出固定內容的 PDF，讓 fill_template 只量測本程式的部分"""
+    name = STUB_BACKEND
+
+    def convert(self, docx_path, pdf_path, timeout):
+        with open(pdf_path, 'wb') as f:
+            f.write(_STUB_PDF)
+
+
+# ---------------------------------------------------------------------------
+# 量測
+# ---------------------------------------------------------------------------
+
+class QueryCounter:
+    """計算一段程式執行的資料庫查詢數與耗時"""
+
+    def __init__(self, engine):
+        self.queries = 0
+        self.seconds = 0.0
+        self._start = None
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, *args):
+        self._start = time.perf_counter()
+
+    def _after(self, *args):
+        if self._start is not None:
+            self.seconds += time.perf_counter() - self._start
+            self._start = None
+        self.queries += 1
+
+    def reset(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def measure(counter, func, repeat, warmup=1, setup=None, teardown=None):
+    """執行 warmup + repeat 次，只計時 func 本身；setup/teardown 不計入"""
+    timings, queries, db_seconds = [], [], []
+    for i in range(warmup + repeat):
+        if setup:
+            setup()
+        counter.reset()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if teardown:
+            teardown()
+        if i >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(counter.queries)
+            db_seconds.append(counter.seconds * 1000)
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(timings[len(timings) // 2], 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': max(queries),
+        'db_median_ms': round(sorted(db_seconds)[len(db_seconds) // 2], 3),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Markdown 輸入
+# ---------------------------------------------------------------------------
+
+def markdown_inputs(image_files):
+    small = (
+        "**Die Bonder** 溫度由 250℃ 改為 255℃，壓力維持不變。\n\n"
+        "- 適用機台 `EQ-012`、`EQ-013`\n- 每批首件量測\n\n"
+        "參考 [原規範](http://example/spec/1)。"
+    )
+    large = "\n\n".join(
+        f"第 {i} 段：調整 **Lot {i:05d}** 的 *製程參數*，設備 `EQ-{i % 37:03d}` "
+        f"溫度由 250℃ 改為 255℃ & 壓力維持不變。\n參考 [規範](http://example/spec/{i})。"
+        for i in range(2000)
+    )
+    tables = "\n\n".join(
+        f"表 {t}：量測結果\n\n| 項目 | 設備 | 規格 | 數值 |\n|---|---|---|---|\n" +
+        "\n".join(f"| {r} | EQ-{r:03d} | {r}±0.5 | **{r * 1.5:.1f}** |" for r in range(30))
+        for t in range(40)
+    )
+    images = "\n\n".join(
+        f"圖 {i}：{'變更前' if i % 2 else '變更後'}外觀\n\n![圖{i}](/static/uploads/images/{image_files[i % len(image_files)]})"
+        for i in range(60)
+    )
+    return {'small': small, 'large': large, 'tables': tables, 'images': images}
+
+
+def template_values(change_before, change_after):
+    return {
+        'serial_number': 'PE11405BENCH',
+        'theme': 'Die Bonder 製程參數調整',
+        'applicant': '王小明',
+        'applicant_phone': '1234',
+        'station': 'DB, WB',
+        'tccs_info': 'L2 (Machine)',
+        'start_date': '2025-05-01',
+        'end_date': '2025-05-31',
+        'package': 'QFN',
+        'lot_number': 'LOT00001',
+        'equipment_type': 'Die Bonder EQ-012',
+        'change_before': change_before,
+        'change_after': change_after,
+        'data_needs': '每批抽測 5 顆，記錄於 SPC。',
+    }
+
+
+# ---------------------------------------------------------------------------
+# 基準測試項目
+# ---------------------------------------------------------------------------
+
+def bench_markdown(app, counter, meta, args):
+    import images
+    import utils
+    from rendering import TEMPLATE_PATH
+    from template_registry import template_registry
+
+    def clear_caches():
+        utils._section_cache.clear()
+        with images._cache_lock:
+            images._dimension_cache.clear()
+
+    results = {}
+    with app.app_context():
+        doc = template_registry.get(TEMPLATE_PATH)
+        for name, md_content in markdown_inputs(meta['image_files']).items():
+            sections = utils._process_markdown_sections(doc, md_content)
+            if not sections:
+                raise RuntimeError(f"markdown.{name} 沒有產生任何 section")
+            run = lambda md_content=md_content: utils._process_markdown_sections(doc, md_content)  # noqa: E731
+            results[f'markdown.{name}.cold'] = measure(counter, run, args.repeat, setup=clear_caches)
+            results[f'markdown.{name}.warm'] = measure(counter, run, args.repeat)
+            results[f'markdown.{name}.cold']['sections'] = len(sections)
+    return results
+
+
+def bench_fill_template(app, counter, meta, args):
+    from rendering import TEMPLATE_PATH
+    from utils import fill_template
+
+    inputs = markdown_inputs(meta['image_files'])
+    cases = {
+        'small': template_values(inputs['small'], inputs['small']),
+        'images': template_values(inputs['small'], inputs['images']),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, app.app_context():
+        word_path, pdf_path = os.path.join(tmp, 'bench.docx'), os.path.join(tmp, 'bench.pdf')
+        for name, values in cases.items():
+            run = lambda values=values: fill_template(values, TEMPLATE_PATH, word_path, pdf_path)  # noqa: E731
+            results[f'fill_template.{name}'] = measure(counter, run, max(3, args.repeat // 2))
+    return results
+
+
+def bench_routes(app, counter, meta, args):
+    from models import db, TempSpec
+    from pagination import encode_cursor, invalidate_counts
+
+    with app.app_context():
+        middle = db.session.query(TempSpec.created_at, TempSpec.id).order_by(
+            TempSpec.created_at.desc(), TempSpec.id.desc()).offset(meta['specs'] // 2).first()
+    deep_cursor = encode_cursor(*middle)
+    typical_id = meta['specs'] // 2 + 1
+    if typical_id % dataset.LONG_HISTORY_EVERY == 0:
+        typical_id += 1
+
+    cases = {
+        'spec_list.first_page': '/list',
+        'spec_list.deep_page': f'/list?after={deep_cursor}',
+        'spec_list.status_active': '/list?status=active',
+        'spec_list.search_fts': '/list?query=Wire+Bonder',
+        'spec_list.search_like': '/list?query=EQ',
+        'spec_history.typical': f'/history/{typical_id}',
+        'spec_history.long': f"/history/{meta['long_history_spec_id']}",
+    }
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+
+    results = {}
+    for name, url in cases.items():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{name}: GET {url} 回應 {response.status_code}")
+        # 每次都清除總筆數快取，量測包含 COUNT 的最差情況
+        results[name] = measure(counter, lambda url=url: client.get(url).close(), args.repeat,
+                                setup=invalidate_counts)
+    return results
+
+
+def bench_spec_codes(app, counter, meta, args):
+    from models import db, SpecCodeSequence
+    from spec_codes import allocate_spec_code, peek_next_spec_code, spec_code_prefix
+
+    # 使用產生資料集時的月份，資料集跨月重複使用時結果不變
+    now = datetime.fromisoformat(meta['generated_at'])
+    prefix = spec_code_prefix(now)
+
+    def drop_counter_row():
+        # 模擬新月份第一次配發 / 升級前的月份：沒有計數列時由既有編號取得起始值
+        SpecCodeSequence.query.filter_by(prefix=prefix).delete()
+        db.session.flush()
+
+    results = {}
+    with app.app_context():
+        results['spec_code.peek'] = measure(counter, lambda: peek_next_spec_code(now), args.repeat)
+        results['spec_code.peek_unseeded'] = measure(counter, lambda: peek_next_spec_code(now), args.repeat,
+                                                     setup=drop_counter_row, teardown=db.session.rollback)
+        results['spec_code.allocate'] = measure(counter, lambda: allocate_spec_code(now), args.repeat,
+                                                teardown=db.session.rollback)
+        results['spec_code.allocate_unseeded'] = measure(counter, lambda: allocate_spec_code(now), args.repeat,
+                                                         setup=drop_counter_row, teardown=db.session.rollback)
+    return results
+
+
+GROUPS = (
+    ('markdown', bench_markdown),
+    ('fill_template', bench_fill_template),
+    ('spec_list', bench_routes),
+    ('spec_history', bench_routes),
+    ('spec_code', bench_spec_codes),
+)
+
+
+# ---------------------------------------------------------------------------
+# 環境與結果比較
+# ---------------------------------------------------------------------------
+
+def configure_environment(data_dir):
+    """在匯入 app 之前設定環境變數 (config.py 於匯入時讀取；.env 不會覆寫已設定的值)"""
+    paths = dataset.dataset_paths(data_dir)
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{paths['db']}",
+        'STORAGE_BACKEND': 'local',
+        'STORAGE_ROOT': paths['storage'],
+        'STORAGE_LEGACY_FALLBACK': 'false',
+        'STORAGE_CACHE_FOLDER': os.path.join(data_dir, 'cache', 'storage'),
+        'PREVIEW_CACHE_FOLDER': os.path.join(data_dir, 'cache', 'previews'),
+        'USER_CACHE_SIGNAL_FILE': os.path.join(data_dir, 'cache', 'user_cache.signal'),
+        'PDF_CONVERTER': STUB_BACKEND,
+        'PDF_CONVERTER_POOL_SIZE': '1',
+        'EXPIRY_SCHEDULER_ENABLED': 'false',
+        'FILE_GC_ENABLED': 'false',
+        'METRICS_ENABLED': 'false',
+        'LOG_LEVEL': 'WARNING',
+    })
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment_info(meta, args):
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'dataset': {key: value for key, value in meta.items() if key != 'image_files'},
+    }
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """與先前的結果比較，回傳 [(名稱, 原因)]；只比較兩邊都有的項目"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        old, new = previous['median_ms'], current['median_ms']
+        if new > old * (1 + threshold) and new - old > min_delta_ms:
+            regressions.append((name, f"median {old:.2f} → {new:.2f} ms (+{(new / old - 1) * 100:.0f}%)"))
+        if current['queries'] > previous['queries']:
+            regressions.append((name, f"查詢數 {previous['queries']} → {current['queries']}"))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--specs', type=int, default=dataset.DEFAULT_SPECS, help='資料集的規範筆數')
+    parser.add_argument('--seed', type=int, default=dataset.DEFAULT_SEED, help='資料集的亂數種子')
+    parser.add_argument('--data-dir', help='資料集位置 (預設在系統暫存資料夾，產生後重複使用)')
+    parser.add_argument('--rebuild', action='store_true', help='重新產生資料集')
+    parser.add_argument('--repeat', type=int, default=10, help='每個項目計時的次數')
+    parser.add_argument('--only', help='只執行指定的群組，以逗號分隔 (markdown,fill_template,spec_list,spec_history,spec_code)')
+    parser.add_argument('--output', help='將結果以 JSON 寫入檔案')
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出結果')
+    parser.add_argument('--baseline', help='與先前 --output 的 JSON 比較')
+    parser.add_argument('--threshold', type=float, default=0.25, help='median 變慢超過此比例視為退步 (預設 0.25)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='差異小於此毫秒數時不視為退步 (避免雜訊)')
+    args = parser.parse_args()
+
+    groups = [name for name, _ in GROUPS]
+    selected = args.only.split(',') if args.only else groups
+    unknown = set(selected) - set(groups)
+    if unknown:
+        parser.error(f"未知的群組: {', '.join(sorted(unknown))}")
+
+    data_dir = args.data_dir or dataset.default_data_dir(args.specs, args.seed)
+    configure_environment(data_dir)
+    app = importlib.import_module('app').app
+    from models import db
+
+    log = (lambda *a, **k: print(*a, file=sys.stderr, **k)) if args.json else print
+    meta = dataset.ensure_dataset(app, data_dir, args.specs, args.seed, rebuild=args.rebuild, log=log)
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+
+    results = {}
+    done = set()
+    for name, func in GROUPS:
+        if name not in selected or func in done:
+            continue
+        log(f"⏱️  {name} ...")
+        group_results = func(app, counter, meta, args)
+        done.add(func)
+        results.update({key: value for key, value in group_results.items() if key.split('.')[0] in selected})
+
+    report = {'environment': environment_info(meta, args), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        report['regressions'] = [{'name': name, 'reason': reason} for name, reason in regressions]
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"資料集 {meta['specs']} 筆規範、{meta['history']} 筆歷史紀錄 (git {report['environment']['git_revision']})")
+        for name, r in results.items():
+            print(f"  {name:34s} median {r['median_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+                  f"查詢 {r['queries']:3d} ({r['db_median_ms']:7.2f} ms)")
+        if args.baseline:
+            if regressions:
+                print(f"❌ 與 {args.baseline} 相比有 {len(regressions)} 項退步：")
+                for name, reason in regressions:
+                    print(f"   - {name}: {reason}")
+            else:
+                print(f"✅ 與 {args.baseline} 相比沒有退步")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
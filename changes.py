@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+資料表變更計數
+
+每個修改 temp_spec 的交易在 commit 前將 table_version 中 temp_spec 的計數加一，
+並把新的計數寫入被修改規範的 change_version (刪除的規範記錄在 deleted_spec)。
+計數列在交易結束前保持鎖定，計數的順序與 commit 的順序相同：讀到計數 N 時，change_version <= N 的變更都已經 commit。
+
+- ORM 的新增/修改/刪除在 flush 時自動收集；以 Core UPDATE 修改規範的地方 (批次作業、到期處理)
+  需呼叫 mark_specs_changed()。
+- current_version() 供 API 計算 ETag，可在程序內快取數秒，輪詢的請求多數不必查詢資料庫。
+- deleted_spec 由檔案清除 (file_gc.sweep_files) 依保留期間刪除，被刪除紀錄的最大 change_version 記為同步下限
+  (table_version 的 deleted_spec_pruned 列)；since 早於下限的用戶端可能漏掉刪除，API 要求其以 since=0 重新同步。
+"""
+import time
+from datetime import datetime
+
+from flask import g, has_app_context
+from sqlalchemy import event, func, insert, text
+from sqlalchemy.orm import Session
+
+from models import db, TempSpec, TableVersion, DeletedSpec
+
+TEMP_SPEC = 'temp_spec'
+# 已刪除的 deleted_spec 紀錄中最大的 change_version
+DELETED_SPEC_PRUNED = 'deleted_spec_pruned'
+# 每個 UPDATE ... WHERE id IN (...) 的筆數上限
+UPDATE_BATCH_SIZE = 500
+
+# table_name -> (version, 有效期限 (monotonic))
+_version_cache = {}
+
+
+def mark_specs_changed(spec_ids):
+    """暫存被修改的規範 id，於 db.session.commit() 前寫入新的變更計數"""
+    g.setdefault('_changed_spec_ids', set()).update(spec_ids)
+
+
+def current_version(table_name=TEMP_SPEC, max_age=0):
+    """資料表目前的變更計數；max_age 秒內讀取過時直接使用程序內的值"""
+    now = time.monotonic()
+    if max_age > 0:
+        cached = _version_cache.get(table_name)
+        if cached and cached[1] > now:
+            return cached[0]
+    version = db.session.query(TableVersion.version).filter_by(table_name=table_name).scalar() or 0
+    if max_age > 0:
+        _version_cache[table_name] = (version, now + max_age)
+    return version
+
+
+def sync_horizon():
+    """增量同步的下限：since 早於此值時可能漏掉已刪除的規範"""
+    return current_version(DELETED_SPEC_PRUNED)
+
+
+def prune_deleted_specs(before, dry_run=False):
+    """刪除 deleted_at 早於 before 的 deleted_spec 紀錄並提高同步下限，回傳 (dry-run 時為可刪除的) 筆數"""
+    count, horizon = db.session.query(func.count(), func.max(DeletedSpec.change_version)).filter(
+        DeletedSpec.deleted_at < before).one()
+    if dry_run or not count:
+        return count
+    db.session.execute(DeletedSpec.__table__.delete().where(DeletedSpec.change_version <= horizon))
+    row = db.session.query(TableVersion).filter_by(table_name=DELETED_SPEC_PRUNED).with_for_update().first()
+    if row is None:
+        db.session.add(TableVersion(table_name=DELETED_SPEC_PRUNED, version=horizon))
+    elif row.version < horizon:
+        row.version = horizon
+    db.session.commit()
+    return count
+
+
+def _increment(session, table_name):
+    """將計數加一並回傳新值 (計數列鎖定至交易結束)"""
+    dialect = session.get_bind().dialect.name
+    params = {'table_name': table_name}
+    if dialect == 'sqlite':
+        return session.execute(text(
+            "INSERT INTO table_version (table_name, version) VALUES (:table_name, 1) "
+            "ON CONFLICT (table_name) DO UPDATE SET version = version + 1 "
+            "RETURNING version"
+        ), params).scalar()
+    if dialect == 'mysql':
+        session.execute(text(
+            "INSERT INTO table_version (table_name, version) VALUES (:table_name, LAST_INSERT_ID(1)) "
+            "ON DUPLICATE KEY UPDATE version = LAST_INSERT_ID(version + 1)"
+        ), params)
+        return session.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+
+    row = session.query(TableVersion).filter_by(table_name=table_name).with_for_update().first()
+    if row is None:
+        row = TableVersion(table_name=table_name, version=0)
+        session.add(row)
+    row.version += 1
+    session.flush()
+    return row.version
+
+
+def _write_versions(session, changed, deleted):
+    version = _increment(session, TEMP_SPEC)
+    table = TempSpec.__table__
+    ids = sorted(changed)
+    for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+        session.execute(table.update().where(
+            table.c.id.in_(ids[start:start + UPDATE_BATCH_SIZE])
+        ).values(change_version=version))
+    if deleted:
+        # SQLite 可能重複使用已刪除的 id，保留最後一次刪除
+        session.execute(DeletedSpec.__table__.delete().where(DeletedSpec.spec_id.in_(list(deleted))))
+        now = datetime.utcnow()
+        session.execute(insert(DeletedSpec), [
+            {'spec_id': spec_id, 'spec_code': spec_code, 'change_version': version, 'deleted_at': now}
+            for spec_id, spec_code in sorted(deleted.items())
+        ])
+    return version
+
+
+def _tracked(session):
+    return has_app_context() and session is db.session()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    # after_flush 時 new / dirty / deleted 仍是 flush 前的內容，新規範已有 id
+    if not _tracked(session):
+        return
+    changed = [obj.id for obj in session.new if isinstance(obj, TempSpec)]
+    changed += [obj.id for obj in session.dirty
+                if isinstance(obj, TempSpec) and session.is_modified(obj, include_collections=False)]
+    if changed:
+        mark_specs_changed(changed)
+    for obj in session.deleted:
+        if isinstance(obj, TempSpec):
+            g.setdefault('_deleted_specs', {})[obj.id] = obj.spec_code
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_before_commit(session):
+    if not _tracked(session):
+        return
+    # commit 時才會 flush 的變更先收集
+    session.flush()
+    changed = g.pop('_changed_spec_ids', None) or set()
+    deleted = g.pop('_deleted_specs', None) or {}
+    changed.difference_update(deleted)
+    if changed or deleted:
+        _write_versions(session, changed, deleted)
+        g._table_version_bumped = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _expire_cache_after_commit(session):
+    # 本程序的修改立即反映在 ETag，不等快取過期
+    if _tracked(session) and g.pop('_table_version_bumped', False):
+        _version_cache.pop(TEMP_SPEC, None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    if _tracked(session):
+        for key in ('_changed_spec_ids', '_deleted_specs', '_table_version_bumped'):
+            g.pop(key, None)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+檢查遷移步驟能將最初版本 (以第一版 init_db.py 建立、沒有 schema_version) 的資料庫逐步升級到最新版本：
+升級後的資料表、欄位與索引與 models.py 一致，既有資料保留，且每個步驟重複執行不會失敗。
+
+    python check_migrations.py                          # 於暫存的 SQLite 資料庫檢查
+    python check_migrations.py --url <空白資料庫的 URL>   # 指定資料庫 (例如 MySQL)，其中的資料表會被刪除
+
+新增遷移步驟後執行，確認步驟沒有依賴之後才加入的欄位。
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import MetaData, Table, Column, Integer, String, Text, Date, DateTime, Enum, ForeignKey, inspect, text
+
+from config import Config
+from models import db
+
+# 第一版 models.py 的資料表結構 (不可隨 models.py 修改)
+baseline = MetaData()
+Table('user', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('username', String(50), unique=True, nullable=False),
+      Column('password_hash', String(255), nullable=False),
+      Column('role', Enum('viewer', 'editor', 'admin'), nullable=False),
+      Column('last_login', DateTime))
+Table('temp_spec', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('spec_code', String(20), nullable=False),
+      Column('applicant', String(50)),
+      Column('title', String(100)),
+      Column('content', Text),
+      Column('start_date', Date),
+      Column('end_date', Date),
+      Column('status', Enum('pending_approval', 'active', 'expired', 'terminated'), nullable=False),
+      Column('created_at', DateTime),
+      Column('extension_count', Integer),
+      Column('termination_reason', Text))
+Table('upload', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('temp_spec_id', Integer, ForeignKey('temp_spec.id', ondelete='CASCADE'), nullable=False),
+      Column('filename', String(200)),
+      Column('upload_time', DateTime))
+Table('SpecHistory', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('spec_id', Integer, ForeignKey('temp_spec.id', ondelete='CASCADE'), nullable=False),
+      Column('user_id', Integer, ForeignKey('user.id', ondelete='SET NULL'), nullable=True),
+      Column('action', String(50), nullable=False),
+      Column('details', Text),
+      Column('timestamp', DateTime))
+
+
+def create_baseline():
+    """清空資料庫，建立第一版的資料表並寫入少量資料"""
+    connection = db.session.connection()
+    db.metadata.drop_all(connection)
+    baseline.drop_all(connection)
+    for table in ('schema_version', 'temp_spec_fts'):
+        db.session.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    baseline.create_all(connection)
+
+    today = date.today()
+    tables = baseline.tables
+    db.session.execute(tables['user'].insert(), [{'id': 1, 'username': 'admin', 'password_hash': 'x', 'role': 'admin'}])
+    db.session.execute(tables['temp_spec'].insert(), [
+        {'id': 1, 'spec_code': 'PE11401001', 'applicant': '王小明', 'title': '製程參數調整',
+         'content': '變更前：\n\n![](/static/uploads/images/a.png)\n', 'start_date': today - timedelta(days=30),
+         'end_date': today - timedelta(days=1), 'status': 'active', 'created_at': datetime.now() - timedelta(days=30),
+         'extension_count': 1},
+        {'id': 2, 'spec_code': 'PE11401002', 'applicant': '李小華', 'title': '治具變更', 'content': '',
+         'start_date': today, 'end_date': today + timedelta(days=30), 'status': 'pending_approval',
+         'created_at': datetime.now(), 'extension_count': 0},
+    ])
+    db.session.execute(tables['upload'].insert(), [
+        {'id': 1, 'temp_spec_id': 1, 'filename': 'PE11401001_signed.pdf', 'upload_time': datetime.now()}])
+    db.session.execute(tables['SpecHistory'].insert(), [
+        {'id': 1, 'spec_id': 1, 'user_id': 1, 'action': '建立', 'details': '', 'timestamp': datetime.now()}])
+    db.session.commit()
+
+
+def compare_schema():
+    """回傳升級後與 models.py 不一致之處"""
+    inspector = inspect(db.session.connection())
+    existing_tables = set(inspector.get_table_names())
+    problems = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            problems.append(f"缺少資料表 {table.name}")
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for name in sorted(set(table.columns.keys()) - columns):
+            problems.append(f"缺少欄位 {table.name}.{name}")
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in indexes:
+                problems.append(f"缺少索引 {index.name}")
+    return problems
+
+
+def main():
+    from migrations import current_version, pending_migrations, upgrade, LATEST_VERSION, MIGRATIONS
+    from models import TempSpec, SpecImage
+    from dashboard import reconcile_stats
+
+    print("🔄 建立第一版的資料庫結構...")
+    create_baseline()
+    print(f"🔄 升級至版本 {LATEST_VERSION}...")
+    try:
+        upgrade()
+    except Exception as e:
+        print(f"❌ 升級在版本 {current_version() + 1} 失敗: {e}")
+        return 1
+
+    problems = compare_schema()
+    # 遷移步驟應可重複執行 (例如以舊版 init_db.py 建立、已有部分結構的資料庫)
+    for version, _, step in MIGRATIONS:
+        try:
+            step()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            problems.append(f"版本 {version} 重複執行失敗: {e}")
+    if current_version() != LATEST_VERSION:
+        problems.append(f"升級後版本為 {current_version()}")
+    if pending_migrations():
+        problems.append("升級後仍有待執行的遷移")
+    if db.session.query(TempSpec).count() != 2:
+        problems.append("既有規範遺失")
+    if db.session.query(TempSpec).filter(TempSpec.change_version.is_(None)).count():
+        problems.append("既有規範沒有 change_version")
+    if db.session.query(SpecImage).filter_by(spec_id=1).count() != 1:
+        problems.append("既有規範引用的圖片沒有重建")
+    if reconcile_stats():
+        problems.append("儀表板統計的初始值與資料不一致")
+
+    for problem in problems:
+        print(f"   ❌ {problem}")
+    if problems:
+        print(f"⚠️  遷移檢查失敗 ({len(problems)} 項)")
+        return 1
+    print("✅ 第一版的資料庫可以升級到最新版本，結構與 models.py 一致。")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='檢查由第一版資料庫結構逐步遷移到最新版本')
+    parser.add_argument('--url', help='空白的測試資料庫 URL (其中的資料表會被刪除)；預設使用暫存的 SQLite 檔案')
+    args = parser.parse_args()
+
+    workdir = None
+    if args.url:
+        url = args.url
+    else:
+        workdir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(workdir.name, 'check_migrations.db')}"
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    db.init_app(app)
+
+    with app.app_context():
+        code = main()
+        db.session.remove()
+        db.engine.dispose()
+    if workdir is not None:
+        workdir.cleanup()
+    sys.exit(code)
@@ -8,6 +8,112 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'a_default_secret_key_for_development')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # 舊版的平坦檔案資料夾，僅供讀取尚未搬移的檔案與 migrate_storage.py 使用
     UPLOAD_FOLDER = 'uploads'
     GENERATED_FOLDER = 'generated'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+
+    # PDF 轉檔 worker 池
+    # PDF_CONVERTER: auto / unoserver / libreoffice / docx2pdf
+    PDF_CONVERTER = os.getenv('PDF_CONVERTER', 'auto')
+    PDF_CONVERTER_POOL_SIZE = int(os.getenv('PDF_CONVERTER_POOL_SIZE', 2))
+    PDF_CONVERTER_QUEUE_SIZE = int(os.getenv('PDF_CONVERTER_QUEUE_SIZE', 16))
+    PDF_CONVERTER_TIMEOUT = int(os.getenv('PDF_CONVERTER_TIMEOUT', 60))
+    # 請求等待轉檔的上限為 PDF_CONVERTER_TIMEOUT + 此秒數 (排隊時間)
+    PDF_CONVERTER_QUEUE_TIMEOUT = int(os.getenv('PDF_CONVERTER_QUEUE_TIMEOUT', 120))
+    PDF_CONVERTER_MAX_JOBS = int(os.getenv('PDF_CONVERTER_MAX_JOBS', 200))
+    PDF_CONVERTER_MAX_RSS_MB = int(os.getenv('PDF_CONVERTER_MAX_RSS_MB', 1024))
+    SOFFICE_PATH = os.getenv('SOFFICE_PATH', 'soffice')
+    UNOSERVER_PATH = os.getenv('UNOSERVER_PATH', 'unoserver')
+    UNOCONVERT_PATH = os.getenv('UNOCONVERT_PATH', 'unoconvert')
+
+    # 預覽 PDF 快取 (記憶體 LRU + 磁碟層)
+    PREVIEW_CACHE_MAX_ENTRIES = int(os.getenv('PREVIEW_CACHE_MAX_ENTRIES', 64))
+    PREVIEW_CACHE_MAX_BYTES = int(os.getenv('PREVIEW_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    PREVIEW_CACHE_TTL = int(os.getenv('PREVIEW_CACHE_TTL', 24 * 3600))
+    PREVIEW_CACHE_FOLDER = os.getenv('PREVIEW_CACHE_FOLDER', os.path.join('cache', 'previews'))
+    PREVIEW_CACHE_DISK_MAX_BYTES = int(os.getenv('PREVIEW_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024))
+
+    # 非同步預覽工作
+    PREVIEW_JOB_WORKERS = int(os.getenv('PREVIEW_JOB_WORKERS', 2))
+    PREVIEW_JOB_MAX_PENDING = int(os.getenv('PREVIEW_JOB_MAX_PENDING', 64))
+    PREVIEW_JOB_RESULT_TTL = int(os.getenv('PREVIEW_JOB_RESULT_TTL', 300))
+
+    # 圖片上傳處理：最大寬度預設為模板的 130 mm @ 96 dpi
+    IMAGE_MAX_WIDTH_PX = int(os.getenv('IMAGE_MAX_WIDTH_PX', round(130 / 25.4 * 96)))
+    IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', 85))
+    IMAGE_THUMBNAIL_SIZE = int(os.getenv('IMAGE_THUMBNAIL_SIZE', 240))
+    IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', 2))
+
+    # 登入使用者快取；訊號檔用於通知其他 worker 使用者已被修改或刪除 (設為空字串停用)
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 300))
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 1024))
+    USER_CACHE_SIGNAL_FILE = os.getenv('USER_CACHE_SIGNAL_FILE', os.path.join('cache', 'user_cache.signal'))
+
+    # 登入：密碼雜湊方法 (參數變更後使用者下次登入時自動重新雜湊)、驗證執行緒數與等待上限、last_login 寫入間隔
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_VERIFY_WORKERS = int(os.getenv('PASSWORD_VERIFY_WORKERS', 2))
+    PASSWORD_VERIFY_MAX_PENDING = int(os.getenv('PASSWORD_VERIFY_MAX_PENDING', 64))
+    PASSWORD_VERIFY_TIMEOUT = int(os.getenv('PASSWORD_VERIFY_TIMEOUT', 15))
+    LAST_LOGIN_FLUSH_INTERVAL = int(os.getenv('LAST_LOGIN_FLUSH_INTERVAL', 5))
+
+    # 規範到期處理：啟用時每個 worker 每 EXPIRY_INTERVAL 秒執行一次；也可改由 cron 執行 expire_specs.py
+    EXPIRY_SCHEDULER_ENABLED = os.getenv('EXPIRY_SCHEDULER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    EXPIRY_INTERVAL = int(os.getenv('EXPIRY_INTERVAL', 3600))
+
+    # 暫時規範編號流水號的最少位數 (超過時自動加寬)
+    SPEC_CODE_SEQUENCE_WIDTH = int(os.getenv('SPEC_CODE_SEQUENCE_WIDTH', 2))
+
+    # 檔案儲存：local (STORAGE_ROOT 資料夾) 或 s3 (S3 相容儲存，需安裝 boto3)
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+    STORAGE_ROOT = os.getenv('STORAGE_ROOT', 'storage')
+    # 是否讀取尚未以 migrate_storage.py 搬移的舊檔案
+    STORAGE_LEGACY_FALLBACK = os.getenv('STORAGE_LEGACY_FALLBACK', 'true').lower() in ('1', 'true', 'yes')
+    STORAGE_S3_BUCKET = os.getenv('STORAGE_S3_BUCKET', '')
+    STORAGE_S3_PREFIX = os.getenv('STORAGE_S3_PREFIX', '')
+    STORAGE_S3_ENDPOINT_URL = os.getenv('STORAGE_S3_ENDPOINT_URL', '')
+    STORAGE_S3_REGION = os.getenv('STORAGE_S3_REGION', '')
+    STORAGE_S3_URL_TTL = int(os.getenv('STORAGE_S3_URL_TTL', 300))
+    # S3 儲存時，產生文件所需的圖片下載到本機的快取位置
+    STORAGE_CACHE_FOLDER = os.getenv('STORAGE_CACHE_FOLDER', os.path.join('cache', 'storage'))
+
+    # 檔案清除：啟用時每個 worker 每 FILE_GC_INTERVAL 秒 (或刪除規範後) 清除一次；也可改由 cron 執行 sweep_files.py
+    FILE_GC_ENABLED = os.getenv('FILE_GC_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    FILE_GC_INTERVAL = int(os.getenv('FILE_GC_INTERVAL', 3600))
+    FILE_GC_BATCH_SIZE = int(os.getenv('FILE_GC_BATCH_SIZE', 200))
+    # 上傳後未被任何規範引用的圖片保留的時數 (編輯中尚未送出的規範)
+    FILE_GC_IMAGE_GRACE_HOURS = int(os.getenv('FILE_GC_IMAGE_GRACE_HOURS', 72))
+    FILE_GC_MAX_ATTEMPTS = int(os.getenv('FILE_GC_MAX_ATTEMPTS', 5))
+
+    # 儀表板：即將到期的天數、每月建立數顯示的月數；統計彙總表的定期校正 (也可改由 cron 執行 reconcile_dashboard.py)
+    DASHBOARD_EXPIRING_DAYS = int(os.getenv('DASHBOARD_EXPIRING_DAYS', 7))
+    DASHBOARD_TREND_MONTHS = int(os.getenv('DASHBOARD_TREND_MONTHS', 12))
+    DASHBOARD_RECONCILE_ENABLED = os.getenv('DASHBOARD_RECONCILE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    DASHBOARD_RECONCILE_INTERVAL = int(os.getenv('DASHBOARD_RECONCILE_INTERVAL', 3600))
+
+    # 唯讀 JSON API (/api/v1)：終端機使用的 Bearer token (以逗號分隔)、每頁筆數，
+    # 以及 ETag 使用的變更計數在程序內快取的秒數 (0 表示每個請求都查詢)
+    API_TOKENS = [token.strip() for token in os.getenv('API_TOKENS', '').split(',') if token.strip()]
+    API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 100))
+    API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 1000))
+    API_VERSION_CACHE_TTL = float(os.getenv('API_VERSION_CACHE_TTL', 1.0))
+    # 已刪除規範保留給增量同步的天數 (由檔案清除刪除)；上次同步早於此期間的終端機需以 since=0 重新同步
+    API_DELETED_SPEC_RETENTION_DAYS = int(os.getenv('API_DELETED_SPEC_RETENTION_DAYS', 90))
+
+    # 規範列表全文檢索最多取回的結果數
+    SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 1000))
+    # 規範列表總筆數的快取秒數 (翻頁時不重新 COUNT)
+    LIST_COUNT_CACHE_TTL = int(os.getenv('LIST_COUNT_CACHE_TTL', 60))
+    # 批次展延 / 終止一次最多處理的規範數
+    BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', 500))
+
+    # 記錄等級 (DEBUG 時輸出文件產生的逐段除錯訊息)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    # 效能指標：啟用後於 /metrics 提供 Prometheus 格式的指標；設定 METRICS_TOKEN 時需以 Bearer token 存取
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+    METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+
+    # 檔案下載：'' 由 Flask 直接傳送；'x-accel' 交給 nginx；'x-sendfile' 交給 Apache/lighttpd
+    FILE_SERVE_MODE = os.getenv('FILE_SERVE_MODE', '')
+    X_ACCEL_REDIRECT_PREFIX = os.getenv('X_ACCEL_REDIRECT_PREFIX', '/protected')
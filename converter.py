@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+"""
+Word → PDF 轉檔服務
+
+以常駐的轉檔 worker 池取代每次請求都重新啟動 Word/COM 的 docx2pdf 呼叫。
+每個 worker 執行緒持有一個轉檔後端 (例如一個暖機中的 headless LibreOffice)，
+工作透過有上限的佇列派送，並支援單筆逾時與異常/記憶體洩漏時自動重啟。
+"""
+import logging
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from metrics import conversion_wait_seconds, conversion_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class ConversionError(Exception):
+    """PDF 轉檔失敗"""
+
+
+class ConversionTimeout(ConversionError):
+    """單筆轉檔超過允許時間"""
+
+
+class ConversionQueueFull(ConversionError):
+    """轉檔佇列已滿，呼叫端應稍後重試"""
+
+
+# ---------------------------------------------------------------------------
+# 轉檔後端
+# ---------------------------------------------------------------------------
+
+BACKENDS = {}
+
+
+def register_backend(cls):
+    """註冊轉檔後端，讓設定值 PDF_CONVERTER 可以用名稱選用。"""
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+class ConverterBackend:
+    """
+    轉檔後端基底類別。
+    每個 worker 執行緒擁有一個實例，start/convert/stop 皆在該執行緒中呼叫。
+    """
+    name = None
+
+    def __init__(self, config, worker_id):
+        self.config = config
+        self.worker_id = worker_id
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def is_healthy(self):
+        return True
+
+    def memory_usage_mb(self):
+        """回傳後端程序的常駐記憶體 (MB)，無法取得時回傳 None。"""
+        return None
+
+    def convert(self, docx_path, pdf_path, timeout):
+        raise NotImplementedError
+
+
+def _rss_mb(pid):
+    """讀取 Linux /proc 的 VmRSS，其他平台回傳 None。"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _kill_process(proc):
+    """結束子程序 (含其子程序群組)。"""
+    if proc is None or proc.poll() is not None:
+        return
+    try:
+        if os.name == 'posix':
+            os.killpg(proc.pid, 9)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        pass
+
+
+def _run(cmd, timeout):
+    """執行外部指令，逾時則結束整個程序群組。"""
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=(os.name == 'posix'),
+    )
+    try:
+        _, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_process(proc)
+        raise ConversionTimeout(f"轉檔超過 {timeout} 秒: {' '.join(cmd[:2])}")
+    if proc.returncode != 0:
+        raise ConversionError(stderr.decode(errors='replace').strip() or f"exit code {proc.returncode}")
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _profile_dir(worker_id):
+    # 每個 worker 使用獨立的 LibreOffice profile，避免多個實例互相鎖定，也讓 profile 保持暖機
+    path = os.path.join(tempfile.gettempdir(), 'temp_spec_lo', f"{os.getpid()}-{worker_id}")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _path_to_uri(path):
+    path = os.path.abspath(path).replace('\\', '/')
+    if not path.startswith('/'):
+        path = '/' + path
+    return 'file://' + path
+
+
+@register_backend
+class LibreOfficeBackend(ConverterBackend):
+    """以 `soffice --headless --convert-to pdf` 轉檔，每個 worker 保留自己的 profile。"""
+    name = 'libreoffice'
+
+    def start(self):
+        self.profile_uri = _path_to_uri(_profile_dir(self.worker_id))
+
+    def convert(self, docx_path, pdf_path, timeout):
+        outdir = tempfile.mkdtemp(prefix='lo_out_')
+        try:
+            _run([
+                self.config['SOFFICE_PATH'],
+                f"-env:UserInstallation={self.profile_uri}",
+                '--headless', '--norestore', '--nologo', '--nodefault',
+                '--convert-to', 'pdf', '--outdir', outdir, docx_path,
+            ], timeout)
+            produced = os.path.join(outdir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+            if not os.path.exists(produced):
+                raise ConversionError(f"LibreOffice 未產生 PDF: {docx_path}")
+            shutil.move(produced, pdf_path)
+        finally:
+            shutil.rmtree(outdir, ignore_errors=True)
+
+
+@register_backend
+class UnoserverBackend(ConverterBackend):
+    """
+    常駐的 headless LibreOffice (unoserver)。
+    每個 worker 啟動一個 unoserver 程序並持續重用，轉檔時以 unoconvert 送出工作。
+    """
+    name = 'unoserver'
+
+    def __init__(self, config, worker_id):
+        super().__init__(config, worker_id)
+        self.process = None
+
+    def start(self):
+        self.port = _free_port()
+        uno_port = _free_port()
+        cmd = [
+            self.config['UNOSERVER_PATH'],
+            '--interface', '127.0.0.1',
+            '--port', str(self.port),
+            '--uno-port', str(uno_port),
+            '--user-installation', _path_to_uri(_profile_dir(self.worker_id)),
+        ]
+        if self.config['SOFFICE_PATH']:
+            cmd += ['--executable', shutil.which(self.config['SOFFICE_PATH']) or self.config['SOFFICE_PATH']]
+        self.process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=(os.name == 'posix'),
+        )
+        self._wait_until_ready(self.config['PDF_CONVERTER_TIMEOUT'])
+
+    def _wait_until_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise ConversionError(f"unoserver 啟動失敗 (exit code {self.process.returncode})")
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise ConversionTimeout("unoserver 啟動逾時")
+
+    def stop(self):
+        _kill_process(self.process)
+        self.process = None
+
+    def is_healthy(self):
+        return self.process is not None and self.process.poll() is None
+
+    def memory_usage_mb(self):
+        return _rss_mb(self.process.pid) if self.process else None
+
+    def convert(self, docx_path, pdf_path, timeout):
+        _run([
+            self.config['UNOCONVERT_PATH'],
+            '--host', '127.0.0.1',
+            '--port', str(self.port),
+            '--convert-to', 'pdf',
+            docx_path, pdf_path,
+        ], timeout)
+
+
+@register_backend
+class Docx2PdfBackend(ConverterBackend):
+    """Windows + Microsoft Word (COM)。COM 只在 worker 執行緒啟動時初始化一次。"""
+    name = 'docx2pdf'
+
+    def start(self):
+        import pythoncom
+        pythoncom.CoInitialize()
+
+    def stop(self):
+        import pythoncom
+        pythoncom.CoUninitialize()
+
+    def convert(self, docx_path, pdf_path, timeout):
+        # Word COM 無法中斷；超過時間時 ConversionPool.convert 不再等待並以新的 worker 取代此 worker
+        from docx2pdf import convert
+        convert(docx_path, pdf_path)
+
+
+def _auto_backend_name(config):
+    if sys.platform == 'win32':
+        return 'docx2pdf'
+    if shutil.which(config['UNOSERVER_PATH']) and shutil.which(config['UNOCONVERT_PATH']):
+        return 'unoserver'
+    return 'libreoffice'
+
+
+# ---------------------------------------------------------------------------
+# Worker 池
+# ---------------------------------------------------------------------------
+
+class _Job:
+    __slots__ = ('docx_path', 'pdf_path', 'timeout', 'future', 'queued_at', 'worker')
+
+    def __init__(self, docx_path, pdf_path, timeout):
+        self.docx_path = docx_path
+        self.pdf_path = pdf_path
+        self.timeout = timeout
+        self.future = Future()
+        self.queued_at = time.monotonic()
+        # 開始轉檔的 worker
+        self.worker = None
+
+
+class _Worker(threading.Thread):
+
+    def __init__(self, pool, worker_id):
+        super().__init__(name=f"pdf-converter-{worker_id}", daemon=True)
+        self.pool = pool
+        self.worker_id = worker_id
+        self.backend = None
+        self.jobs_done = 0
+        # 轉檔卡住而被取代或 worker 池關閉後，目前的轉檔結束 (如果會結束) 即停止
+        self.retired = False
+
+    def _recycle(self, reason):
+        if self.backend is not None:
+            logger.info("回收轉檔 worker %s: %s", self.worker_id, reason)
+            try:
+                self.backend.stop()
+            except Exception as e:
+                logger.warning("停止轉檔後端失敗: %s", e)
+        self.backend = None
+        self.jobs_done = 0
+
+    def _ensure_backend(self):
+        if self.backend is not None and self.backend.is_healthy():
+            return
+        if self.backend is not None:
+            self._recycle('後端程序已結束')
+        backend = self.pool.backend_class(self.pool.config, self.worker_id)
+        backend.start()
+        self.backend = backend
+
+    def run(self):
+        while not self.retired:
+            job = self.pool._queue.get()
+            if job is None:
+                break
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            job.worker = self
+            started = time.monotonic()
+            conversion_wait_seconds.observe(started - job.queued_at)
+            try:
+                self._ensure_backend()
+                self.backend.convert(job.docx_path, job.pdf_path, job.timeout)
+            except Exception as e:
+                conversion_seconds.observe(time.monotonic() - started, self.pool.backend_class.name, 'error')
+                job.future.set_exception(e)
+                self._recycle(f"轉檔失敗 ({e})")
+                continue
+            conversion_seconds.observe(time.monotonic() - started, self.pool.backend_class.name, 'ok')
+
+            job.future.set_result(job.pdf_path)
+            self.jobs_done += 1
+            max_jobs = self.pool.config['PDF_CONVERTER_MAX_JOBS']
+            max_rss = self.pool.config['PDF_CONVERTER_MAX_RSS_MB']
+            rss = self.backend.memory_usage_mb()
+            if max_jobs and self.jobs_done >= max_jobs:
+                self._recycle(f"已處理 {self.jobs_done} 筆")
+            elif max_rss and rss and rss > max_rss:
+                self._recycle(f"記憶體 {rss:.0f} MB 超過上限")
+        self._recycle('worker 已停止')
+
+
+# 關閉 worker 池時等待 worker 停止的秒數上限 (合計)
+SHUTDOWN_TIMEOUT = 10
+
+
+class ConversionPool:
+    """
+    常駐的 PDF 轉檔 worker 池。
+    用法與 Flask 擴充套件相同：建立模組層級實例，於 app.py 呼叫 init_app(app)。
+    """
+
+    DEFAULTS = {
+        'PDF_CONVERTER': 'auto',
+        'PDF_CONVERTER_POOL_SIZE': 2,
+        'PDF_CONVERTER_QUEUE_SIZE': 16,
+        'PDF_CONVERTER_TIMEOUT': 60,
+        # 除了轉檔本身的 timeout 之外，等待排隊的最長秒數
+        'PDF_CONVERTER_QUEUE_TIMEOUT': 120,
+        'PDF_CONVERTER_MAX_JOBS': 200,
+        'PDF_CONVERTER_MAX_RSS_MB': 1024,
+        'SOFFICE_PATH': 'soffice',
+        'UNOSERVER_PATH': 'unoserver',
+        'UNOCONVERT_PATH': 'unoconvert',
+    }
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._workers = []
+        self._next_worker_id = 0
+        self._pid = None
+        self.config = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.configure(app.config)
+        app.extensions['conversion_pool'] = self
+
+    def configure(self, mapping):
+        """以設定檔 (dict-like) 設定 worker 池，未提供的項目使用預設值。"""
+        config, backend_class = self._resolve_config(mapping)
+        with self._lock:
+            self._configure_locked(config, backend_class)
+
+    def _resolve_config(self, mapping):
+        config = {key: mapping.get(key, default) for key, default in self.DEFAULTS.items()}
+        name = config['PDF_CONVERTER']
+        if name == 'auto':
+            name = _auto_backend_name(config)
+        if name not in BACKENDS:
+            raise ValueError(f"未知的 PDF 轉檔後端: {name}")
+        return config, BACKENDS[name]
+
+    def _configure_locked(self, config, backend_class):
+        self._shutdown_locked()
+        self.config = config
+        self.backend_class = backend_class
+
+    def _ensure_started(self):
+        # fork 之後 (例如 gunicorn --preload) 執行緒不會被繼承，需在新程序中重新啟動
+        if self._pid == os.getpid() and self._workers:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._workers:
+                return
+            if self.config is None:
+                # 未呼叫 init_app 時 (例如命令列工具) 使用 config.py 的設定；已持有 _lock，不可呼叫 configure()
+                from config import Config
+                self._configure_locked(*self._resolve_config(vars(Config)))
+            self._queue = queue.Queue(maxsize=self.config['PDF_CONVERTER_QUEUE_SIZE'])
+            self._workers = [self._new_worker() for _ in range(self.config['PDF_CONVERTER_POOL_SIZE'])]
+            for worker in self._workers:
+                worker.start()
+            self._pid = os.getpid()
+            logger.info("PDF 轉檔 worker 池已啟動: %s x %d", self.backend_class.name, len(self._workers))
+
+    def _new_worker(self):
+        # worker_id 不重複使用，被取代的 worker 仍在執行時不會與新 worker 共用 profile / port
+        worker = _Worker(self, self._next_worker_id)
+        self._next_worker_id += 1
+        return worker
+
+    def _replace_worker(self, worker, reason):
+        """以新的 worker 取代卡住的 worker (執行中的轉檔無法中斷，舊 worker 在轉檔結束後自行停止)"""
+        with self._lock:
+            if worker not in self._workers or self._pid != os.getpid():
+                return
+            worker.retired = True
+            replacement = self._new_worker()
+            self._workers[self._workers.index(worker)] = replacement
+            replacement.start()
+        logger.warning("轉檔 worker %s 卡住 (%s)，已由 worker %s 取代", worker.worker_id, reason,
+                       replacement.worker_id)
+
+    def _enqueue(self, docx_path, pdf_path, timeout):
+        self._ensure_started()
+        job = _Job(docx_path, pdf_path, timeout or self.config['PDF_CONVERTER_TIMEOUT'])
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise ConversionQueueFull("PDF 轉檔佇列已滿，請稍後再試。")
+        return job
+
+    def submit(self, docx_path, pdf_path, timeout=None):
+        """送出轉檔工作並回傳 Future；佇列已滿時拋出 ConversionQueueFull。"""
+        return self._enqueue(docx_path, pdf_path, timeout).future
+
+    def convert(self, docx_path, pdf_path, timeout=None):
+        """
+        送出轉檔工作並等待完成，最多等待 timeout + PDF_CONVERTER_QUEUE_TIMEOUT 秒。
+        逾時拋出 ConversionTimeout：仍在排隊的工作會被取消；已開始的轉檔 (例如無法中斷的 Word COM)
+        所在的 worker 由新的 worker 取代，避免池中的 worker 逐漸被卡住的轉檔佔滿。
+        """
+        job = self._enqueue(docx_path, pdf_path, timeout)
+        wait = job.timeout + self.config['PDF_CONVERTER_QUEUE_TIMEOUT']
+        try:
+            return job.future.result(timeout=wait)
+        except FutureTimeout:
+            pass
+        if job.future.cancel():
+            raise ConversionTimeout(f"等待轉檔超過 {wait} 秒 (佇列壅塞)")
+        if job.future.done():
+            return job.future.result()
+        if job.worker is not None:
+            self._replace_worker(job.worker, f"轉檔超過 {wait} 秒")
+        raise ConversionTimeout(f"轉檔超過 {wait} 秒")
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _shutdown_locked(self):
+        """
+        停止所有 worker (呼叫者持有 _lock，不可無限期等待)：仍在排隊的工作被取消，
+        卡在轉檔中的 worker 不等待，轉檔結束 (如果會結束) 後自行停止。
+        """
+        workers, self._workers = self._workers, []
+        if self._pid != os.getpid() or not workers:
+            return
+        for worker in workers:
+            worker.retired = True
+        # 清空佇列，讓閒置的 worker 能收到停止訊號
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job.future.cancel()
+        for _ in workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                logger.warning("PDF 轉檔佇列 (PDF_CONVERTER_QUEUE_SIZE) 小於 worker 數，部分閒置的 worker 無法停止")
+                break
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for worker in workers:
+            worker.join(timeout=max(0, deadline - time.monotonic()))
+        stuck = [worker.worker_id for worker in workers if worker.is_alive()]
+        if stuck:
+            logger.warning("轉檔 worker %s 在 %d 秒內未停止，不再等待", stuck, SHUTDOWN_TIMEOUT)
+
+    def shutdown(self):
+        with self._lock:
+            self._shutdown_locked()
+
+
+conversion_pool = ConversionPool()
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+儀表板統計
+
+各狀態的規範數、已生效規範依結束日期的筆數 (即將到期)、各申請人的規範數與展延次數、每月建立數
+彙總在 spec_stat 資料表，儀表板只讀取這張小資料表，不必每次對 temp_spec 做 GROUP BY。
+
+- 生命週期操作 (建立、啟用、展延、終止、刪除、批次作業、到期處理) 以 snapshot() 取得變更前後的狀態，
+  record_change() 將差異暫存在目前的 app context，commit 前以 upsert 累加；
+  與 audit.record_history 相同，和規範的變更在同一個交易中生效，rollback 時一併捨棄。
+- reconcile_stats() 以 GROUP BY 重新計算並覆寫彙總值，修正直接修改資料庫等造成的偏差。
+  可由 cron 執行 reconcile_dashboard.py，或設定 DASHBOARD_RECONCILE_ENABLED 由各 worker 的背景執行緒定期執行。
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+
+from flask import g, has_app_context
+from sqlalchemy import event, func, text
+from sqlalchemy.orm import Session
+
+from models import db, TempSpec, SpecStat
+
+logger = logging.getLogger(__name__)
+
+# spec_stat.metric
+STATUS = 'status'
+ACTIVE_END_DATE = 'active_end_date'
+APPLICANT_SPECS = 'applicant_specs'
+APPLICANT_EXTENSIONS = 'applicant_extensions'
+CREATED_MONTH = 'created_month'
+TRACKED_METRICS = (STATUS, ACTIVE_END_DATE, APPLICANT_SPECS, APPLICANT_EXTENSIONS, CREATED_MONTH)
+# 最後一次校正的時間 (epoch 秒)
+META = '_meta'
+RECONCILED_AT = 'reconciled_at'
+
+STATUSES = ('pending_approval', 'active', 'expired', 'terminated')
+
+SpecSnapshot = namedtuple('SpecSnapshot', 'status end_date applicant extension_count created_at')
+
+_metrics_lock = threading.Lock()
+metrics = {
+    'runs': 0,
+    'failures': 0,
+    'buckets_corrected_total': 0,
+    'last_buckets_corrected': 0,
+    'last_duration_ms': 0.0,
+    'last_run_at': None,
+    'last_error': None,
+}
+
+
+def _record_metrics(corrected, duration, error=None):
+    with _metrics_lock:
+        metrics['runs'] += 1
+        metrics['last_run_at'] = datetime.now().isoformat(timespec='seconds')
+        metrics['last_duration_ms'] = round(duration * 1000, 2)
+        if error is None:
+            metrics['buckets_corrected_total'] += corrected
+            metrics['last_buckets_corrected'] = corrected
+            metrics['last_error'] = None
+        else:
+            metrics['failures'] += 1
+            metrics['last_error'] = str(error)
+
+
+# ---------------------------------------------------------------------------
+# 增量更新
+# ---------------------------------------------------------------------------
+
+def _applicant_bucket(applicant):
+    return (applicant or '').strip()[:100]
+
+
+def snapshot(spec):
+    """規範 (ORM 物件或含相同欄位的查詢結果列) 目前影響統計的欄位"""
+    return SpecSnapshot(spec.status, spec.end_date, spec.applicant, spec.extension_count or 0, spec.created_at)
+
+
+def _contributions(snap):
+    """一筆規範對各統計值的貢獻"""
+    counts = Counter()
+    if snap is None:
+        return counts
+    counts[(STATUS, snap.status)] += 1
+    if snap.status == 'active' and snap.end_date is not None:
+        counts[(ACTIVE_END_DATE, snap.end_date.isoformat())] += 1
+    applicant = _applicant_bucket(snap.applicant)
+    counts[(APPLICANT_SPECS, applicant)] += 1
+    counts[(APPLICANT_EXTENSIONS, applicant)] += snap.extension_count or 0
+    if snap.created_at is not None:
+        counts[(CREATED_MONTH, snap.created_at.strftime('%Y-%m'))] += 1
+    return counts
+
+
+def record_change(before, after):
+    """
+    暫存一筆規範的統計差異，於 db.session.commit() 前寫入。
+    before / after 為 snapshot()；建立時 before 為 None，刪除時 after 為 None。
+    """
+    deltas = _contributions(after)
+    deltas.subtract(_contributions(before))
+    buffer = g.setdefault('_dashboard_deltas', Counter())
+    for key, amount in deltas.items():
+        if amount:
+            buffer[key] += amount
+
+
+def _apply_deltas(session, deltas):
+    # 依 key 排序寫入，多個交易同時更新時鎖定順序一致
+    params = [{'metric': metric, 'bucket': bucket, 'value': value}
+              for (metric, bucket), value in sorted(deltas.items()) if value]
+    if not params:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        session.execute(text(
+            "INSERT INTO spec_stat (metric, bucket, value) VALUES (:metric, :bucket, :value) "
+            "ON CONFLICT (metric, bucket) DO UPDATE SET value = value + excluded.value"
+        ), params)
+    elif dialect == 'mysql':
+        session.execute(text(
+            "INSERT INTO spec_stat (metric, bucket, value) VALUES (:metric, :bucket, :value) "
+            "ON DUPLICATE KEY UPDATE value = value + VALUES(value)"
+        ), params)
+    else:
+        for row in params:
+            updated = session.execute(text(
+                "UPDATE spec_stat SET value = value + :value WHERE metric = :metric AND bucket = :bucket"
+            ), row).rowcount
+            if not updated:
+                session.execute(text(
+                    "INSERT INTO spec_stat (metric, bucket, value) VALUES (:metric, :bucket, :value)"
+                ), row)
+
+
+@event.listens_for(Session, 'before_commit')
+def _flush_before_commit(session):
+    if has_app_context() and g.get('_dashboard_deltas') and session is db.session():
+        _apply_deltas(session, g.pop('_dashboard_deltas'))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    if has_app_context() and '_dashboard_deltas' in g and session is db.session():
+        g.pop('_dashboard_deltas', None)
+
+
+# ---------------------------------------------------------------------------
+# 校正
+# ---------------------------------------------------------------------------
+
+def _lock_stats():
+    """鎖定 spec_stat，校正期間其他交易的增量更新等待校正完成後再累加"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # SQLite 以寫入開始交易即取得整個資料庫的寫入鎖
+        db.session.execute(text("UPDATE spec_stat SET value = value WHERE 1 = 0"))
+    else:
+        db.session.query(SpecStat.metric).with_for_update().all()
+
+
+def compute_stats():
+    """以 GROUP BY 由 temp_spec 計算所有統計值，回傳 {(metric, bucket): value}"""
+    counts = Counter()
+    for status, count in db.session.query(TempSpec.status, func.count()).group_by(TempSpec.status):
+        counts[(STATUS, status)] += count
+    for end_date, count in db.session.query(TempSpec.end_date, func.count()).filter(
+            TempSpec.status == 'active', TempSpec.end_date.isnot(None)).group_by(TempSpec.end_date):
+        counts[(ACTIVE_END_DATE, end_date.isoformat())] += count
+    for applicant, count, extensions in db.session.query(
+            TempSpec.applicant, func.count(), func.sum(func.coalesce(TempSpec.extension_count, 0))
+    ).group_by(TempSpec.applicant):
+        bucket = _applicant_bucket(applicant)
+        counts[(APPLICANT_SPECS, bucket)] += count
+        counts[(APPLICANT_EXTENSIONS, bucket)] += int(extensions or 0)
+    year = func.extract('year', TempSpec.created_at)
+    month = func.extract('month', TempSpec.created_at)
+    for y, m, count in db.session.query(year, month, func.count()).filter(
+            TempSpec.created_at.isnot(None)).group_by(year, month):
+        counts[(CREATED_MONTH, f"{int(y):04d}-{int(m):02d}")] += count
+    return counts
+
+
+def reconcile_stats():
+    """重新計算統計值並覆寫 spec_stat，回傳修正的項目數 (與資料不一致的 bucket 數)"""
+    start = time.perf_counter()
+    try:
+        _lock_stats()
+        expected = {key: value for key, value in compute_stats().items() if value}
+        current = {(row.metric, row.bucket): row.value for row in SpecStat.query.filter(
+            SpecStat.metric.in_(TRACKED_METRICS))}
+        corrected = sum(1 for key in expected.keys() | current.keys()
+                        if expected.get(key, 0) != current.get(key, 0))
+        if corrected:
+            SpecStat.query.filter(SpecStat.metric.in_(TRACKED_METRICS)).delete(synchronize_session=False)
+            db.session.add_all([SpecStat(metric=metric, bucket=bucket, value=value)
+                                for (metric, bucket), value in sorted(expected.items())])
+        db.session.merge(SpecStat(metric=META, bucket=RECONCILED_AT, value=int(time.time())))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _record_metrics(0, time.perf_counter() - start, e)
+        raise
+
+    duration = time.perf_counter() - start
+    _record_metrics(corrected, duration)
+    if corrected and current:
+        logger.warning("儀表板統計有 %d 項與資料不一致，已修正 (%.1f ms)", corrected, duration * 1000)
+    return corrected
+
+
+# ---------------------------------------------------------------------------
+# 讀取
+# ---------------------------------------------------------------------------
+
+def load_stats():
+    """讀取整張 spec_stat，回傳 {metric: {bucket: value}}"""
+    stats = {}
+    for row in SpecStat.query.all():
+        stats.setdefault(row.metric, {})[row.bucket] = row.value
+    return stats
+
+
+def _recent_months(today, months):
+    year, month = today.year, today.month
+    result = []
+    for _ in range(months):
+        result.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return result[::-1]
+
+
+def expiring_specs(today, days, limit=50):
+    """結束日期在 today 之後 days 天內的已生效規範 (依結束日期排序)"""
+    return TempSpec.query.with_entities(
+        TempSpec.id, TempSpec.spec_code, TempSpec.title, TempSpec.applicant, TempSpec.end_date
+    ).filter(
+        TempSpec.status == 'active',
+        TempSpec.end_date >= today,
+        TempSpec.end_date <= today + timedelta(days=days),
+    ).order_by(TempSpec.end_date, TempSpec.id).limit(limit).all()
+
+
+def dashboard_summary(today=None, expiring_days=7, months=12, top_applicants=20, expiring_limit=50):
+    """儀表板顯示的資料 (可直接輸出為 JSON)"""
+    today = today or date.today()
+    stats = load_stats()
+
+    status_counts = {status: stats.get(STATUS, {}).get(status, 0) for status in STATUSES}
+
+    horizon = (today + timedelta(days=expiring_days)).isoformat()
+    by_date = {day: count for day, count in sorted(stats.get(ACTIVE_END_DATE, {}).items())
+               if today.isoformat() <= day <= horizon and count}
+    # 結束日期已過但到期處理尚未執行的已生效規範
+    overdue = sum(count for day, count in stats.get(ACTIVE_END_DATE, {}).items() if day < today.isoformat())
+
+    extensions = stats.get(APPLICANT_EXTENSIONS, {})
+    applicants = sorted(
+        ({'applicant': applicant, 'specs': count, 'extensions': extensions.get(applicant, 0)}
+         for applicant, count in stats.get(APPLICANT_SPECS, {}).items() if count),
+        key=lambda item: (-item['extensions'], -item['specs'], item['applicant']),
+    )[:top_applicants]
+
+    created = stats.get(CREATED_MONTH, {})
+    reconciled_at = stats.get(META, {}).get(RECONCILED_AT)
+    return {
+        'today': today.isoformat(),
+        'reconciled_at': datetime.fromtimestamp(reconciled_at).isoformat(timespec='seconds') if reconciled_at else None,
+        'total': sum(status_counts.values()),
+        'status_counts': status_counts,
+        'expiring': {
+            'days': expiring_days,
+            'count': sum(by_date.values()),
+            'overdue': overdue,
+            'by_date': by_date,
+            'specs': [{'id': row.id, 'spec_code': row.spec_code, 'title': row.title, 'applicant': row.applicant,
+                       'end_date': row.end_date.isoformat()}
+                      for row in expiring_specs(today, expiring_days, expiring_limit)],
+        },
+        'applicants': applicants,
+        'monthly_created': [{'month': month, 'count': created.get(month, 0)}
+                            for month in _recent_months(today, months)],
+    }
+
+
+class DashboardReconciler:
+    """
+    在每個 worker 行程中定期執行 reconcile_stats 的背景執行緒。
+    用法與 Flask 擴充套件相同；DASHBOARD_RECONCILE_ENABLED 為 False 時不啟動 (改用 cron 執行 reconcile_dashboard.py)。
+    """
+
+    DEFAULTS = {
+        'DASHBOARD_RECONCILE_ENABLED': False,
+        'DASHBOARD_RECONCILE_INTERVAL': 3600,
+    }
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self.app = None
+        self.config = dict(self.DEFAULTS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.config = {key: app.config.get(key, default) for key, default in self.DEFAULTS.items()}
+        app.extensions['dashboard_reconciler'] = self
+        if self.config['DASHBOARD_RECONCILE_ENABLED']:
+            # 在 worker fork 之後的第一個請求才啟動，避免執行緒留在 master 行程中
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='dashboard-reconcile', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        interval = self.config['DASHBOARD_RECONCILE_INTERVAL']
+        # 錯開各 worker 的執行時間
+        if self._stop.wait(random.uniform(0, min(interval, 60))):
+            return
+        while True:
+            try:
+                with self.app.app_context():
+                    reconcile_stats()
+            except Exception as e:
+                logger.error("儀表板統計校正失敗: %s", e)
+            if self._stop.wait(interval):
+                return
+
+    def stop(self):
+        self._stop.set()
+
+
+dashboard_reconciler = DashboardReconciler()
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+將結束日期已過的已生效規範設為過期，適合由 cron / 工作排程器定期執行。
+
+    python expire_specs.py
+    python expire_specs.py --date 2025-01-31   # 以指定日期為基準
+"""
+import argparse
+from datetime import datetime
+from flask import Flask
+from models import db
+from config import Config
+from expiry import expire_overdue_specs, metrics
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='將到期的暫時規範設為過期')
+    parser.add_argument('--date', help='基準日期 (YYYY-MM-DD)，預設為今天')
+    args = parser.parse_args()
+    today = datetime.strptime(args.date, '%Y-%m-%d').date() if args.date else None
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+
+    with app.app_context():
+        count = expire_overdue_specs(today)
+        print(f"✅ 已將 {count} 筆規範設為過期 (耗時 {metrics['last_duration_ms']} ms)")
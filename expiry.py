@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+規範到期處理
+
+將結束日期已過的「已生效」規範一次以單一 UPDATE 改為「已過期」，並批次寫入歷史紀錄。
+UPDATE 只作用於仍為 active 的資料列，已處理過的規範不會再被選到，重複執行不會有副作用；
+多個 worker 同時執行時，同一筆規範只會由其中一個交易轉換並記錄。
+
+可由 cron 執行 expire_specs.py，或設定 EXPIRY_SCHEDULER_ENABLED 由各 worker 的背景執行緒定期執行。
+"""
+import logging
+import os
+import random
+import threading
+import time
+from datetime import date, datetime
+
+from sqlalchemy import text, insert
+from sqlalchemy.exc import OperationalError
+
+from changes import mark_specs_changed
+from dashboard import record_change, SpecSnapshot
+from models import db, TempSpec, SpecHistory
+from pagination import invalidate_counts
+
+logger = logging.getLogger(__name__)
+
+EXPIRE_ACTION = '過期'
+
+_metrics_lock = threading.Lock()
+metrics = {
+    'runs': 0,
+    'failures': 0,
+    'rows_expired_total': 0,
+    'last_rows_expired': 0,
+    'last_duration_ms': 0.0,
+    'last_run_at': None,
+    'last_error': None,
+}
+
+
+def _record_metrics(rows, duration, error=None):
+    with _metrics_lock:
+        metrics['runs'] += 1
+        metrics['last_run_at'] = datetime.now().isoformat(timespec='seconds')
+        metrics['last_duration_ms'] = round(duration * 1000, 2)
+        if error is None:
+            metrics['rows_expired_total'] += rows
+            metrics['last_rows_expired'] = rows
+            metrics['last_error'] = None
+        else:
+            metrics['failures'] += 1
+            metrics['last_error'] = str(error)
+
+
+def _expire_locked(today):
+    """在目前交易中轉換狀態，回傳被本交易轉換的 [(id, end_date)]"""
+    dialect = db.session.get_bind().dialect.name
+    params = {'today': today}
+    if dialect == 'sqlite':
+        # SQLite 寫入時整個資料庫加鎖，UPDATE ... RETURNING 直接取得本次轉換的資料列
+        rows = db.session.execute(text(
+            "UPDATE temp_spec SET status = 'expired' "
+            "WHERE status = 'active' AND end_date < :today "
+            "RETURNING id, end_date"
+        ).columns(TempSpec.id, TempSpec.end_date), params).all()
+        return [(row[0], row[1]) for row in rows]
+
+    # 先鎖定符合條件的資料列，其他 worker 會等待本交易結束，之後重新讀取時已不是 active
+    rows = db.session.query(TempSpec.id, TempSpec.end_date).filter(
+        TempSpec.status == 'active', TempSpec.end_date < today
+    ).with_for_update().all()
+    if not rows:
+        return []
+    db.session.query(TempSpec).filter(
+        TempSpec.id.in_([row.id for row in rows]), TempSpec.status == 'active'
+    ).update({TempSpec.status: 'expired'}, synchronize_session=False)
+    return [(row.id, row.end_date) for row in rows]
+
+
+def expire_overdue_specs(today=None, retries=3):
+    """
+    將 end_date 早於 today 的 active 規範設為 expired，回傳轉換的筆數。
+    遇到鎖定逾時或死結時整個交易重試。
+    """
+    today = today or date.today()
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            expired = _expire_locked(today)
+            if expired:
+                # 與 SpecHistory.timestamp 的預設值相同，以 UTC 記錄
+                now = datetime.utcnow()
+                db.session.execute(insert(SpecHistory), [{
+                    'spec_id': spec_id,
+                    'user_id': None,
+                    'action': EXPIRE_ACTION,
+                    'details': f"結束日期 {end_date} 已過，系統自動設為過期",
+                    'timestamp': now,
+                } for spec_id, end_date in expired])
+                # 申請人、展延次數與建立月份不變，只更新狀態與到期日的統計
+                for _, end_date in expired:
+                    before = SpecSnapshot('active', end_date, None, 0, None)
+                    record_change(before, before._replace(status='expired'))
+                mark_specs_changed(spec_id for spec_id, _ in expired)
+            db.session.commit()
+            break
+        except OperationalError as e:
+            db.session.rollback()
+            if attempt > retries:
+                _record_metrics(0, time.perf_counter() - start, e)
+                raise
+            logger.warning("規範到期處理第 %d 次嘗試失敗，稍後重試: %s", attempt, e)
+            time.sleep(0.2 * attempt + random.random() * 0.2)
+        except Exception as e:
+            db.session.rollback()
+            _record_metrics(0, time.perf_counter() - start, e)
+            raise
+
+    duration = time.perf_counter() - start
+    _record_metrics(len(expired), duration)
+    if expired:
+        invalidate_counts()
+        logger.info("已將 %d 筆規範設為過期 (%.1f ms)", len(expired), duration * 1000)
+    return len(expired)
+
+
+class ExpiryScheduler:
+    """
+    在每個 worker 行程中定期執行 expire_overdue_specs 的背景執行緒。
+    用法與 Flask 擴充套件相同；EXPIRY_SCHEDULER_ENABLED 為 False 時不啟動 (改用 cron 執行 expire_specs.py)。
+    """
+
+    DEFAULTS = {
+        'EXPIRY_SCHEDULER_ENABLED': False,
+        'EXPIRY_INTERVAL': 3600,
+    }
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self.app = None
+        self.config = dict(self.DEFAULTS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.config = {key: app.config.get(key, default) for key, default in self.DEFAULTS.items()}
+        app.extensions['expiry_scheduler'] = self
+        if self.config['EXPIRY_SCHEDULER_ENABLED']:
+            # 在 worker fork 之後的第一個請求才啟動，避免執行緒留在 master 行程中
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='spec-expiry', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        interval = self.config['EXPIRY_INTERVAL']
+        # 錯開各 worker 的執行時間
+        if self._stop.wait(random.uniform(0, min(interval, 60))):
+            return
+        while True:
+            try:
+                with self.app.app_context():
+                    expire_overdue_specs()
+            except Exception as e:
+                logger.error("規範到期處理失敗: %s", e)
+            if self._stop.wait(interval):
+                return
+
+    def stop(self):
+        self._stop.set()
+
+
+expiry_scheduler = ExpiryScheduler()
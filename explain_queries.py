@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+對 routes/temp_spec.py 使用的查詢執行 EXPLAIN，確認是否使用索引。
+
+    python explain_queries.py
+
+SQLite 使用 EXPLAIN QUERY PLAN，MySQL 使用 EXPLAIN。計畫中出現全表掃描
+(SQLite 的 "SCAN <table>" 未搭配索引、MySQL 的 type=ALL) 時會標示 ⚠️；
+標記為「預期全表掃描」的查詢本身無法使用 B-tree 索引。
+"""
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.orm import undefer
+
+from config import Config
+from models import db, TempSpec, Upload, SpecHistory, SpecCodeSequence
+from search import FTS_TABLE, FULLTEXT_INDEX, INDEXED_COLUMNS, like_filter
+
+# 這些查詢在設計上就是全表掃描 (以 % 開頭的 LIKE)，只列出供參考
+EXPECTED_SCANS = {'delete_spec: 圖片是否仍被引用', 'spec_list: 短字詞 LIKE 搜尋'}
+
+
+def _list_query():
+    return TempSpec.query.options(undefer(TempSpec.upload_count), undefer(TempSpec.latest_upload_time))
+
+
+def route_queries():
+    """(說明, SQLAlchemy 查詢) 清單，條件與 routes/temp_spec.py 相同"""
+    now = datetime.now()
+    prefix = f"PE{now.year - 1911}{now.strftime('%m')}"
+    cursor = (now, 1000)
+    created_before = db.or_(
+        TempSpec.created_at < cursor[0],
+        db.and_(TempSpec.created_at == cursor[0], TempSpec.id < cursor[1]),
+    )
+    return [
+        ('get_or_404: 依 id 取得規範',
+         TempSpec.query.filter(TempSpec.id == 1)),
+        ('allocate_spec_code: 編號計數列',
+         SpecCodeSequence.query.filter_by(prefix=prefix)),
+        ('spec_list: 第一頁',
+         _list_query().order_by(TempSpec.created_at.desc(), TempSpec.id.desc()).limit(16)),
+        ('spec_list: 游標之後的頁面',
+         _list_query().filter(created_before).order_by(TempSpec.created_at.desc(), TempSpec.id.desc()).limit(16)),
+        ('spec_list: 依狀態篩選',
+         _list_query().filter(TempSpec.status == 'active')
+         .order_by(TempSpec.created_at.desc(), TempSpec.id.desc()).limit(16)),
+        ('spec_list: 依狀態篩選的游標頁面',
+         _list_query().filter(TempSpec.status == 'active', created_before)
+         .order_by(TempSpec.created_at.desc(), TempSpec.id.desc()).limit(16)),
+        ('spec_list: 依狀態計算總筆數',
+         db.session.query(db.func.count(TempSpec.id)).filter(TempSpec.status == 'active')),
+        ('spec_list: 全文檢索結果的頁面',
+         _list_query().filter(TempSpec.id.in_([1, 2, 3]))),
+        ('spec_list: 短字詞 LIKE 搜尋',
+         _list_query().filter(like_filter('PE')).order_by(TempSpec.created_at.desc(), TempSpec.id.desc()).limit(16)),
+        ('download_signed_pdf: 最新上傳檔案',
+         Upload.query.filter_by(temp_spec_id=1).order_by(Upload.upload_time.desc()).limit(1)),
+        ('spec_history: 歷史紀錄',
+         SpecHistory.query.filter_by(spec_id=1).order_by(SpecHistory.timestamp.desc())),
+        ('expire_overdue_specs: 結束日期已過的已生效規範',
+         TempSpec.query.filter(TempSpec.status == 'active', TempSpec.end_date < now.date())),
+        ('dashboard: 即將到期的規範',
+         TempSpec.query.filter(TempSpec.status == 'active', TempSpec.end_date >= now.date(),
+                               TempSpec.end_date <= now.date() + timedelta(days=7))
+         .order_by(TempSpec.end_date, TempSpec.id).limit(50)),
+        ('api: 自 since 之後變更的規範',
+         TempSpec.query.filter(db.or_(TempSpec.change_version > 100,
+                                      db.and_(TempSpec.change_version == 100, TempSpec.id > 1)),
+                               TempSpec.change_version <= 200)
+         .order_by(TempSpec.change_version, TempSpec.id).limit(101)),
+        ('delete_spec: 圖片是否仍被引用',
+         TempSpec.query.filter(TempSpec.id != 1, TempSpec.content.contains('/static/uploads/images/x.png')).limit(1)),
+    ]
+
+
+def _search_sql(dialect):
+    if dialect == 'sqlite':
+        return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH '\"LOT123\"' ORDER BY rank LIMIT 1000"
+    columns = ', '.join(INDEXED_COLUMNS)
+    return (f"SELECT id FROM temp_spec WHERE MATCH ({columns}) AGAINST ('+\"LOT123\"' IN BOOLEAN MODE) "
+            f"LIMIT 1000 /* {FULLTEXT_INDEX} */")
+
+
+def explain(sql, dialect):
+    """回傳 (計畫文字列, 是否出現全表掃描)"""
+    if dialect == 'sqlite':
+        rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+        lines = [row[-1] for row in rows]
+        # 子查詢中以 rowid/主鍵直接查找不算掃描；"SCAN x USING (COVERING) INDEX" 仍有使用索引
+        scans = [line for line in lines if line.startswith('SCAN') and 'INDEX' not in line
+                 and 'VIRTUAL TABLE' not in line]
+        return lines, bool(scans)
+    result = db.session.execute(text('EXPLAIN ' + sql))
+    keys = list(result.keys())
+    lines, full_scan = [], False
+    for row in result:
+        info = dict(zip(keys, row))
+        lines.append(f"{info.get('table')}: type={info.get('type')} key={info.get('key')} rows={info.get('rows')} "
+                     f"extra={info.get('Extra')}")
+        full_scan = full_scan or info.get('type') == 'ALL'
+    return lines, full_scan
+
+
+def main():
+    dialect = db.session.get_bind().dialect.name
+    print(f"資料庫: {dialect}\n")
+    problems = 0
+    entries = [(label, str(query.statement.compile(dialect=db.session.get_bind().dialect,
+                                                   compile_kwargs={'literal_binds': True})))
+               for label, query in route_queries()]
+    entries.append(('spec_list: 全文檢索', _search_sql(dialect)))
+
+    for label, sql in entries:
+        lines, full_scan = explain(sql, dialect)
+        if full_scan and label in EXPECTED_SCANS:
+            mark = 'ℹ️  預期全表掃描'
+        elif full_scan:
+            mark = '⚠️  全表掃描'
+            problems += 1
+        else:
+            mark = '✅'
+        print(f"{mark} {label}")
+        for line in lines:
+            print(f"      {line}")
+    print(f"\n共 {len(entries)} 個查詢，{problems} 個未使用索引。")
+    return problems
+
+
+if __name__ == '__main__':
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+
+    with app.app_context():
+        raise SystemExit(1 if main() else 0)
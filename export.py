@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+規範與附件的 ZIP 匯出 (稽核用)
+
+ZIP 以串流方式邊建立邊輸出：zipfile 寫入不可 seek 的輸出時會改用 data descriptor，
+每個檔案以 CHUNK_SIZE 分塊讀取後立即送出，不需先在記憶體或磁碟上組好整個壓縮檔，
+匯出數 GB 的內容時記憶體用量也維持固定。
+
+壓縮檔內容：
+    <規範編號>/<規範編號>.docx、.pdf   產生的 Word / PDF
+    <規範編號>/signed/<檔名>           上傳的簽核檔案
+    <規範編號>/images/<檔名>           內容中引用的圖片
+    manifest.jsonl                     第一行為匯出條件，其後每行一筆規範的中繼資料、
+                                       上傳紀錄、歷史紀錄以及實際寫入的檔案 (含 SHA-256)
+
+manifest 記錄的是實際寫入壓縮檔的內容，因此放在最後；撰寫期間先暫存在 SpooledTemporaryFile。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+
+from file_serving import CHUNK_SIZE
+from images import referenced_filenames
+from models import db, TempSpec, Upload, SpecHistory, User
+from storage import storage, document_key, signed_key, image_key
+
+EXPORT_BATCH_SIZE = 100
+MANIFEST_NAME = 'manifest.jsonl'
+_MANIFEST_SPOOL_BYTES = 4 * 1024 * 1024
+# ZIP 的時間欄位無法表示 1980 年以前的日期
+_MIN_ZIP_TIMESTAMP = 315619200
+
+# 這些格式本身已經壓縮，直接儲存可省下 CPU 且不會變大
+_STORED_EXTENSIONS = {'.pdf', '.docx', '.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+
+class _ChunkSink:
+    """zipfile 的輸出目標：只支援 write，寫入的資料由 drain() 取出後送出"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _spec_query(start=None, end=None, status=None):
+    query = TempSpec.query
+    if start is not None:
+        query = query.filter(TempSpec.created_at >= start)
+    if end is not None:
+        query = query.filter(TempSpec.created_at < end)
+    if status:
+        query = query.filter(TempSpec.status == status)
+    return query
+
+
+def _iter_spec_batches(query, batch_size=EXPORT_BATCH_SIZE):
+    """依 id 遞增分批讀取規範，連同該批的上傳與歷史紀錄 (各一次查詢)"""
+    last_id = 0
+    while True:
+        specs = query.filter(TempSpec.id > last_id).order_by(TempSpec.id).limit(batch_size).all()
+        if not specs:
+            return
+        ids = [spec.id for spec in specs]
+        uploads, history = {}, {}
+        for upload in Upload.query.filter(Upload.temp_spec_id.in_(ids)).order_by(Upload.upload_time, Upload.id):
+            uploads.setdefault(upload.temp_spec_id, []).append(upload)
+        for row in db.session.query(
+            SpecHistory.spec_id, SpecHistory.timestamp, SpecHistory.action, SpecHistory.details, User.username
+        ).outerjoin(User, SpecHistory.user_id == User.id).filter(
+            SpecHistory.spec_id.in_(ids)
+        ).order_by(SpecHistory.timestamp, SpecHistory.id):
+            history.setdefault(row.spec_id, []).append(row)
+        yield [(spec, uploads.get(spec.id, []), history.get(spec.id, [])) for spec in specs]
+        last_id = ids[-1]
+
+
+def _spec_files(spec, uploads):
+    """(kind, storage key, 壓縮檔內路徑)"""
+    code = spec.spec_code
+    files = [
+        ('docx', document_key(code, 'docx', spec.created_at), f"{code}/{code}.docx"),
+        ('pdf', document_key(code, 'pdf', spec.created_at), f"{code}/{code}.pdf"),
+    ]
+    for upload in uploads:
+        files.append(('signed', signed_key(code, upload.filename, spec.created_at), f"{code}/signed/{upload.filename}"))
+    for filename in referenced_filenames({'content': spec.content}):
+        files.append(('image', image_key(filename), f"{code}/images/{filename}"))
+    return files
+
+
+def _write_file(archive, sink, key, stat, arcname):
+    """將檔案分塊寫入壓縮檔，每塊寫完即產生輸出；回傳 (size, sha256)"""
+    file_size, mtime = stat
+    info = zipfile.ZipInfo(arcname, date_time=time.localtime(max(mtime, _MIN_ZIP_TIMESTAMP))[:6])
+    info.file_size = file_size  # 讓 zipfile 依檔案大小決定是否使用 ZIP64
+    stored = os.path.splitext(arcname)[1].lower() in _STORED_EXTENSIONS
+    info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+    digest = hashlib.sha256()
+    size = 0
+    with storage.open(key) as src, archive.open(info, 'w') as dest:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            dest.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+            yield sink.drain()
+    yield sink.drain()
+    return size, digest.hexdigest()
+
+
+def _manifest_record(spec, uploads, history, files, missing):
+    return {
+        'type': 'spec',
+        'id': spec.id,
+        'spec_code': spec.spec_code,
+        'title': spec.title,
+        'applicant': spec.applicant,
+        'status': spec.status,
+        'start_date': _iso(spec.start_date),
+        'end_date': _iso(spec.end_date),
+        'created_at': _iso(spec.created_at),
+        'extension_count': spec.extension_count or 0,
+        'termination_reason': spec.termination_reason,
+        'lot_number': spec.lot_number,
+        'equipment_type': spec.equipment_type,
+        'content': spec.content,
+        'uploads': [{
+            'filename': upload.filename,
+            'upload_time': _iso(upload.upload_time),
+            'sha256': upload.sha256,
+            'size_bytes': upload.size_bytes,
+        } for upload in uploads],
+        'history': [{
+            'timestamp': _iso(row.timestamp),
+            'action': row.action,
+            'username': row.username,
+            'details': row.details,
+        } for row in history],
+        'files': files,
+        'missing': missing,
+    }
+
+
+def iter_spec_archive(start=None, end=None, status=None):
+    """
+    產生 ZIP 壓縮檔的位元組片段。
+    start/end 為建立時間的範圍 (datetime，end 不含)，status 為規範狀態；皆為 None 時匯出全部規範。
+    """
+    for chunk in _iter_archive(start, end, status):
+        if chunk:
+            yield chunk
+
+
+def _iter_archive(start, end, status):
+    sink = _ChunkSink()
+    spec_count = file_count = total_bytes = 0
+
+    with tempfile.SpooledTemporaryFile(max_size=_MANIFEST_SPOOL_BYTES, mode='w+b') as manifest, \
+            zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for batch in _iter_spec_batches(_spec_query(start, end, status)):
+            for spec, uploads, history in batch:
+                files, missing, written = [], [], set()
+                for kind, key, arcname in _spec_files(spec, uploads):
+                    if arcname in written:
+                        continue
+                    stat = storage.stat(key)
+                    if stat is None:
+                        missing.append({'kind': kind, 'path': arcname})
+                        continue
+                    size, sha256 = yield from _write_file(archive, sink, key, stat, arcname)
+                    written.add(arcname)
+                    files.append({'kind': kind, 'path': arcname, 'size': size, 'sha256': sha256})
+                    file_count += 1
+                    total_bytes += size
+                record = _manifest_record(spec, uploads, history, files, missing)
+                manifest.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+                spec_count += 1
+
+        header = {
+            'type': 'export',
+            'exported_at': datetime.now().isoformat(timespec='seconds'),
+            'filters': {'start': _iso(start), 'end': _iso(end), 'status': status},
+            'spec_count': spec_count,
+            'file_count': file_count,
+            'total_bytes': total_bytes,
+        }
+        info = zipfile.ZipInfo(MANIFEST_NAME, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        manifest.seek(0)
+        with archive.open(info, 'w', force_zip64=True) as dest:
+            dest.write((json.dumps(header, ensure_ascii=False) + '\n').encode('utf-8'))
+            for chunk in iter(lambda: manifest.read(CHUNK_SIZE), b''):
+                dest.write(chunk)
+                yield sink.drain()
+    # 關閉 ZipFile 後寫出的中央目錄
+    yield sink.drain()
+
+
+def write_spec_archive(fileobj, start=None, end=None, status=None):
+    """將匯出的壓縮檔寫入 fileobj (可為 stdout 等不可 seek 的串流)，回傳寫入的位元組數"""
+    written = 0
+    for chunk in iter_spec_archive(start, end, status):
+        fileobj.write(chunk)
+        written += len(chunk)
+    return written
+
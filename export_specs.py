@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+匯出規範與其產生的文件、簽核檔案、引用圖片為 ZIP (內容與管理頁面的匯出相同)。
+
+    python export_specs.py audit.zip
+    python export_specs.py audit.zip --start 2025-01-01 --end 2025-06-30 --status active
+    python export_specs.py - --status expired | ssh backup 'cat > specs.zip'   # 輸出到 stdout
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+from flask import Flask
+from models import db
+from config import Config
+from export import write_spec_archive
+from storage import storage
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='匯出暫時規範與附件為 ZIP')
+    parser.add_argument('output', help='輸出檔案路徑，- 表示 stdout')
+    parser.add_argument('--start', help='建立日期起 (YYYY-MM-DD)')
+    parser.add_argument('--end', help='建立日期迄 (YYYY-MM-DD，含當天)')
+    parser.add_argument('--status', choices=['pending_approval', 'active', 'expired', 'terminated'])
+    args = parser.parse_args()
+    start = datetime.strptime(args.start, '%Y-%m-%d') if args.start else None
+    end = datetime.strptime(args.end, '%Y-%m-%d') + timedelta(days=1) if args.end else None
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    storage.init_app(app)
+
+    with app.app_context():
+        if args.output == '-':
+            write_spec_archive(sys.stdout.buffer, start, end, args.status)
+        else:
+            with open(args.output, 'wb') as f:
+                size = write_spec_archive(f, start, end, args.status)
+            print(f"✅ 已匯出至 {args.output} ({size / 1024 / 1024:.1f} MB)")
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+規範檔案與上傳圖片的垃圾回收
+
+刪除規範時不在請求中刪除檔案，只把產生的 Word/PDF 與簽核檔案的 storage key 寫入 file_tombstone
+(與刪除規範同一個交易)，請求立即完成；實際的刪除由背景清除分批進行。
+
+圖片依內容去重、可被多份規範共用，每份規範引用的圖片記錄在 spec_image (刪除規範時級聯刪除)。
+沒有任何規範引用、且最後一次上傳已超過保留期間的圖片 (包含上傳後從未存成規範的圖片)
+會以條件式 DELETE 移除 image_asset 紀錄並將原圖與縮圖寫入 file_tombstone，再由同一次清除刪除檔案。
+
+刪除失敗的檔案保留 tombstone 並記錄錯誤，下次清除時重試，失敗 FILE_GC_MAX_ATTEMPTS 次後不再重試。
+多個 worker 同時清除是安全的：刪除檔案可重複執行，圖片由條件式 DELETE 成功的那一方標記。
+
+同一次清除也會刪除超過 API_DELETED_SPEC_RETENTION_DAYS 天的 deleted_spec 紀錄 (API 增量同步用)。
+
+可由 cron 執行 sweep_files.py (--dry-run 只產生報告)，或設定 FILE_GC_ENABLED 由各 worker 的背景執行緒定期執行。
+"""
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert
+
+from changes import prune_deleted_specs
+from images import referenced_filenames
+from models import db, TempSpec, ImageAsset, SpecImage, FileTombstone
+from storage import storage, document_key, signed_key, image_key, thumbnail_key
+
+logger = logging.getLogger(__name__)
+
+_metrics_lock = threading.Lock()
+metrics = {
+    'runs': 0,
+    'failures': 0,
+    'files_deleted_total': 0,
+    'bytes_reclaimed_total': 0,
+    'last_files_deleted': 0,
+    'last_duration_ms': 0.0,
+    'last_run_at': None,
+    'last_error': None,
+}
+
+
+def _record_metrics(report, duration, error=None):
+    with _metrics_lock:
+        metrics['runs'] += 1
+        metrics['last_run_at'] = datetime.now().isoformat(timespec='seconds')
+        metrics['last_duration_ms'] = round(duration * 1000, 2)
+        if error is None:
+            metrics['files_deleted_total'] += report.files_deleted
+            metrics['bytes_reclaimed_total'] += report.bytes_deleted
+            metrics['last_files_deleted'] = report.files_deleted
+            metrics['last_error'] = None
+        else:
+            metrics['failures'] += 1
+            metrics['last_error'] = str(error)
+
+
+class SweepReport:
+    """一次清除 (或 dry-run) 的統計；bytes 為 storage 中實際的檔案大小"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.files_deleted = 0
+        self.bytes_deleted = 0
+        self.tombstones = 0
+        self.tombstone_bytes = 0
+        self.orphan_images = 0
+        self.orphan_image_bytes = 0
+        self.stray_files = 0
+        self.stray_bytes = 0
+        self.failed = 0
+        self.stuck = 0
+        self.deleted_specs = 0
+
+    @property
+    def reclaimable_bytes(self):
+        """dry-run 時可回收的大小 (實際清除時，圖片與沒有對應資料的檔案會先標記再計入 bytes_deleted)"""
+        return self.tombstone_bytes + self.orphan_image_bytes + self.stray_bytes
+
+    def as_dict(self):
+        return {key: value for key, value in vars(self).items()}
+
+
+def _size(key):
+    stat = storage.stat(key)
+    return stat[0] if stat else 0
+
+
+# ---------------------------------------------------------------------------
+# 標記 (於請求中呼叫，不 commit)
+# ---------------------------------------------------------------------------
+
+def mark_for_deletion(keys, reason=None):
+    """將 storage key 寫入 file_tombstone (已標記的略過)，回傳新增的筆數"""
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return 0
+    existing = {row[0] for row in db.session.query(FileTombstone.key).filter(FileTombstone.key.in_(keys))}
+    now = datetime.utcnow()
+    rows = [{'key': key, 'reason': reason, 'created_at': now, 'attempts': 0} for key in keys if key not in existing]
+    if rows:
+        db.session.execute(insert(FileTombstone), rows)
+    return len(rows)
+
+
+def mark_spec_files(spec):
+    """標記規範產生的 Word/PDF 與簽核檔案；引用的圖片由 spec_image 的級聯刪除與圖片清除處理"""
+    code = spec.spec_code
+    keys = [document_key(code, 'docx', spec.created_at), document_key(code, 'pdf', spec.created_at)]
+    keys += [signed_key(code, upload.filename, spec.created_at) for upload in spec.uploads]
+    return mark_for_deletion(keys, f"刪除規範 {code}")
+
+
+def record_spec_images(spec, values):
+    """記錄規範內容引用的上傳圖片"""
+    spec.images = [SpecImage(filename=filename) for filename in referenced_filenames(values)]
+
+
+# ---------------------------------------------------------------------------
+# 清除
+# ---------------------------------------------------------------------------
+
+def _spec_code_of(key):
+    """specs/.../<編號>/<檔名> 或 specs/.../<編號>/signed/<檔名>"""
+    parts = key.split('/')
+    return parts[-3] if parts[-2] == 'signed' else parts[-2]
+
+
+def _unreferenced():
+    return ~db.session.query(SpecImage.filename).filter(SpecImage.filename == ImageAsset.filename).exists()
+
+
+def _last_uploaded():
+    return func.coalesce(ImageAsset.last_uploaded_at, ImageAsset.created_at)
+
+
+def _sweep_orphan_images(report, cutoff, batch_size):
+    """沒有任何規範引用且超過保留期間的圖片：移除 image_asset 紀錄並標記原圖與縮圖"""
+    last_id = 0
+    while True:
+        assets = db.session.query(ImageAsset.id, ImageAsset.filename).filter(
+            ImageAsset.id > last_id, _unreferenced(), _last_uploaded() < cutoff
+        ).order_by(ImageAsset.id).limit(batch_size).all()
+        if not assets:
+            return
+        last_id = assets[-1].id
+        for asset in assets:
+            keys = (image_key(asset.filename), thumbnail_key(asset.filename))
+            if not report.dry_run:
+                # 條件式刪除：期間內被重新上傳或被新規範引用的圖片不會被刪除
+                claimed = db.session.execute(delete(ImageAsset).where(
+                    ImageAsset.id == asset.id, _unreferenced(), _last_uploaded() < cutoff
+                )).rowcount
+                if not claimed:
+                    continue
+                mark_for_deletion(keys, '未被引用的圖片')
+            report.orphan_images += 1
+            if report.dry_run:
+                report.orphan_image_bytes += sum(_size(key) for key in keys)
+        db.session.commit()
+
+
+def _sweep_tombstones(report, batch_size, max_attempts):
+    last_id = 0
+    while True:
+        rows = FileTombstone.query.filter(
+            FileTombstone.id > last_id, FileTombstone.attempts < max_attempts
+        ).order_by(FileTombstone.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        done = []
+        for row in rows:
+            size = _size(row.key)
+            report.tombstones += 1
+            report.tombstone_bytes += size
+            if report.dry_run:
+                continue
+            try:
+                storage.delete(row.key)
+            except Exception as e:
+                row.attempts += 1
+                row.last_error = str(e)[:1000]
+                report.failed += 1
+                logger.warning("刪除檔案失敗 (第 %d 次): %s: %s", row.attempts, row.key, e)
+                continue
+            done.append(row.id)
+            if size:
+                report.files_deleted += 1
+                report.bytes_deleted += size
+        if done:
+            db.session.query(FileTombstone).filter(FileTombstone.id.in_(done)).delete(synchronize_session=False)
+        db.session.commit()
+        # 釋放本批的 ORM 物件，大量 tombstone 時記憶體用量維持固定
+        db.session.expunge_all()
+    report.stuck = FileTombstone.query.filter(FileTombstone.attempts >= max_attempts).count()
+
+
+def _sweep_stray_files(report, cutoff, batch_size):
+    """
+    storage 中沒有對應資料的檔案：已不存在的規範的資料夾，以及沒有 image_asset 紀錄也沒有被引用的圖片
+    (例如此功能上線前刪除規範時遺留的檔案)。需要列出整個 storage，只在指定時執行。
+    """
+    cutoff_ts = cutoff.timestamp()
+
+    def flush(batch):
+        spec_codes = {_spec_code_of(key) for key, _ in batch if key.startswith('specs/')}
+        image_names = {key.rsplit('/', 1)[-1] for key, _ in batch if not key.startswith('specs/')}
+        live_codes = {row[0] for row in db.session.query(TempSpec.spec_code).filter(TempSpec.spec_code.in_(spec_codes))}
+        live_images = {row[0] for row in db.session.query(ImageAsset.filename).filter(ImageAsset.filename.in_(image_names))}
+        live_images |= {row[0] for row in db.session.query(SpecImage.filename).filter(SpecImage.filename.in_(image_names))}
+        stray = []
+        for key, size in batch:
+            name = _spec_code_of(key) if key.startswith('specs/') else key.rsplit('/', 1)[-1]
+            if name in (live_codes if key.startswith('specs/') else live_images):
+                continue
+            keys = [key] if key.startswith('specs/') else [key, thumbnail_key(name)]
+            stray.extend(keys)
+            report.stray_files += 1
+            report.stray_bytes += size
+        if stray and not report.dry_run:
+            mark_for_deletion(stray, '沒有對應資料的檔案')
+            db.session.commit()
+
+    batch = []
+    for prefix in ('specs/', 'images/'):
+        for key, size, mtime in storage.iter_keys(prefix):
+            # 縮圖隨原圖處理
+            if key.startswith('images/thumbs/') or mtime >= cutoff_ts:
+                continue
+            batch.append((key, size))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+    if batch:
+        flush(batch)
+
+
+def sweep_files(dry_run=False, batch_size=200, image_grace_hours=72, max_attempts=5, scan_storage=False, now=None,
+                deleted_spec_retention_days=90):
+    """
+    清除未被引用的圖片與已標記的檔案，回傳 SweepReport。
+    dry_run 時只統計可回收的檔案數與大小，不做任何變更。
+    """
+    start = time.perf_counter()
+    report = SweepReport(dry_run)
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(hours=image_grace_hours)
+    try:
+        report.deleted_specs = prune_deleted_specs(now - timedelta(days=deleted_spec_retention_days), dry_run)
+        _sweep_orphan_images(report, cutoff, batch_size)
+        if scan_storage:
+            # 檔案的 mtime 為本機時間
+            _sweep_stray_files(report, datetime.now() - timedelta(hours=image_grace_hours), batch_size)
+        _sweep_tombstones(report, batch_size, max_attempts)
+    except Exception as e:
+        db.session.rollback()
+        _record_metrics(report, time.perf_counter() - start, e)
+        raise
+    duration = time.perf_counter() - start
+    if not dry_run:
+        _record_metrics(report, duration)
+        if report.files_deleted:
+            logger.info("已清除 %d 個檔案，共 %.1f MB (%.1f ms)",
+                        report.files_deleted, report.bytes_deleted / 1024 / 1024, duration * 1000)
+    return report
+
+
+class FileSweeper:
+    """
+    在每個 worker 行程中定期執行 sweep_files 的背景執行緒。
+    用法與 Flask 擴充套件相同；FILE_GC_ENABLED 為 False 時不啟動 (改用 cron 執行 sweep_files.py)。
+    """
+
+    DEFAULTS = {
+        'FILE_GC_ENABLED': False,
+        'FILE_GC_INTERVAL': 3600,
+        'FILE_GC_BATCH_SIZE': 200,
+        'FILE_GC_IMAGE_GRACE_HOURS': 72,
+        'FILE_GC_MAX_ATTEMPTS': 5,
+        'API_DELETED_SPEC_RETENTION_DAYS': 90,
+    }
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self.app = None
+        self.config = dict(self.DEFAULTS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.config = {key: app.config.get(key, default) for key, default in self.DEFAULTS.items()}
+        app.extensions['file_sweeper'] = self
+        if self.config['FILE_GC_ENABLED']:
+            # 在 worker fork 之後的第一個請求才啟動，避免執行緒留在 master 行程中
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='file-gc', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def sweep(self, dry_run=False, scan_storage=False):
+        return sweep_files(
+            dry_run=dry_run,
+            batch_size=self.config['FILE_GC_BATCH_SIZE'],
+            image_grace_hours=self.config['FILE_GC_IMAGE_GRACE_HOURS'],
+            max_attempts=self.config['FILE_GC_MAX_ATTEMPTS'],
+            scan_storage=scan_storage,
+            deleted_spec_retention_days=self.config['API_DELETED_SPEC_RETENTION_DAYS'],
+        )
+
+    def _run(self):
+        interval = self.config['FILE_GC_INTERVAL']
+        # 錯開各 worker 的執行時間
+        self._wake.wait(random.uniform(0, min(interval, 60)))
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.sweep()
+            except Exception as e:
+                logger.error("檔案清除失敗: %s", e)
+            self._wake.wait(interval)
+
+    def wake(self):
+        """有新的檔案被標記 (例如刪除規範) 時提早執行下一次清除；未啟用時不做任何事"""
+        if self._thread is not None:
+            self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+file_sweeper = FileSweeper()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+檔案上傳與下載
+
+上傳：分塊寫入暫存檔並同時計算 SHA-256，完成後以 rename 原子地放到目的路徑。
+下載：支援 ETag / Last-Modified 條件式請求 (304)、HTTP Range (206)，
+並可設定 FILE_SERVE_MODE 交由前端代理 (nginx X-Accel-Redirect / Apache X-Sendfile) 傳送檔案。
+"""
+import hashlib
+import mimetypes
+import os
+import tempfile
+from urllib.parse import quote
+
+from flask import current_app, request
+from werkzeug.utils import send_file
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_upload(file_storage, path):
+    """將上傳的檔案 (或任何可讀取的串流) 分塊寫入 path，回傳 (sha256, size_bytes)"""
+    stream = getattr(file_storage, 'stream', file_storage)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest.hexdigest(), size
+
+
+def serve_file(path, download_name=None, etag=None, as_attachment=True):
+    """
+    傳送檔案並處理條件式請求與 Range。
+    etag 為已知的內容雜湊 (例如 Upload.sha256)，未提供時依 mtime/size 產生。
+    """
+    mode = current_app.config.get('FILE_SERVE_MODE', '')
+    download_name = download_name or os.path.basename(path)
+
+    if mode == 'x-accel':
+        return _x_accel_response(path, download_name, etag, as_attachment)
+
+    response = send_file(
+        path,
+        request.environ,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=True,
+        etag=etag or True,
+        use_x_sendfile=(mode == 'x-sendfile'),
+        response_class=current_app.response_class,
+    )
+    response.cache_control.private = True
+    return response
+
+
+def _x_accel_response(path, download_name, etag, as_attachment):
+    """只回傳標頭，由 nginx 依 X-Accel-Redirect 的內部路徑傳送檔案 (Range 由 nginx 處理)"""
+    st = os.stat(path)
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    response = current_app.response_class(mimetype=mimetype)
+    prefix = current_app.config.get('X_ACCEL_REDIRECT_PREFIX', '/protected').rstrip('/')
+    relative = os.path.relpath(os.path.abspath(path), BASE_DIR).replace(os.sep, '/')
+    response.headers['X-Accel-Redirect'] = f"{prefix}/{relative}"
+    if as_attachment:
+        try:
+            download_name.encode('ascii')
+            response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        except UnicodeEncodeError:
+            quoted = quote(download_name, safe="!#$&+^`|~")
+            response.headers.set('Content-Disposition', 'attachment', **{'filename*': f"UTF-8''{quoted}"})
+    response.set_etag(etag or f"{st.st_mtime}-{st.st_size}")
+    response.last_modified = st.st_mtime
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    return response.make_conditional(request)
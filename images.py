@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+上傳圖片的處理與中繼資料
+
+上傳的圖片依內容雜湊命名，相同內容只保存一份；背景 worker 會將過寬的圖片
+縮小到模板使用的最大寬度 (130 mm @ 96 dpi)、重新壓縮並產生編輯器用的縮圖。
+像素尺寸、檔案大小與內容雜湊記錄在 image_asset 資料表，渲染文件時由記憶體快取
+取得尺寸，快取未命中才查詢資料表；沒有中繼資料的舊圖片才退回以 PIL 開檔讀取。
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import has_app_context
+from PIL import Image, ImageOps
+from sqlalchemy.exc import IntegrityError
+
+from preview_cache import referenced_images
+from storage import storage, image_key, thumbnail_key, LEGACY_IMAGE_FOLDER
+
+logger = logging.getLogger(__name__)
+
+IMAGE_URL_PREFIX = '/static/uploads/images/'
+
+# Pillow 格式 -> 儲存的副檔名；其他格式一律轉存為 PNG
+_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+
+_CACHE_SIZE = 4096
+
+# filename (image_asset) 或絕對路徑 (舊圖片) -> (width, height)
+_dimension_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cache_set(key, size):
+    with _cache_lock:
+        if len(_dimension_cache) >= _CACHE_SIZE:
+            _dimension_cache.clear()
+        _dimension_cache[key] = size
+
+
+def _asset_filename(path):
+    """若路徑為上傳的圖片 (storage 中或舊的圖片資料夾)，回傳其檔名 (image_asset 的 key)"""
+    path = os.path.abspath(path)
+    filename = os.path.basename(path)
+    if os.path.dirname(path) == LEGACY_IMAGE_FOLDER or path.replace(os.sep, '/').endswith('/' + image_key(filename)):
+        return filename
+    return None
+
+
+def describe_image(data):
+    """解析圖片位元組，回傳 (width, height, format)；非圖片時拋出 ValueError"""
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            return im.width, im.height, im.format
+    except Exception as e:
+        raise ValueError(f"無法辨識的圖片格式: {e}")
+
+
+def image_url(filename):
+    return IMAGE_URL_PREFIX + filename
+
+
+def thumbnail_url(filename):
+    return f"{IMAGE_URL_PREFIX}thumbs/{os.path.splitext(filename)[0]}.jpg"
+
+
+def referenced_filenames(values):
+    """表單值 (或 {'content': 規範內容}) 中引用的上傳圖片檔名"""
+    filenames = set()
+    for src in referenced_images(values):
+        index = src.find(IMAGE_URL_PREFIX)
+        if index == -1:
+            continue
+        filename = os.path.basename(src[index + len(IMAGE_URL_PREFIX):].split('?', 1)[0])
+        if filename:
+            filenames.add(filename)
+    return sorted(filenames)
+
+
+class ImagePipeline:
+    """
+    圖片上傳處理流程：依內容雜湊去重、同步寫入原檔後立即回傳，
+    縮圖/重新壓縮/產生縮圖交給背景執行緒池。用法與 Flask 擴充套件相同。
+    """
+
+    DEFAULTS = {
+        'IMAGE_MAX_WIDTH_PX': round(130 / 25.4 * 96),
+        'IMAGE_JPEG_QUALITY': 85,
+        'IMAGE_THUMBNAIL_SIZE': 240,
+        'IMAGE_PIPELINE_WORKERS': 2,
+    }
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.app = None
+        self.config = dict(self.DEFAULTS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.config = {key: app.config.get(key, default) for key, default in self.DEFAULTS.items()}
+        app.extensions['image_pipeline'] = self
+
+    def _submit(self, fn, *args):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.config['IMAGE_PIPELINE_WORKERS'], thread_name_prefix='image-pipeline')
+                    self._pid = os.getpid()
+        return self._executor.submit(fn, *args)
+
+    def ingest(self, data):
+        """
+        儲存上傳的圖片，回傳 (filename, duplicated)。
+        相同內容的圖片已存在時直接回傳既有檔名，不重複儲存。
+        """
+        from models import db, ImageAsset, FileTombstone
+
+        width, height, fmt = describe_image(data)
+        sha256 = hashlib.sha256(data).hexdigest()
+        filename = sha256[:32] + _EXTENSIONS.get(fmt, '.png')
+
+        now = datetime.utcnow()
+        existing = ImageAsset.query.filter_by(sha256=sha256).first()
+        if existing is not None and storage.exists(image_key(existing.filename)):
+            # 重新開始保留期間，編輯中的規範尚未儲存前不會被 file_gc 清除
+            existing.last_uploaded_at = now
+            db.session.commit()
+            return existing.filename, True
+
+        # 先寫入原檔讓回傳的網址立即可用，縮小與重新壓縮稍後以原子替換的方式完成
+        storage.save_bytes(image_key(filename), data)
+        # 先前被清除的圖片重新上傳時，取消尚未執行的刪除
+        FileTombstone.query.filter(FileTombstone.key.in_([image_key(filename), thumbnail_key(filename)])).delete(
+            synchronize_session=False)
+        if existing is None:
+            db.session.add(ImageAsset(filename=filename, width=width, height=height, size_bytes=len(data),
+                                      sha256=sha256, created_at=now, last_uploaded_at=now))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # 同一張圖片同時被上傳兩次，另一個請求已建立紀錄
+                db.session.rollback()
+                return filename, True
+        else:
+            existing.last_uploaded_at = now
+            db.session.commit()
+        _cache_set(filename, (width, height))
+
+        self._submit(self._process, filename)
+        return filename, False
+
+    def _process(self, filename):
+        try:
+            self.process(filename)
+        except Exception as e:
+            logger.error("圖片處理失敗 %s: %s", filename, e)
+
+    def process(self, filename):
+        """縮小、重新壓縮並產生縮圖，完成後更新 image_asset 的尺寸與大小"""
+        key = image_key(filename)
+        with storage.open(key) as f:
+            original = f.read()
+        size_bytes = len(original)
+        max_width = self.config['IMAGE_MAX_WIDTH_PX']
+        with Image.open(io.BytesIO(original)) as im:
+            fmt = im.format
+            im.load()
+            # 手機照片依 EXIF 方向轉正，之後重新壓縮時不再保留 EXIF
+            image = ImageOps.exif_transpose(im) if fmt != 'GIF' else im.copy()
+
+        # GIF 保留原檔 (可能為動畫)，只產生縮圖
+        if fmt != 'GIF':
+            if image.width > max_width:
+                height = max(1, round(image.height * max_width / image.width))
+                image = image.resize((max_width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            if fmt == 'JPEG':
+                image.convert('RGB').save(buffer, 'JPEG', quality=self.config['IMAGE_JPEG_QUALITY'],
+                                          optimize=True, progressive=True)
+            elif fmt == 'WEBP':
+                image.save(buffer, 'WEBP', quality=self.config['IMAGE_JPEG_QUALITY'], method=6)
+            else:
+                image.save(buffer, 'PNG', optimize=True)
+            encoded = buffer.getvalue()
+            changed = fmt not in _EXTENSIONS or image.size != (im.width, im.height)
+            if encoded and (changed or len(encoded) < size_bytes):
+                storage.save_bytes(key, encoded)
+                size_bytes = len(encoded)
+
+        thumb = image.copy()
+        thumb.thumbnail((self.config['IMAGE_THUMBNAIL_SIZE'],) * 2)
+        buffer = io.BytesIO()
+        thumb.convert('RGB').save(buffer, 'JPEG', quality=75, optimize=True)
+        storage.save_bytes(thumbnail_key(filename), buffer.getvalue())
+
+        size = (image.width, image.height)
+        _cache_set(filename, size)
+        if self.app is not None:
+            from models import db, ImageAsset
+
+            with self.app.app_context():
+                ImageAsset.query.filter_by(filename=filename).update({
+                    'width': size[0],
+                    'height': size[1],
+                    'size_bytes': size_bytes,
+                })
+                db.session.commit()
+
+
+def image_sizes(paths):
+    """
+    批次取得圖片尺寸，回傳 {path: (width, height)}；找不到的圖片不會出現在結果中。
+    依序查詢記憶體快取 → image_asset 資料表 → PIL (僅限沒有中繼資料的舊圖片)。
+    """
+    sizes = {}
+    missing = {}
+    for path in paths:
+        key = _asset_filename(path) or os.path.abspath(path)
+        with _cache_lock:
+            size = _dimension_cache.get(key)
+        if size is not None:
+            sizes[path] = size
+        else:
+            missing[path] = key
+
+    asset_names = {key for key in missing.values() if not os.path.isabs(key)}
+    if asset_names and has_app_context():
+        from models import ImageAsset
+
+        rows = ImageAsset.query.with_entities(
+            ImageAsset.filename, ImageAsset.width, ImageAsset.height
+        ).filter(ImageAsset.filename.in_(asset_names)).all()
+        found = {row.filename: (row.width, row.height) for row in rows}
+        for path, key in list(missing.items()):
+            if key in found:
+                sizes[path] = found[key]
+                _cache_set(key, found[key])
+                del missing[path]
+
+    for path, key in missing.items():
+        try:
+            with Image.open(path) as im:
+                size = im.size
+        except (OSError, ValueError):
+            continue
+        sizes[path] = size
+        _cache_set(key, size)
+    return sizes
+
+
+image_pipeline = ImagePipeline()
@@ -5,6 +5,8 @@ import string
 from flask import Flask
 from werkzeug.security import generate_password_hash
 from models import db, User
+from search import rebuild_search_index
+from migrations import stamp_latest
 from config import Config
 
 def create_default_admin(app):
@@ -45,6 +47,9 @@ def init_database(app):
         print("   - 所有舊資料表已刪除。")
         db.create_all()
         print("   - 所有新資料表已根據 models.py 建立。")
+        rebuild_search_index()
+        print("   - 全文檢索索引已建立。")
+        stamp_latest()
         print("✅ 資料庫結構已成功初始化！")
 
 if __name__ == '__main__':
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+規範狀態的批次變更 (展延 / 終止)
+
+一次請求處理多筆規範：先以一次查詢取得所有規範目前的狀態並逐筆判斷是否可執行，
+可執行的部分以單一 UPDATE 變更、歷史紀錄批次寫入，整批在同一個交易中 commit。
+回傳每筆規範的處理結果。
+"""
+from datetime import date
+
+from sqlalchemy import bindparam
+
+from audit import record_history
+from changes import mark_specs_changed
+from dashboard import record_change, snapshot
+from models import db, TempSpec
+from pagination import invalidate_counts
+
+OK = 'ok'
+NOT_FOUND = 'not_found'
+SKIPPED = 'skipped'
+
+# 可展延 / 終止的狀態
+EXTENDABLE = ('active', 'expired')
+TERMINABLE = ('active',)
+
+
+class BulkResult:
+    """批次作業中單筆規範的結果"""
+    __slots__ = ('spec_id', 'spec_code', 'outcome', 'message')
+
+    def __init__(self, spec_id, spec_code, outcome, message):
+        self.spec_id = spec_id
+        self.spec_code = spec_code
+        self.outcome = outcome
+        self.message = message
+
+    def to_dict(self):
+        return {'id': self.spec_id, 'spec_code': self.spec_code, 'outcome': self.outcome, 'message': self.message}
+
+
+def _load_for_update(spec_ids):
+    return {row.id: row for row in db.session.query(
+        TempSpec.id, TempSpec.spec_code, TempSpec.status, TempSpec.end_date,
+        TempSpec.applicant, TempSpec.extension_count, TempSpec.created_at,
+    ).filter(TempSpec.id.in_(spec_ids)).with_for_update()}
+
+
+def _update(spec_ids, allowed_statuses, values):
+    """
+    以單一 UPDATE 變更 spec_ids 中狀態仍在 allowed_statuses 內的規範，回傳實際更新的 id。
+    SQLite 沒有資料列鎖，以 RETURNING 取得實際更新的資料列；其他資料庫已由 _load_for_update 鎖定。
+    """
+    table = TempSpec.__table__
+    statement = table.update().where(
+        table.c.id.in_(bindparam('ids', expanding=True)),
+        table.c.status.in_(allowed_statuses),
+    ).values(**values)
+    params = {'ids': list(spec_ids)}
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return {row[0] for row in db.session.execute(statement.returning(table.c.id), params)}
+    db.session.execute(statement, params)
+    return set(spec_ids)
+
+
+def _run(spec_ids, user_id, check, allowed_statuses, values, action, details, transition):
+    """transition(snapshot) 回傳規範更新後的 snapshot，用於更新儀表板統計"""
+    spec_ids = list(dict.fromkeys(spec_ids))
+    current = _load_for_update(spec_ids)
+    results = {}
+    eligible = []
+    for spec_id in spec_ids:
+        row = current.get(spec_id)
+        if row is None:
+            results[spec_id] = BulkResult(spec_id, None, NOT_FOUND, '找不到此規範')
+            continue
+        reason = check(row)
+        if reason:
+            results[spec_id] = BulkResult(spec_id, row.spec_code, SKIPPED, reason)
+        else:
+            eligible.append(spec_id)
+
+    updated = _update(eligible, allowed_statuses, values) if eligible else set()
+    mark_specs_changed(updated)
+    for spec_id in eligible:
+        row = current[spec_id]
+        if spec_id in updated:
+            before = snapshot(row)
+            record_change(before, transition(before))
+            record_history(spec_id, action, details(row), user_id=user_id)
+            results[spec_id] = BulkResult(spec_id, row.spec_code, OK, '完成')
+        else:
+            results[spec_id] = BulkResult(spec_id, row.spec_code, SKIPPED, '狀態已被其他操作變更')
+    db.session.commit()
+    if updated:
+        invalidate_counts()
+    return [results[spec_id] for spec_id in spec_ids]
+
+
+def bulk_extend(spec_ids, new_end_date, user_id):
+    """將規範的結束日期展延至 new_end_date (已過期的規範會重新生效)"""
+    def check(row):
+        if row.status not in EXTENDABLE:
+            return '只有已生效或已過期的規範可以展延'
+        if row.end_date and new_end_date <= row.end_date:
+            return f"新的結束日期必須晚於目前的 {row.end_date.strftime('%Y-%m-%d')}"
+        return None
+
+    values = {
+        'end_date': new_end_date,
+        'status': 'active',
+        'extension_count': db.func.coalesce(TempSpec.__table__.c.extension_count, 0) + 1,
+    }
+    return _run(spec_ids, user_id, check, EXTENDABLE, values, '展延',
+                lambda row: f"批次展延結束日期至 {new_end_date.strftime('%Y-%m-%d')}",
+                lambda snap: snap._replace(status='active', end_date=new_end_date,
+                                           extension_count=snap.extension_count + 1))
+
+
+def bulk_terminate(spec_ids, reason, user_id):
+    """提早終止規範"""
+    def check(row):
+        if row.status not in TERMINABLE:
+            return '只有已生效的規範可以終止'
+        return None
+
+    today = date.today()
+    values = {'status': 'terminated', 'termination_reason': reason, 'end_date': today}
+    return _run(spec_ids, user_id, check, TERMINABLE, values, '終止',
+                lambda row: f"批次終止，原因: {reason}",
+                lambda snap: snap._replace(status='terminated', end_date=today))
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+登入密碼驗證與登入紀錄
+
+- 密碼雜湊 (scrypt/pbkdf2) 是 CPU 密集的工作，交給有上限的執行緒池處理 (hashlib 計算時會釋放 GIL)，
+  整個班別同時登入時最多只有 PASSWORD_VERIFY_WORKERS 個雜湊同時計算，
+  等待中的驗證超過 PASSWORD_VERIFY_MAX_PENDING 時直接回應忙碌，不會把所有 WSGI 執行緒卡住。
+- 儲存的雜湊參數與目前設定 (PASSWORD_HASH_METHOD) 不同時，登入成功後以新參數重新雜湊。
+- last_login 與重新雜湊的結果先放在記憶體中，由背景執行緒每 LAST_LOGIN_FLUSH_INTERVAL 秒批次寫入。
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class LoginBusy(Exception):
+    """等待驗證的登入過多或驗證逾時"""
+
+
+def hash_parameters(password_hash):
+    """雜湊字串中的方法與參數部分，例如 'scrypt:32768:8:1'"""
+    return password_hash.split('$', 1)[0]
+
+
+class LoginService:
+    """密碼驗證執行緒池與 last_login 批次寫入。用法與 Flask 擴充套件相同。"""
+
+    DEFAULTS = {
+        'PASSWORD_HASH_METHOD': 'scrypt',
+        'PASSWORD_VERIFY_WORKERS': 2,
+        'PASSWORD_VERIFY_MAX_PENDING': 64,
+        'PASSWORD_VERIFY_TIMEOUT': 15,
+        'LAST_LOGIN_FLUSH_INTERVAL': 5,
+    }
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._slots = None
+        self._flusher = None
+        self._pending_logins = {}
+        self._pending_rehash = {}
+        self._current_parameters = None
+        self.app = None
+        self.config = dict(self.DEFAULTS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.config = {key: app.config.get(key, default) for key, default in self.DEFAULTS.items()}
+        app.extensions['login_service'] = self
+        atexit.register(self.flush)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            workers = self.config['PASSWORD_VERIFY_WORKERS']
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-verify')
+            self._slots = threading.BoundedSemaphore(workers + self.config['PASSWORD_VERIFY_MAX_PENDING'])
+            self._flusher = threading.Thread(target=self._flush_loop, name='last-login-writer', daemon=True)
+            self._flusher.start()
+            self._pid = os.getpid()
+
+    @property
+    def current_parameters(self):
+        if self._current_parameters is None:
+            self._current_parameters = hash_parameters(
+                generate_password_hash('', method=self.config['PASSWORD_HASH_METHOD']))
+        return self._current_parameters
+
+    def hash_password(self, password):
+        return generate_password_hash(password, method=self.config['PASSWORD_HASH_METHOD'])
+
+    def needs_rehash(self, password_hash):
+        return hash_parameters(password_hash) != self.current_parameters
+
+    def _verify(self, password_hash, password):
+        if not check_password_hash(password_hash, password):
+            return False, None
+        if self.needs_rehash(password_hash):
+            return True, self.hash_password(password)
+        return True, None
+
+    def verify(self, user, password):
+        """
+        在驗證執行緒池中比對密碼，回傳是否正確。
+        等待中的驗證已滿或逾時時拋出 LoginBusy。
+        """
+        self._ensure_started()
+        if not self._slots.acquire(blocking=False):
+            raise LoginBusy("登入人數過多，請稍後再試。")
+        try:
+            future = self._executor.submit(self._verify, user.password_hash, password)
+            try:
+                ok, new_hash = future.result(timeout=self.config['PASSWORD_VERIFY_TIMEOUT'])
+            except FutureTimeout:
+                future.cancel()
+                raise LoginBusy("登入驗證逾時，請稍後再試。")
+        finally:
+            self._slots.release()
+
+        if ok and new_hash is not None:
+            with self._lock:
+                self._pending_rehash[user.id] = (user.password_hash, new_hash)
+        return ok
+
+    def record_login(self, user_id, when=None):
+        """記錄登入時間，稍後與其他登入一起批次寫入"""
+        self._ensure_started()
+        with self._lock:
+            self._pending_logins[user_id] = when or datetime.now()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.config['LAST_LOGIN_FLUSH_INTERVAL'])
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception as e:
+                logger.error("寫入登入紀錄失敗: %s", e)
+
+    def flush(self):
+        """將暫存的 last_login 與重新雜湊的密碼寫入資料庫，回傳寫入的筆數"""
+        with self._lock:
+            logins, self._pending_logins = self._pending_logins, {}
+            rehashes, self._pending_rehash = self._pending_rehash, {}
+        if not logins and not rehashes:
+            return 0
+        if self.app is None:
+            return 0
+
+        from flask import has_app_context
+        if not has_app_context():
+            with self.app.app_context():
+                return self._write(logins, rehashes)
+        return self._write(logins, rehashes)
+
+    def _write(self, logins, rehashes):
+        from models import db, User
+
+        # 使用 Core UPDATE 批次寫入：登入後才被刪除的使用者直接略過，不視為錯誤
+        table = User.__table__
+        try:
+            if logins:
+                db.session.execute(
+                    table.update().where(table.c.id == db.bindparam('user_id'))
+                    .values(last_login=db.bindparam('when')),
+                    [{'user_id': user_id, 'when': when} for user_id, when in logins.items()]
+                )
+            if rehashes:
+                # 只在密碼未被變更時才替換，避免覆蓋管理者剛設定的新密碼
+                db.session.execute(
+                    table.update()
+                    .where(table.c.id == db.bindparam('user_id'), table.c.password_hash == db.bindparam('old_hash'))
+                    .values(password_hash=db.bindparam('new_hash')),
+                    [{'user_id': user_id, 'old_hash': old_hash, 'new_hash': new_hash}
+                     for user_id, (old_hash, new_hash) in rehashes.items()]
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # 寫入失敗時放回暫存，下次再試 (較新的登入時間優先)
+            with self._lock:
+                for user_id, when in logins.items():
+                    self._pending_logins.setdefault(user_id, when)
+                for user_id, pair in rehashes.items():
+                    self._pending_rehash.setdefault(user_id, pair)
+            raise
+        return len(logins) + len(rehashes)
+
+
+login_service = LoginService()
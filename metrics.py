@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+效能指標 (Prometheus 文字格式)
+
+- 文件產生各階段的耗時 (模板載入、Markdown 解析、圖片、docx 渲染、存檔、PDF 轉檔)
+- 每個請求的耗時、資料庫查詢次數與查詢耗時 (依 endpoint)
+- PDF 轉檔佇列長度、等待與轉檔時間，以及到期處理 / 檔案清除 / 儀表板統計校正的執行統計
+
+METRICS_ENABLED 為 False (預設) 時計時器與查詢計數都直接略過，/metrics 回應 404；
+regenerate_docs.py 等沒有呼叫 init_app 的程序也不會記錄。
+指標存放在各 worker 程序的記憶體中，多個 worker 時 Prometheus 需分別抓取 (或以 pid 標籤區分)。
+設定 METRICS_TOKEN 後 /metrics 需帶 Authorization: Bearer <token>。
+"""
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import abort, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 秒數的預設分界；轉檔與整份文件的產生可能需要數十秒
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_registry = []
+_enabled = False
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [各分界的計數..., sum, count]
+        self._values = {}
+
+    def observe(self, value, *labels):
+        if not _enabled:
+            return
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """計時 with 區塊；停用時不呼叫計時函式"""
+        if not _enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self):
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        lines = []
+        for labels, state in items:
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-2] + [state[-1]]):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {count}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{label_text} {state[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """抓取時才呼叫 fn 取得目前的值；fn 回傳數值，或 {標籤值 tuple: 數值}"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, fn, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+
+    def collect(self):
+        value = self.fn()
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}"
+                for labels, v in sorted(value.items())]
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        try:
+            samples = metric.collect()
+        except Exception:
+            # 單一指標取值失敗不影響其他指標
+            continue
+        lines.extend(metric.header())
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+# ---------------------------------------------------------------------------
+# 指標定義
+# ---------------------------------------------------------------------------
+
+render_stage_seconds = Histogram(
+    'spec_render_stage_seconds', '文件產生各階段的耗時 (template / markdown / images / render / save / pdf / total)',
+    ('stage',))
+http_request_seconds = Histogram(
+    'http_request_duration_seconds', '請求處理時間', ('endpoint', 'method'))
+http_requests_total = Counter(
+    'http_requests_total', '請求數', ('endpoint', 'method', 'status'))
+db_queries_per_request = Histogram(
+    'http_request_db_queries', '每個請求執行的資料庫查詢數', ('endpoint',), buckets=QUERY_COUNT_BUCKETS)
+db_seconds_per_request = Histogram(
+    'http_request_db_seconds', '每個請求的資料庫查詢總耗時', ('endpoint',))
+conversion_wait_seconds = Histogram(
+    'pdf_conversion_queue_wait_seconds', 'PDF 轉檔工作在佇列中等待的時間')
+conversion_seconds = Histogram(
+    'pdf_conversion_seconds', 'PDF 轉檔後端實際轉檔的時間', ('backend', 'result'))
+
+
+def _conversion_queue_depth():
+    from converter import conversion_pool
+    return conversion_pool.queue_depth()
+
+
+def _conversion_workers():
+    from converter import conversion_pool
+    return len(conversion_pool._workers)
+
+
+def _job_stats(module_name):
+    """到期處理 / 檔案清除模組的 metrics dict 中的數值欄位"""
+    def collect():
+        import importlib
+        stats = importlib.import_module(module_name).metrics
+        return {(key,): value for key, value in stats.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)}
+    return collect
+
+
+Gauge('pdf_conversion_queue_depth', '等待中的 PDF 轉檔工作數', _conversion_queue_depth)
+Gauge('pdf_conversion_workers', '執行中的 PDF 轉檔 worker 數', _conversion_workers)
+Gauge('spec_expiry_stats', '本程序到期處理的執行統計 (expiry.metrics)', _job_stats('expiry'), ('field',))
+Gauge('file_gc_stats', '本程序檔案清除的執行統計 (file_gc.metrics)', _job_stats('file_gc'), ('field',))
+Gauge('dashboard_reconcile_stats', '本程序儀表板統計校正的執行統計 (dashboard.metrics)', _job_stats('dashboard'),
+      ('field',))
+
+
+# ---------------------------------------------------------------------------
+# 請求與資料庫查詢
+# ---------------------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 開始時間存放在本次執行的 context：查詢失敗時不會觸發 after_cursor_execute，context 隨之丟棄，
+    # 不會在連線池的連線上留下殘留值
+    if context is not None and has_request_context() and 'metrics_db_queries' in g:
+        context._metrics_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_metrics_query_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    if has_request_context() and 'metrics_db_queries' in g:
+        g.metrics_db_queries += 1
+        g.metrics_db_seconds += elapsed
+
+
+class MetricsExporter:
+    """請求、資料庫查詢與 /metrics 端點。用法與 Flask 擴充套件相同。"""
+
+    DEFAULTS = {
+        'METRICS_ENABLED': False,
+        'METRICS_TOKEN': '',
+        # 在回應加上 Server-Timing 標頭 (瀏覽器開發者工具可看到資料庫與處理時間)
+        'METRICS_SERVER_TIMING': False,
+    }
+
+    def __init__(self, app=None):
+        self.config = dict(self.DEFAULTS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        global _enabled
+        self.config = {key: app.config.get(key, default) for key, default in self.DEFAULTS.items()}
+        app.extensions['metrics_exporter'] = self
+        app.add_url_rule('/metrics', 'metrics', self._view)
+        if not self.config['METRICS_ENABLED']:
+            return
+        _enabled = True
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_db_queries = 0
+        g.metrics_db_seconds = 0.0
+
+    def _finish_request(self, response):
+        if 'metrics_start' not in g or request.endpoint == 'metrics':
+            return response
+        elapsed = time.perf_counter() - g.metrics_start
+        endpoint = request.endpoint or 'unknown'
+        http_request_seconds.observe(elapsed, endpoint, request.method)
+        http_requests_total.inc(endpoint, request.method, str(response.status_code))
+        db_queries_per_request.observe(g.metrics_db_queries, endpoint)
+        db_seconds_per_request.observe(g.metrics_db_seconds, endpoint)
+        if self.config['METRICS_SERVER_TIMING']:
+            response.headers.add('Server-Timing', f'db;dur={g.metrics_db_seconds * 1000:.1f};'
+                                                  f'desc="{g.metrics_db_queries} queries"')
+            response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.1f}')
+        return response
+
+    def _view(self):
+        if not self.config['METRICS_ENABLED']:
+            abort(404)
+        token = self.config['METRICS_TOKEN']
+        if token:
+            supplied = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+                abort(403)
+        response = current_app.response_class(render_metrics(), mimetype='text/plain')
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+
+metrics_exporter = MetricsExporter()
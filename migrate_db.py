@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+在不刪除資料的情況下將資料庫結構更新到最新版本。
+
+    python migrate_db.py            # 套用所有尚未執行的遷移
+    python migrate_db.py --status   # 只顯示目前版本與待執行的遷移
+"""
+import sys
+from flask import Flask
+from models import db
+from config import Config
+from migrations import current_version, pending_migrations, upgrade, LATEST_VERSION
+
+if __name__ == '__main__':
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+
+    with app.app_context():
+        print(f"ℹ️  目前資料庫版本: {current_version()} (最新: {LATEST_VERSION})")
+        pending = pending_migrations()
+        if not pending:
+            print("✅ 資料庫結構已是最新版本。")
+            sys.exit(0)
+
+        if '--status' in sys.argv:
+            print("待執行的遷移:")
+            for version, description, _ in pending:
+                print(f"   - [{version}] {description}")
+            sys.exit(0)
+
+        print("🔄 開始套用資料庫遷移...")
+        upgrade()
+        print(f"✅ 資料庫已更新至版本 {current_version()}。")
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+將舊版平坦資料夾 (generated/、uploads/、static/uploads/images/) 中的檔案搬移到 storage 的分層配置
+(或 S3 相容儲存)。可以重複執行：已搬移的檔案不會再處理，中斷後重新執行即可繼續。
+
+    python migrate_storage.py --dry-run   # 只統計需要搬移的檔案
+    python migrate_storage.py             # 搬移 (完成後刪除舊檔案)
+    python migrate_storage.py --keep      # 複製，保留舊檔案
+"""
+import argparse
+import os
+from flask import Flask
+from models import db, TempSpec, Upload
+from config import Config
+from storage import storage, document_key, signed_key, image_key, thumbnail_key, LEGACY_IMAGE_FOLDER
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BATCH_SIZE = 500
+
+
+def spec_files():
+    """依資料庫紀錄產生 (舊路徑, key)：產生的文件與簽核檔案"""
+    generated_folder = os.path.join(BASE_DIR, Config.GENERATED_FOLDER)
+    upload_folder = os.path.join(BASE_DIR, Config.UPLOAD_FOLDER)
+    last_id = 0
+    while True:
+        specs = db.session.query(TempSpec.id, TempSpec.spec_code, TempSpec.created_at).filter(
+            TempSpec.id > last_id).order_by(TempSpec.id).limit(BATCH_SIZE).all()
+        if not specs:
+            return
+        by_id = {spec.id: spec for spec in specs}
+        for spec in specs:
+            for ext in ('docx', 'pdf'):
+                yield (os.path.join(generated_folder, f"{spec.spec_code}.{ext}"),
+                       document_key(spec.spec_code, ext, spec.created_at))
+        for upload in db.session.query(Upload.temp_spec_id, Upload.filename).filter(Upload.temp_spec_id.in_(by_id)):
+            spec = by_id[upload.temp_spec_id]
+            yield os.path.join(upload_folder, upload.filename), signed_key(spec.spec_code, upload.filename, spec.created_at)
+        last_id = specs[-1].id
+
+
+def image_files():
+    """舊圖片資料夾中的所有圖片與縮圖"""
+    for folder, make_key in ((LEGACY_IMAGE_FOLDER, image_key), (os.path.join(LEGACY_IMAGE_FOLDER, 'thumbs'), thumbnail_key)):
+        if not os.path.isdir(folder):
+            continue
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(('.tmp', '.part')) and not entry.name.startswith('.'):
+                    yield entry.path, make_key(entry.name)
+
+
+def migrate_one(path, key, keep, dry_run):
+    """回傳 'moved'、'done' (目的地已有相同大小的檔案) 或 'conflict'；舊檔案不存在時回傳 None"""
+    if not os.path.isfile(path):
+        return None
+    target = storage.backend.stat(key)
+    if target is not None:
+        if target[0] != os.path.getsize(path):
+            return 'conflict'
+        if not keep and not dry_run:
+            os.remove(path)
+        return 'done'
+    if not dry_run:
+        storage.backend.save_file(key, path, move=not keep)
+    return 'moved'
+
+
+def leftovers(folder):
+    """搬移後仍留在舊資料夾中 (資料庫沒有對應紀錄) 的檔案"""
+    if not os.path.isdir(folder):
+        return []
+    return sorted(entry.name for entry in os.scandir(folder) if entry.is_file())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='將舊版平坦資料夾中的檔案搬移到分層的檔案儲存')
+    parser.add_argument('--keep', action='store_true', help='複製到新位置並保留舊檔案')
+    parser.add_argument('--dry-run', action='store_true', help='只統計，不搬移')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    storage.init_app(app)
+
+    with app.app_context():
+        verb = '需要搬移' if args.dry_run else '已搬移'
+        print(f"🔄 搬移檔案到 {storage.config['STORAGE_BACKEND']} 儲存{' (僅統計)' if args.dry_run else ''}...")
+        conflicts = []
+        for label, files in (('文件與簽核檔案', spec_files()), ('圖片', image_files())):
+            counts = {'moved': 0, 'done': 0, 'conflict': 0}
+            for i, (path, key) in enumerate(files, 1):
+                result = migrate_one(path, key, args.keep, args.dry_run)
+                if result is not None:
+                    counts[result] += 1
+                if result == 'conflict':
+                    conflicts.append((path, key))
+                if i % 1000 == 0:
+                    print(f"   ... {label}: 已檢查 {i} 筆", flush=True)
+            print(f"   - {label}: {verb} {counts['moved']} 個、先前已搬移 {counts['done']} 個、衝突 {counts['conflict']} 個")
+
+        for path, key in conflicts[:20]:
+            print(f"   ⚠️  目的地已有不同大小的檔案，未搬移: {path} -> {key}")
+        if not args.dry_run and not args.keep:
+            for folder in (Config.GENERATED_FOLDER, Config.UPLOAD_FOLDER):
+                names = leftovers(os.path.join(BASE_DIR, folder))
+                if names:
+                    print(f"   ℹ️  {folder}/ 中仍有 {len(names)} 個沒有對應紀錄的檔案 (例如 {', '.join(names[:3])})，未處理")
+        print("✅ 完成")
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+資料庫結構遷移
+
+每個遷移步驟都以資料庫目前的實際結構為準 (已存在的資料表/欄位/索引會略過)，
+因此可以安全地重複執行，也適用於以舊版 init_db.py 建立、沒有版本紀錄的資料庫。
+步驟只能建立該版本加入的資料表/欄位/索引 (以名稱指定)，否則舊版本的資料庫會在
+之前的步驟就碰到尚不存在的欄位；新增步驟後以 check_migrations.py 確認。
+已套用的版本記錄在 schema_version 資料表。
+
+新增步驟時在 MIGRATIONS 尾端加上 (版本, 說明, 函式)，版本號遞增且不可變更。
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect, insert, text
+
+from models import db, TempSpec, Upload, SpecHistory, ImageAsset, SpecCodeSequence, SpecImage, FileTombstone, SpecStat, \
+    TableVersion, DeletedSpec
+
+VERSION_TABLE = 'schema_version'
+
+
+def _inspector():
+    return inspect(db.session.connection())
+
+
+def _add_columns(model, *names):
+    """新增資料表中尚未存在的欄位 (欄位定義取自 models.py)"""
+    table = model.__table__
+    existing = {column['name'] for column in _inspector().get_columns(table.name)}
+    dialect = db.session.get_bind().dialect
+    preparer = dialect.identifier_preparer
+    for name in names:
+        if name in existing:
+            continue
+        column = table.columns[name]
+        ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} " \
+              f"{column.type.compile(dialect=dialect)}"
+        db.session.execute(text(ddl))
+
+
+def _create_indexes(model, *names):
+    """
+    建立 names 中資料庫尚未存在的索引 (索引定義取自 models.py)。
+    每個步驟只列出該版本加入的索引，不依賴之後版本才加入的欄位。
+    """
+    if not names:
+        raise ValueError('需指定要建立的索引名稱')
+    table = model.__table__
+    indexes = {index.name: index for index in table.indexes}
+    existing = {index['name'] for index in _inspector().get_indexes(table.name)}
+    for name in names:
+        if name not in existing:
+            indexes[name].create(db.session.connection())
+
+
+def _create_image_asset():
+    ImageAsset.__table__.create(db.session.connection(), checkfirst=True)
+
+
+def _add_upload_checksum():
+    _add_columns(Upload, 'sha256', 'size_bytes')
+
+
+def _add_spec_search_columns():
+    _add_columns(TempSpec, 'lot_number', 'equipment_type')
+
+
+def _create_search_index():
+    from search import rebuild_search_index
+    db.session.commit()
+    rebuild_search_index()
+
+
+def _create_query_indexes():
+    _create_indexes(TempSpec, 'ix_temp_spec_status_created_at', 'ix_temp_spec_spec_code', 'ix_temp_spec_created_at')
+    _create_indexes(Upload, 'ix_upload_temp_spec_id_upload_time')
+    _create_indexes(SpecHistory, 'ix_spec_history_spec_id_timestamp')
+
+
+def _create_spec_code_sequence():
+    # 計數列於各月份第一次配發編號時依既有編號建立
+    SpecCodeSequence.__table__.create(db.session.connection(), checkfirst=True)
+
+
+def _add_spec_render_columns():
+    _add_columns(TempSpec, 'render_inputs', 'render_hash')
+
+
+def _create_file_gc_tables():
+    from images import referenced_filenames
+
+    _add_columns(ImageAsset, 'last_uploaded_at')
+    for model in (SpecImage, FileTombstone):
+        model.__table__.create(db.session.connection(), checkfirst=True)
+    if db.session.query(SpecImage).first() is not None:
+        return
+    # 既有規範引用的圖片由內容重建
+    last_id = 0
+    while True:
+        rows = db.session.query(TempSpec.id, TempSpec.content).filter(
+            TempSpec.id > last_id).order_by(TempSpec.id).limit(500).all()
+        if not rows:
+            return
+        refs = [{'spec_id': row.id, 'filename': filename}
+                for row in rows for filename in referenced_filenames({'content': row.content})]
+        if refs:
+            db.session.execute(insert(SpecImage), refs)
+        last_id = rows[-1].id
+
+
+def _create_spec_stat():
+    from dashboard import reconcile_stats
+
+    SpecStat.__table__.create(db.session.connection(), checkfirst=True)
+    _create_indexes(TempSpec, 'ix_temp_spec_status_end_date')
+    # 由既有規範計算初始的統計值
+    reconcile_stats()
+
+
+def _create_change_tracking():
+    for model in (TableVersion, DeletedSpec):
+        model.__table__.create(db.session.connection(), checkfirst=True)
+    _add_columns(TempSpec, 'change_version')
+    _create_indexes(TempSpec, 'ix_temp_spec_change_version')
+    # 既有規範視為同一次變更，用戶端第一次同步 (since=0) 時全部取得
+    version = db.session.query(TableVersion.version).filter_by(table_name='temp_spec').scalar()
+    if version is None:
+        version = 1
+        db.session.add(TableVersion(table_name='temp_spec', version=version))
+        db.session.flush()
+    table = TempSpec.__table__
+    db.session.execute(table.update().where(table.c.change_version.is_(None)).values(change_version=version))
+
+
+MIGRATIONS = [
+    (1, '建立 image_asset 資料表', _create_image_asset),
+    (2, 'upload 新增 sha256 / size_bytes 欄位', _add_upload_checksum),
+    (3, 'temp_spec 新增 lot_number / equipment_type 欄位', _add_spec_search_columns),
+    (4, '建立全文檢索索引', _create_search_index),
+    (5, '建立列表、上傳與歷史紀錄查詢用索引', _create_query_indexes),
+    (6, '建立 spec_code_sequence 編號計數資料表', _create_spec_code_sequence),
+    (7, 'temp_spec 新增 render_inputs / render_hash 欄位', _add_spec_render_columns),
+    (8, '建立 spec_image / file_tombstone 資料表 (檔案清除)', _create_file_gc_tables),
+    (9, '建立 spec_stat 儀表板統計資料表與 temp_spec 到期日索引', _create_spec_stat),
+    (10, '建立 table_version / deleted_spec 資料表與 temp_spec.change_version 欄位 (API 增量同步)', _create_change_tracking),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table():
+    db.session.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+        "version INTEGER NOT NULL PRIMARY KEY, "
+        "description VARCHAR(200) NOT NULL, "
+        "applied_at DATETIME NOT NULL)"
+    ))
+    db.session.commit()
+
+
+def _record(version, description):
+    db.session.execute(text(
+        f"INSERT INTO {VERSION_TABLE} (version, description, applied_at) VALUES (:version, :description, :applied_at)"
+    ), {'version': version, 'description': description, 'applied_at': datetime.now()})
+
+
+def current_version():
+    _ensure_version_table()
+    return db.session.execute(text(f"SELECT MAX(version) FROM {VERSION_TABLE}")).scalar() or 0
+
+
+def pending_migrations():
+    version = current_version()
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def upgrade(log=print):
+    """依序套用尚未執行的遷移，回傳套用的版本清單"""
+    applied = []
+    for version, description, step in pending_migrations():
+        log(f"   - [{version}] {description}")
+        try:
+            step()
+            _record(version, description)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def stamp_latest():
+    """將全新建立 (create_all) 的資料庫標記為最新版本"""
+    version = current_version()
+    for migration_version, description, _ in MIGRATIONS:
+        if migration_version > version:
+            _record(migration_version, description)
+    db.session.commit()
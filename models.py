@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.orm import column_property
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -13,6 +14,16 @@ class User(db.Model, UserMixin):
     last_login = db.Column(db.DateTime)
 
 class TempSpec(db.Model):
+    __table_args__ = (
+        # 列表依狀態篩選並依建立時間排序 / 依編號前綴查詢流水號 / 未篩選時的游標分頁
+        db.Index('ix_temp_spec_status_created_at', 'status', 'created_at'),
+        db.Index('ix_temp_spec_spec_code', 'spec_code'),
+        db.Index('ix_temp_spec_created_at', 'created_at'),
+        # 到期處理與儀表板的即將到期清單
+        db.Index('ix_temp_spec_status_end_date', 'status', 'end_date'),
+        # API 的增量同步 (依變更版本讀取)
+        db.Index('ix_temp_spec_change_version', 'change_version', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     spec_code = db.Column(db.String(20), nullable=False)
     applicant = db.Column(db.String(50))
@@ -24,21 +35,50 @@ class TempSpec(db.Model):
     created_at = db.Column(db.DateTime)
     extension_count = db.Column(db.Integer, default=0)
     termination_reason = db.Column(db.Text, nullable=True)
+    # 建立時填寫的批號與設備，供全文檢索使用
+    lot_number = db.Column(db.String(100), nullable=True)
+    equipment_type = db.Column(db.String(100), nullable=True)
+    # 產生文件時的表單值 (JSON) 與「表單值 + 模板 + 引用圖片」的雜湊，供 regenerate_docs.py 重新產生文件
+    render_inputs = db.Column(db.Text, nullable=True)
+    render_hash = db.Column(db.String(64), nullable=True)
+    # 最後一次修改此規範的交易取得的 table_version 計數 (由 changes.py 於 commit 前寫入)
+    change_version = db.Column(db.BigInteger, nullable=True)
 
     # 關聯到 Upload 和 SpecHistory，並設定級聯刪除
     uploads = db.relationship('Upload', back_populates='spec', cascade='all, delete-orphan')
     history = db.relationship('SpecHistory', back_populates='spec', cascade='all, delete-orphan')
+    images = db.relationship('SpecImage', cascade='all, delete-orphan')
 
 class Upload(db.Model):
+    __table_args__ = (
+        # 取得規範最新的上傳檔案
+        db.Index('ix_upload_temp_spec_id_upload_time', 'temp_spec_id', 'upload_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     temp_spec_id = db.Column(db.Integer, db.ForeignKey('temp_spec.id', ondelete='CASCADE'), nullable=False)
     filename = db.Column(db.String(200))
     upload_time = db.Column(db.DateTime)
+    sha256 = db.Column(db.String(64), nullable=True)
+    size_bytes = db.Column(db.BigInteger, nullable=True)
     
     spec = db.relationship('TempSpec', back_populates='uploads')
 
+# 列表頁用的上傳統計，以相關子查詢隨規範一起載入 (預設延遲載入，查詢時以 undefer 取用)
+TempSpec.upload_count = column_property(
+    db.select(db.func.count(Upload.id)).where(Upload.temp_spec_id == TempSpec.id).correlate_except(Upload).scalar_subquery(),
+    deferred=True
+)
+TempSpec.latest_upload_time = column_property(
+    db.select(db.func.max(Upload.upload_time)).where(Upload.temp_spec_id == TempSpec.id).correlate_except(Upload).scalar_subquery(),
+    deferred=True
+)
+
 class SpecHistory(db.Model):
     __tablename__ = 'SpecHistory'
+    __table_args__ = (
+        # 規範歷史紀錄依時間排序
+        db.Index('ix_spec_history_spec_id_timestamp', 'spec_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     spec_id = db.Column(db.Integer, db.ForeignKey('temp_spec.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
@@ -49,3 +89,59 @@ class SpecHistory(db.Model):
     # 建立與 User 和 TempSpec 的關聯，方便查詢
     user = db.relationship('User')
     spec = db.relationship('TempSpec', back_populates='history')
+
+class SpecCodeSequence(db.Model):
+    """每個月份編號前綴的流水號計數，配發編號時原子地遞增"""
+    __tablename__ = 'spec_code_sequence'
+    prefix = db.Column(db.String(20), primary_key=True)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+class SpecStat(db.Model):
+    """儀表板統計的彙總值 (依 metric / bucket 累計)，由生命週期操作增量更新並定期校正"""
+    __tablename__ = 'spec_stat'
+    metric = db.Column(db.String(30), primary_key=True)
+    bucket = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class TableVersion(db.Model):
+    """各資料表的變更計數，每個修改該資料表的交易遞增一次，供 API 的 ETag 與增量同步使用"""
+    __tablename__ = 'table_version'
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+class DeletedSpec(db.Model):
+    """已刪除的規範與刪除時的變更計數，讓 API 的增量同步能通知用戶端移除"""
+    __tablename__ = 'deleted_spec'
+    spec_id = db.Column(db.Integer, primary_key=True)
+    spec_code = db.Column(db.String(20), nullable=False)
+    change_version = db.Column(db.BigInteger, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ImageAsset(db.Model):
+    """上傳圖片的中繼資料，渲染文件時直接取用尺寸而不必開啟圖片"""
+    __tablename__ = 'image_asset'
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(200), unique=True, nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 最後一次被上傳 (含重複上傳) 的時間；尚未被規範引用的圖片在此之後的保留期間內不會被清除
+    last_uploaded_at = db.Column(db.DateTime, nullable=True)
+
+class SpecImage(db.Model):
+    """規範內容引用的上傳圖片；圖片依內容去重後可被多份規範共用，沒有任何引用的圖片由 file_gc 清除"""
+    __tablename__ = 'spec_image'
+    spec_id = db.Column(db.Integer, db.ForeignKey('temp_spec.id', ondelete='CASCADE'), primary_key=True)
+    filename = db.Column(db.String(200), primary_key=True, index=True)
+
+class FileTombstone(db.Model):
+    """已標記刪除、等待背景清除的檔案 (storage key)"""
+    __tablename__ = 'file_tombstone'
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(500), unique=True, nullable=False)
+    reason = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+列表分頁
+
+- KeysetPage: 以 (排序欄位, id) 為游標的分頁 (例如規範的 created_at、歷史紀錄的 timestamp)，
+  任何深度的頁面都只需一次索引範圍查詢，不使用 OFFSET。
+- RankedPage: 全文檢索的結果 (已排序且數量有上限的 id 清單) 依頁碼切片後再以 IN 查詢。
+- cached_count: 總筆數只作為顯示用途，快取一段時間而不在每次翻頁時 COUNT(*)。
+"""
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from models import db
+
+_count_cache = {}
+_count_lock = threading.Lock()
+_COUNT_CACHE_SIZE = 256
+
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value.isoformat() if sort_value else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """解析游標，格式錯誤時回傳 None (視為第一頁)"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_value, row_id = json.loads(raw)
+        return (datetime.fromisoformat(sort_value) if sort_value else None), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def cached_count(key, query):
+    """回傳 query 的筆數，結果依 key 快取 LIST_COUNT_CACHE_TTL 秒"""
+    ttl = current_app.config.get('LIST_COUNT_CACHE_TTL', 60)
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+    count = query.order_by(None).count()
+    with _count_lock:
+        if len(_count_cache) >= _COUNT_CACHE_SIZE:
+            _count_cache.clear()
+        _count_cache[key] = (count, now + ttl)
+    return count
+
+
+def invalidate_counts():
+    with _count_lock:
+        _count_cache.clear()
+
+
+class KeysetPage:
+    """依 (sort_col DESC, id DESC) 排序的游標分頁；sort_col 為日期時間欄位"""
+    truncated = False
+
+    def __init__(self, query, sort_col, id_col, per_page, after=None, before=None, total=None):
+        self.per_page = per_page
+        self.total = total
+        cursor = decode_cursor(before) or decode_cursor(after)
+        backwards = cursor is not None and decode_cursor(before) is not None
+
+        if cursor is not None:
+            sort_value, row_id = cursor
+            if backwards:
+                query = query.filter(db.or_(
+                    sort_col > sort_value,
+                    db.and_(sort_col == sort_value, id_col > row_id),
+                )).order_by(sort_col.asc(), id_col.asc())
+            else:
+                query = query.filter(db.or_(
+                    sort_col < sort_value,
+                    db.and_(sort_col == sort_value, id_col < row_id),
+                )).order_by(sort_col.desc(), id_col.desc())
+        else:
+            query = query.order_by(sort_col.desc(), id_col.desc())
+
+        # 多取一筆以判斷是否還有下一頁 (往回翻時則是上一頁)
+        rows = query.limit(per_page + 1).all()
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+            self.has_prev, self.has_next = more, True
+        else:
+            self.has_prev, self.has_next = cursor is not None, more
+        self.items = rows
+
+        first, last = (rows[0], rows[-1]) if rows else (None, None)
+        key = sort_col.key
+        self.prev_params = {'before': encode_cursor(getattr(first, key), first.id)} if first and self.has_prev else {}
+        self.next_params = {'after': encode_cursor(getattr(last, key), last.id)} if last and self.has_next else {}
+
+
+class RankedPage:
+    """已依相關度排序的 id 清單分頁；每頁只查詢該頁的資料列"""
+
+    def __init__(self, query, id_col, ranked_ids, per_page, page=1, truncated=False):
+        self.per_page = per_page
+        self.total = len(ranked_ids)
+        # ranked_ids 是否因數量上限而不完整
+        self.truncated = truncated
+        pages = max(1, -(-self.total // per_page))
+        page = min(max(page, 1), pages)
+        page_ids = ranked_ids[(page - 1) * per_page:page * per_page]
+
+        rows = query.filter(id_col.in_(page_ids)).all() if page_ids else []
+        position = {row_id: i for i, row_id in enumerate(page_ids)}
+        self.items = sorted(rows, key=lambda row: position[row.id])
+
+        self.has_prev = page > 1
+        self.has_next = page < pages
+        self.prev_params = {'page': page - 1} if self.has_prev else {}
+        self.next_params = {'page': page + 1} if self.has_next else {}
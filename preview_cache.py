@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+預覽 PDF 快取
+
+以「正規化後的表單值 + Word 模板指紋 + 引用圖片的內容雜湊」作為內容定址的 key，
+記憶體層為 LRU (筆數/大小上限 + TTL)，磁碟層在 worker 重啟後仍可命中。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_IMAGE_REF_PATTERNS = (
+    re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)'),
+    re.compile(r'<img[^>]+src=["\']([^"\']+)["\']', re.IGNORECASE),
+)
+
+# (path, mtime_ns, size) -> sha256，避免每次預覽都重新讀取模板與圖片
+_file_hash_memo = {}
+_file_hash_lock = threading.Lock()
+
+
+def file_fingerprint(path):
+    """回傳檔案內容的 sha256，依 mtime/size 快取；檔案不存在時回傳 'missing'。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 'missing'
+    memo_key = (path, st.st_mtime_ns, st.st_size)
+    with _file_hash_lock:
+        digest = _file_hash_memo.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _file_hash_lock:
+            if len(_file_hash_memo) > 4096:
+                _file_hash_memo.clear()
+            _file_hash_memo[memo_key] = digest
+    return digest
+
+
+def normalize_values(values):
+    """統一換行與尾端空白，讓內容相同的表單得到相同的 key。"""
+    normalized = {}
+    for key, value in values.items():
+        if value is None:
+            value = ''
+        if isinstance(value, str):
+            value = value.replace('\r\n', '\n').rstrip()
+        normalized[key] = value
+    return normalized
+
+
+def referenced_images(values):
+    """找出表單內容中引用的圖片 src。"""
+    srcs = set()
+    for value in values.values():
+        if not isinstance(value, str):
+            continue
+        for pattern in _IMAGE_REF_PATTERNS:
+            srcs.update(pattern.findall(value))
+    return sorted(srcs)
+
+
+class PreviewCache:
+    """兩層 (記憶體 LRU + 磁碟) 的預覽 PDF 快取。"""
+
+    DEFAULTS = {
+        'PREVIEW_CACHE_MAX_ENTRIES': 64,
+        'PREVIEW_CACHE_MAX_BYTES': 64 * 1024 * 1024,
+        'PREVIEW_CACHE_TTL': 24 * 3600,
+        'PREVIEW_CACHE_FOLDER': os.path.join('cache', 'previews'),
+        'PREVIEW_CACHE_DISK_MAX_BYTES': 512 * 1024 * 1024,
+    }
+
+    # 每寫入幾筆磁碟快取就整理一次磁碟層
+    PRUNE_EVERY = 32
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored_at, data)
+        self._bytes = 0
+        self._puts = 0
+        self.configure({})
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.configure(app.config)
+        app.extensions['preview_cache'] = self
+
+    def configure(self, mapping):
+        config = {key: mapping.get(key, default) for key, default in self.DEFAULTS.items()}
+        self.max_entries = config['PREVIEW_CACHE_MAX_ENTRIES']
+        self.max_bytes = config['PREVIEW_CACHE_MAX_BYTES']
+        self.ttl = config['PREVIEW_CACHE_TTL']
+        self.disk_max_bytes = config['PREVIEW_CACHE_DISK_MAX_BYTES']
+        folder = config['PREVIEW_CACHE_FOLDER']
+        self.folder = folder if os.path.isabs(folder) else os.path.join(BASE_DIR, folder) if folder else None
+        self.clear_memory()
+
+    def make_key(self, values, template_path, resolve_image_path):
+        """
+        產生內容定址的快取 key。
+        values 需為 normalize_values() 之後的結果；resolve_image_path 將圖片 src 轉為本地路徑。
+        """
+        h = hashlib.sha256()
+        h.update(json.dumps(values, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+        h.update(b'\0template:' + file_fingerprint(template_path).encode())
+        for src in referenced_images(values):
+            h.update(b'\0image:' + src.encode('utf-8') + b'=' + file_fingerprint(resolve_image_path(src)).encode())
+        return h.hexdigest()
+
+    # -- 記憶體層 ------------------------------------------------------------
+
+    def clear_memory(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, data = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                self._bytes -= len(data)
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def _memory_put(self, key, data, stored_at=None):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (stored_at or time.time(), data)
+            self._bytes += len(data)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    # -- 磁碟層 --------------------------------------------------------------
+
+    def _disk_path(self, key):
+        return os.path.join(self.folder, key[:2], f"{key}.pdf")
+
+    def _disk_get(self, key):
+        if not self.folder:
+            return None, None
+        path = self._disk_path(key)
+        try:
+            mtime = os.path.getmtime(path)
+            if time.time() - mtime > self.ttl:
+                os.remove(path)
+                return None, None
+            with open(path, 'rb') as f:
+                return f.read(), mtime
+        except OSError:
+            return None, None
+
+    def _disk_put(self, key, data):
+        if not self.folder:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先寫入暫存檔再 rename，避免其他 worker 讀到寫一半的 PDF
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def prune_disk(self):
+        """移除過期的磁碟快取，並在超過容量上限時由最舊的開始刪除。"""
+        if not self.folder or not os.path.isdir(self.folder):
+            return
+        now = time.time()
+        files = []
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if now - st.st_mtime > self.ttl:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    # -- 對外介面 ------------------------------------------------------------
+
+    def get(self, key):
+        """依序查詢記憶體層與磁碟層，皆未命中時回傳 None。"""
+        data = self._memory_get(key)
+        if data is not None:
+            return data
+        data, mtime = self._disk_get(key)
+        if data is not None:
+            self._memory_put(key, data, stored_at=mtime)
+        return data
+
+    def put(self, key, data):
+        """寫入記憶體層與磁碟層；磁碟層只是加速用，寫入失敗 (磁碟已滿、唯讀) 時只記錄警告。"""
+        self._memory_put(key, data)
+        try:
+            self._disk_put(key, data)
+        except OSError as e:
+            logger.warning("預覽快取寫入磁碟失敗，僅保留於記憶體: %s", e)
+        with self._lock:
+            self._puts += 1
+            should_prune = self._puts % self.PRUNE_EVERY == 0
+        if should_prune:
+            self.prune_disk()
+
+
+preview_cache = PreviewCache()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+非同步預覽工作
+
+POST 預覽時只建立工作並回傳 job id，由少量背景 worker 依序渲染。
+同一位使用者 (同一個編輯頁面) 送出新的預覽時，較舊、尚未開始的工作會直接被丟棄，
+正在執行的舊工作完成後結果也不再回傳，避免過期的渲染塞滿轉檔 worker 池。
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class PreviewQueueFull(Exception):
+    """等待中的預覽工作過多"""
+
+
+class PreviewJob:
+    __slots__ = ('id', 'owner', 'values', 'status', 'result', 'error',
+                 'created_at', 'finished_at', 'changed')
+
+    def __init__(self, owner, values):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.values = values
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.changed = threading.Condition()
+
+    def _set_status(self, status, result=None, error=None, expected=None):
+        with self.changed:
+            if expected is not None and self.status != expected:
+                return False
+            self.status = status
+            self.result = result
+            self.error = error
+            if status in FINISHED_STATES:
+                self.finished_at = time.time()
+                self.values = None
+            self.changed.notify_all()
+            return True
+
+    def wait(self, known_status, timeout):
+        """狀態仍為 known_status 時等待其改變 (或逾時)，回傳目前狀態。"""
+        with self.changed:
+            if self.status == known_status:
+                self.changed.wait(timeout)
+            return self.status
+
+    def to_dict(self):
+        data = {'job_id': self.id, 'status': self.status}
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class PreviewJobManager:
+    """預覽工作佇列與背景 worker。用法與 Flask 擴充套件相同，於 app.py 呼叫 init_app(app)。"""
+
+    DEFAULTS = {
+        'PREVIEW_JOB_WORKERS': 2,
+        'PREVIEW_JOB_MAX_PENDING': 64,
+        'PREVIEW_JOB_RESULT_TTL': 300,
+    }
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._latest_by_owner = {}
+        self._queue = None
+        self._workers = []
+        self._pid = None
+        self.app = None
+        self.config = dict(self.DEFAULTS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.config = {key: app.config.get(key, default) for key, default in self.DEFAULTS.items()}
+        app.extensions['preview_jobs'] = self
+
+    def _ensure_started(self):
+        # fork 之後 (例如 gunicorn --preload) 執行緒不會被繼承，需在新程序中重新啟動
+        if self._pid == os.getpid() and self._workers:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._workers:
+                return
+            if self._pid != os.getpid():
+                # 父程序的工作不會在此程序執行
+                self._jobs = {}
+                self._latest_by_owner = {}
+            self._queue = queue.Queue()
+            self._workers = []
+            for i in range(self.config['PREVIEW_JOB_WORKERS']):
+                worker = threading.Thread(target=self._work, name=f"preview-job-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            self._pid = os.getpid()
+
+    def _purge_expired_locked(self):
+        expire_before = time.time() - self.config['PREVIEW_JOB_RESULT_TTL']
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < expire_before]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if self._latest_by_owner.get(job.owner) == job_id:
+                del self._latest_by_owner[job.owner]
+
+    def submit(self, owner, values, render):
+        """
+        建立預覽工作並取代同一 owner 先前的工作。
+        render(values) 在背景執行緒 (已推入 app context) 中呼叫並回傳結果。
+        """
+        self._ensure_started()
+        job = PreviewJob(owner, values)
+        with self._lock:
+            self._purge_expired_locked()
+            pending = sum(1 for j in self._jobs.values() if j.status == QUEUED)
+            if pending >= self.config['PREVIEW_JOB_MAX_PENDING']:
+                raise PreviewQueueFull("預覽工作過多，請稍後再試。")
+
+            previous_id = self._latest_by_owner.get(owner)
+            previous = self._jobs.get(previous_id) if previous_id else None
+            if previous is not None and previous.status in (QUEUED, RUNNING):
+                # 尚未開始的工作會被 worker 直接略過；執行中的工作完成後結果會被捨棄
+                previous._set_status(CANCELLED)
+
+            self._jobs[job.id] = job
+            self._latest_by_owner[owner] = job.id
+        self._queue.put((job, render))
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _work(self):
+        while True:
+            job, render = self._queue.get()
+            if not job._set_status(RUNNING, expected=QUEUED):
+                continue
+            try:
+                with self.app.app_context():
+                    result = render(job.values)
+            except Exception as e:
+                logger.error("預覽工作 %s 失敗: %s", job.id, e)
+                job._set_status(FAILED, error=str(e), expected=RUNNING)
+                continue
+            job._set_status(DONE, result=result, expected=RUNNING)
+
+
+preview_jobs = PreviewJobManager()
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+以 GROUP BY 重新計算儀表板統計並修正 spec_stat 的偏差，適合由 cron / 工作排程器定期執行。
+
+    python reconcile_dashboard.py
+"""
+import argparse
+from flask import Flask
+from models import db
+from config import Config
+from dashboard import reconcile_stats, metrics
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='重新計算儀表板統計')
+    parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+
+    with app.app_context():
+        corrected = reconcile_stats()
+        if corrected:
+            print(f"⚠️  有 {corrected} 項統計與資料不一致，已修正 (耗時 {metrics['last_duration_ms']} ms)")
+        else:
+            print(f"✅ 儀表板統計與資料一致 (耗時 {metrics['last_duration_ms']} ms)")
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Word 模板 (或引用的圖片) 更新後，以多個程序平行重新產生規範的 Word / PDF。
+
+只處理「表單值 + 模板 + 圖片」的雜湊與上次產生時不同、或檔案已不存在的規範；
+每完成一筆即寫回 render_hash，中斷後重新執行會從未完成的規範繼續。
+
+    python regenerate_docs.py --dry-run               # 列出需要重新產生的規範數
+    python regenerate_docs.py --workers 4
+    python regenerate_docs.py --status active --status pending_approval
+    python regenerate_docs.py --codes PE11410001 PE11410002 --force
+    python regenerate_docs.py --include-legacy        # 一併處理沒有保存表單值的舊規範
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from flask import Flask
+from models import db, TempSpec
+from config import Config
+from rendering import (compute_render_hash, document_keys, init_worker, legacy_render_inputs,
+                       load_render_inputs, regenerate_task)
+from storage import storage
+
+BATCH_SIZE = 100
+
+
+def spec_query(args):
+    query = TempSpec.query
+    if args.status:
+        query = query.filter(TempSpec.status.in_(args.status))
+    if args.codes:
+        query = query.filter(TempSpec.spec_code.in_(args.codes))
+    if args.since:
+        query = query.filter(TempSpec.created_at >= datetime.strptime(args.since, '%Y-%m-%d'))
+    return query
+
+
+def iter_specs(query):
+    """依 id 分批讀取規範"""
+    last_id = 0
+    while True:
+        specs = query.filter(TempSpec.id > last_id).order_by(TempSpec.id).limit(BATCH_SIZE).all()
+        if not specs:
+            return
+        yield from specs
+        last_id = specs[-1].id
+        db.session.expunge_all()
+
+
+def iter_specs_by_id(spec_ids):
+    for i in range(0, len(spec_ids), BATCH_SIZE):
+        yield from TempSpec.query.filter(TempSpec.id.in_(spec_ids[i:i + BATCH_SIZE])).order_by(TempSpec.id)
+        db.session.expunge_all()
+
+
+def render_values(spec, include_legacy):
+    """回傳 (表單值, 是否為重建的舊資料)；沒有表單值且不處理舊資料時回傳 (None, True)"""
+    values = load_render_inputs(spec)
+    if values is not None:
+        return values, False
+    return (legacy_render_inputs(spec) if include_legacy else None), True
+
+
+def find_outdated(args):
+    """回傳需要重新產生的規範 id 與沒有保存表單值而略過的規範數"""
+    outdated, skipped_legacy = [], 0
+    for spec in iter_specs(spec_query(args)):
+        values, legacy = render_values(spec, args.include_legacy)
+        if values is None:
+            skipped_legacy += 1
+            continue
+        word_key, pdf_key = document_keys(spec.spec_code, spec.created_at)
+        up_to_date = (not legacy and spec.render_hash == compute_render_hash(values)
+                      and storage.exists(word_key) and storage.exists(pdf_key))
+        if args.force or not up_to_date:
+            outdated.append(spec.id)
+    return outdated, skipped_legacy
+
+
+def record_done(spec_id, render_hash, values=None):
+    """寫回完成的規範，作為中斷後繼續執行的檢查點"""
+    table = TempSpec.__table__
+    changes = {'render_hash': render_hash}
+    if values is not None:
+        changes['render_inputs'] = json.dumps(values, ensure_ascii=False)
+    db.session.execute(table.update().where(table.c.id == spec_id).values(**changes))
+    db.session.commit()
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def regenerate(args, spec_ids):
+    total = len(spec_ids)
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    done = failed = 0
+    started = time.monotonic()
+    pending = {}
+    specs = iter_specs_by_id(spec_ids)
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(config,)) as pool:
+        try:
+            while True:
+                # 同時送出的工作只保留 worker 數的兩倍，不必一次載入所有規範的表單值
+                while len(pending) < args.workers * 2:
+                    spec = next(specs, None)
+                    if spec is None:
+                        break
+                    values, legacy = render_values(spec, True)
+                    word_key, pdf_key = document_keys(spec.spec_code, spec.created_at)
+                    future = pool.submit(regenerate_task, spec.id, values, word_key, pdf_key)
+                    pending[future] = (spec.spec_code, values if legacy else None)
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    spec_code, legacy_values = pending.pop(future)
+                    try:
+                        spec_id, render_hash, elapsed = future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"   ❌ {spec_code}: {e}", flush=True)
+                        continue
+                    record_done(spec_id, render_hash, legacy_values)
+                    done += 1
+                    finished_count = done + failed
+                    remaining = (time.monotonic() - started) / finished_count * (total - finished_count)
+                    print(f"   [{finished_count}/{total}] {finished_count * 100 // total:3d}%  {spec_code}  "
+                          f"{elapsed:.1f}s  剩餘約 {format_duration(remaining)}", flush=True)
+        except KeyboardInterrupt:
+            # 等待執行中的規範完成並記錄，尚未開始的取消
+            pool.shutdown(wait=True, cancel_futures=True)
+            for future, (spec_code, legacy_values) in pending.items():
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    spec_id, render_hash, _ = future.result()
+                    record_done(spec_id, render_hash, legacy_values)
+                    done += 1
+            print(f"\n⚠️  已中斷：完成 {done} 筆、失敗 {failed} 筆，重新執行即可從未完成的規範繼續。")
+            sys.exit(130)
+    return done, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='重新產生暫時規範的 Word / PDF 文件')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1), help='平行處理的程序數')
+    parser.add_argument('--status', action='append',
+                        choices=['pending_approval', 'active', 'expired', 'terminated'], help='只處理指定狀態 (可重複)')
+    parser.add_argument('--codes', nargs='+', help='只處理指定的規範編號')
+    parser.add_argument('--since', help='只處理此日期 (YYYY-MM-DD) 之後建立的規範')
+    parser.add_argument('--force', action='store_true', help='即使雜湊相同也重新產生')
+    parser.add_argument('--include-legacy', action='store_true',
+                        help='沒有保存表單值的舊規範由資料表欄位重建 (電話、站別等欄位會是空白)')
+    parser.add_argument('--dry-run', action='store_true', help='只列出需要重新產生的規範數')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    storage.init_app(app)
+
+    with app.app_context():
+        spec_ids, skipped_legacy = find_outdated(args)
+        print(f"🔍 需要重新產生 {len(spec_ids)} 筆規範")
+        if skipped_legacy:
+            print(f"ℹ️  {skipped_legacy} 筆舊規範沒有保存表單值而略過 (可加上 --include-legacy)")
+        if args.dry_run or not spec_ids:
+            sys.exit(0)
+
+        started = time.monotonic()
+        done, failed = regenerate(args, spec_ids)
+        print(f"✅ 完成 {done} 筆、失敗 {failed} 筆，耗時 {format_duration(time.monotonic() - started)}")
+        sys.exit(1 if failed else 0)
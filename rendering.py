@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+規範文件 (Word / PDF) 的產生與重新產生
+
+建立規範時的表單值存在 TempSpec.render_inputs，render_hash 為「表單值 + Word 模板內容 +
+引用圖片內容」的雜湊 (與預覽快取的 key 相同)。模板或圖片變更後，雜湊不同的規範即需要重新產生，
+由 regenerate_docs.py 以多個程序平行處理。
+
+輸出先寫入暫存資料夾，Word 與 PDF 都成功後才存入 storage (本機儲存以 rename 取代原檔)，
+中斷或失敗時不會留下只寫了一半的檔案。
+"""
+import json
+import multiprocessing.util
+import os
+import signal
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from converter import conversion_pool
+from preview_cache import preview_cache, normalize_values
+from storage import storage, document_key
+from utils import fill_template, _resolve_image_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PATH = os.path.join(BASE_DIR, 'template_with_placeholders.docx')
+
+
+def document_keys(spec_code, created_at=None):
+    """回傳 (Word 的 storage key, PDF 的 storage key)"""
+    return document_key(spec_code, 'docx', created_at), document_key(spec_code, 'pdf', created_at)
+
+
+def compute_render_hash(values, template_path=TEMPLATE_PATH):
+    return preview_cache.make_key(normalize_values(values), template_path, _resolve_image_path)
+
+
+def render_documents(values, word_key, pdf_key, template_path=TEMPLATE_PATH):
+    """產生 Word 與 PDF，兩者都成功後才存入 storage 取代既有的檔案"""
+    with tempfile.TemporaryDirectory(prefix='render_') as tmp_dir:
+        tmp_word = os.path.join(tmp_dir, word_key.rsplit('/', 1)[-1])
+        tmp_pdf = os.path.join(tmp_dir, pdf_key.rsplit('/', 1)[-1])
+        fill_template(values, template_path, tmp_word, tmp_pdf)
+        storage.save_file(word_key, tmp_word, move=True)
+        storage.save_file(pdf_key, tmp_pdf, move=True)
+
+
+def load_render_inputs(spec):
+    """取得規範儲存的表單值；沒有儲存 (舊資料) 時回傳 None"""
+    return json.loads(spec.render_inputs) if spec.render_inputs else None
+
+
+def legacy_render_inputs(spec):
+    """
+    由資料表欄位重建舊規範的表單值。
+    電話、站別、TCCS、Package 等未存入資料表的欄位無法還原，會是空白。
+    """
+    change_before = change_after = data_needs = ''
+    content = (spec.content or '')
+    if content.startswith("變更前：\n"):
+        change_before, _, rest = content[len("變更前：\n"):].partition("\n\n變更後：\n")
+        change_after, _, data_needs = rest.partition("\n\n資料收集需求：\n")
+    else:
+        change_after = content
+    start_date = spec.start_date or (spec.created_at or datetime.now()).date()
+    return {
+        'serial_number': spec.spec_code,
+        'theme': spec.title or '',
+        'applicant': spec.applicant or '',
+        'applicant_phone': '',
+        'station': '',
+        'tccs_info': '',
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': (start_date + timedelta(days=30)).strftime('%Y-%m-%d'),
+        'package': '',
+        'lot_number': spec.lot_number or '',
+        'equipment_type': spec.equipment_type or '',
+        'change_before': change_before,
+        'change_after': change_after,
+        'data_needs': data_needs,
+    }
+
+
+# ---------------------------------------------------------------------------
+# 程序池 worker (regenerate_docs.py)
+# ---------------------------------------------------------------------------
+
+def init_worker(config):
+    """每個 worker 程序只需要一個轉檔後端，平行度由程序數決定"""
+    # Ctrl+C 由主程序處理：執行中的規範做完後才停止
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    conversion_pool.configure({**config, 'PDF_CONVERTER_POOL_SIZE': 1})
+    storage.configure(config)
+    # 程序池關閉時一併停止轉檔後端 (例如常駐的 unoserver)
+    multiprocessing.util.Finalize(None, conversion_pool.shutdown, exitpriority=10)
+
+
+def regenerate_task(spec_id, values, word_key, pdf_key):
+    """重新產生一筆規範的文件，回傳 (spec_id, render_hash, 耗時秒數)"""
+    start = time.monotonic()
+    render_hash = compute_render_hash(values)
+    render_documents(values, word_key, pdf_key)
+    return spec_id, render_hash, time.monotonic() - start
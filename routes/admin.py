@@ -1,8 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, Response, stream_with_context
 from flask_login import login_required, current_user
-from werkzeug.security import generate_password_hash
 from models import User, db
 from utils import admin_required
+from user_cache import user_cache
+from login_service import login_service
+from audit import iter_history_export
+from export import iter_spec_archive
+from datetime import datetime, timedelta
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -34,7 +38,7 @@ def create_user():
 
     new_user = User(
         username=username,
-        password_hash=generate_password_hash(password),
+        password_hash=login_service.hash_password(password),
         role=role
     )
     db.session.add(new_user)
@@ -56,9 +60,10 @@ def edit_user(user_id):
         user.role = new_role
     
     if new_password:
-        user.password_hash = generate_password_hash(new_password)
+        user.password_hash = login_service.hash_password(new_password)
 
     db.session.commit()
+    user_cache.invalidate(user.id)
     flash(f"使用者 '{user.username}' 的資料已更新。", 'success')
     return redirect(url_for('admin.user_list'))
 
@@ -72,5 +77,51 @@ def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(user_id)
     flash(f"使用者 '{user.username}' 已被刪除。", 'success')
     return redirect(url_for('admin.user_list'))
+
+@admin_bp.route('/history/export')
+def export_history():
+    """
+    串流匯出操作歷史紀錄。
+    參數: format=csv|jsonl、start/end=YYYY-MM-DD (含 end 當天)、spec_id
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        abort(400)
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('end') else None
+    except ValueError:
+        abort(400)
+    spec_id = request.args.get('spec_id', type=int)
+
+    filename = f"history_{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(iter_history_export(fmt, spec_id, start, end)),
+                        mimetype=f"{mimetype}; charset=utf-8")
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@admin_bp.route('/specs/export')
+def export_specs():
+    """
+    串流匯出規範與其產生的文件、簽核檔案、引用圖片 (ZIP)。
+    參數: start/end=YYYY-MM-DD (建立日期，含 end 當天)、status
+    """
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('end') else None
+    except ValueError:
+        abort(400)
+    status = request.args.get('status') or None
+    if status not in (None, 'pending_approval', 'active', 'expired', 'terminated'):
+        abort(400)
+
+    filename = f"specs_{datetime.now().strftime('%Y%m%d%H%M%S')}.zip"
+    # 關閉 nginx 的回應緩衝，讓壓縮檔的內容邊產生邊送出
+    response = Response(stream_with_context(iter_spec_archive(start, end, status)), mimetype='application/zip',
+                        headers={'X-Accel-Buffering': 'no'})
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
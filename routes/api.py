@@ -0,0 +1,216 @@
+"""
+唯讀 JSON API (/api/v1)，供 MES 與產線終端機輪詢。
+
+- GET /api/v1/specs                 規範列表 (游標分頁，可依狀態、批號、設備篩選)
+- GET /api/v1/specs/<id>            規範內容與上傳檔案
+- GET /api/v1/specs/active/changes  自 since 之後變更的已生效規範，以及不再生效 (含刪除) 的規範
+
+回應的 ETag 由 temp_spec 的變更計數 (changes.py) 產生，計數在程序內快取 API_VERSION_CACHE_TTL 秒；
+帶 If-None-Match 的請求在資料未變更時直接回應 304，不查詢規範資料表。
+加上 compact=1 時只回傳終端機判斷所需的欄位，列表以陣列表示。
+認證使用 Authorization: Bearer <API_TOKENS 中的 token>，或已登入的 session。
+"""
+import hmac
+import zlib
+from datetime import date, datetime
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+
+from changes import current_version, sync_horizon
+from models import db, TempSpec, Upload, DeletedSpec
+from pagination import KeysetPage
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+STATUSES = tuple(TempSpec.__table__.c.status.type.enums)
+
+SPEC_FIELDS = ('id', 'spec_code', 'title', 'applicant', 'status', 'start_date', 'end_date',
+               'lot_number', 'equipment_type', 'extension_count', 'created_at', 'change_version')
+COMPACT_FIELDS = ('id', 'spec_code', 'status', 'lot_number', 'equipment_type', 'end_date')
+SPEC_COLUMNS = [getattr(TempSpec, name) for name in SPEC_FIELDS]
+
+
+def _error(status, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+
+@api_bp.before_request
+def authenticate():
+    supplied = request.headers.get('Authorization', '')
+    if supplied:
+        tokens = current_app.config.get('API_TOKENS', ())
+        if any(hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()) for token in tokens):
+            return None
+        return _error(401, '無效的 API token')
+    if current_user.is_authenticated:
+        return None
+    response = _error(401, '需要 API token 或登入')
+    response.headers['WWW-Authenticate'] = 'Bearer'
+    return response
+
+
+def _compact():
+    return request.args.get('compact', '').lower() in ('1', 'true', 'yes')
+
+
+def _limit():
+    default = current_app.config.get('API_PAGE_SIZE', 100)
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, current_app.config.get('API_MAX_PAGE_SIZE', 1000)))
+
+
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _serialize(rows, compact):
+    """compact 時回傳 (欄位名稱, 陣列列表)，否則回傳 (None, 物件列表)"""
+    if compact:
+        return list(COMPACT_FIELDS), [[_value(getattr(row, name)) for name in COMPACT_FIELDS] for row in rows]
+    return None, [{name: _value(getattr(row, name)) for name in SPEC_FIELDS} for row in rows]
+
+
+def _conditional(build):
+    """
+    以變更計數與請求網址產生 ETag；與 If-None-Match 相符時回應 304，不呼叫 build。
+    build(version) 回傳 JSON 內容的 dict。
+    """
+    version = current_version(max_age=current_app.config.get('API_VERSION_CACHE_TTL', 1.0))
+    etag = f"{version}-{zlib.crc32(request.full_path.encode()):08x}"
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = build(version)
+        if not isinstance(response, dict):
+            return response
+        response = jsonify(response)
+    response.set_etag(etag, weak=True)
+    # 允許快取但每次都需重新驗證
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@api_bp.route('/specs')
+def spec_list():
+    """規範列表，依建立時間由新到舊；next_cursor 帶入 after 取得下一頁"""
+    status = request.args.get('status')
+    if status and status not in STATUSES:
+        return _error(400, f"status 必須是 {', '.join(STATUSES)} 其中之一")
+
+    def build(version):
+        query = db.session.query(*SPEC_COLUMNS)
+        if status:
+            query = query.filter(TempSpec.status == status)
+        # 批號與設備欄位為自由輸入 (可能填寫多個)，以包含比對
+        for name in ('lot_number', 'equipment_type'):
+            value = request.args.get(name, '').strip()
+            if value:
+                query = query.filter(getattr(TempSpec, name).contains(value, autoescape=True))
+        page = KeysetPage(query, TempSpec.created_at, TempSpec.id, _limit(), after=request.args.get('after'))
+        fields, items = _serialize(page.items, _compact())
+        body = {'version': version, 'items': items, 'next_cursor': page.next_params.get('after')}
+        if fields:
+            body['fields'] = fields
+        return body
+
+    return _conditional(build)
+
+
+@api_bp.route('/specs/<int:spec_id>')
+def spec_detail(spec_id):
+    def build(version):
+        spec = db.session.get(TempSpec, spec_id)
+        if spec is None:
+            return _error(404, '找不到此規範')
+        if _compact():
+            return {'version': version, 'item': {name: _value(getattr(spec, name)) for name in COMPACT_FIELDS}}
+        item = {name: _value(getattr(spec, name)) for name in SPEC_FIELDS}
+        item['termination_reason'] = spec.termination_reason
+        item['content'] = spec.content
+        uploads = db.session.query(Upload.filename, Upload.upload_time, Upload.sha256, Upload.size_bytes).filter(
+            Upload.temp_spec_id == spec_id).order_by(Upload.upload_time)
+        item['uploads'] = [{'filename': row.filename, 'upload_time': _value(row.upload_time),
+                            'sha256': row.sha256, 'size_bytes': row.size_bytes} for row in uploads]
+        return {'version': version, 'item': item}
+
+    return _conditional(build)
+
+
+def _parse_since(value):
+    """since 為上次回應的 next_since：'<計數>' 或分頁中途的 '<計數>.<id>'"""
+    version, _, row_id = (value or '0').partition('.')
+    try:
+        return int(version), (int(row_id) if row_id else None)
+    except ValueError:
+        return None
+
+
+def _after(version_col, id_col, since, upto):
+    version, row_id = since
+    if row_id is None:
+        after = version_col > version
+    else:
+        after = db.or_(version_col > version, db.and_(version_col == version, id_col > row_id))
+    return db.and_(after, version_col <= upto)
+
+
+@api_bp.route('/specs/active/changes')
+def active_changes():
+    """
+    自 since 之後變更的規範：目前為已生效的放在 items，其他狀態或已刪除的放在 removed。
+    終端機以 since=0 取得全部已生效規範，之後帶入回應的 next_since 取得增量；has_more 為 true 時立即再次請求。
+    回應 410 時清除本機的資料並以 since=0 重新同步。
+    """
+    since = _parse_since(request.args.get('since'))
+    if since is None:
+        return _error(400, 'since 格式錯誤')
+
+    def build(version):
+        # 早於同步下限的已刪除規範紀錄已被清除，無法得知期間刪除了哪些規範
+        horizon = sync_horizon()
+        if since != (0, None) and (since[0] < horizon or (since[0] == horizon and since[1] is not None)):
+            return _error(410, '上次同步的時間早於已刪除規範的保留期間，請以 since=0 重新同步')
+        limit = _limit()
+        # 讀到計數 version 時，change_version <= version 的變更都已 commit，依 (change_version, id) 依序讀取不會遺漏
+        specs = db.session.query(*SPEC_COLUMNS).filter(
+            _after(TempSpec.change_version, TempSpec.id, since, version)
+        ).order_by(TempSpec.change_version, TempSpec.id).limit(limit + 1).all()
+        deleted = db.session.query(DeletedSpec.spec_id, DeletedSpec.spec_code, DeletedSpec.change_version).filter(
+            _after(DeletedSpec.change_version, DeletedSpec.spec_id, since, version)
+        ).order_by(DeletedSpec.change_version, DeletedSpec.spec_id).limit(limit + 1).all()
+
+        entries = sorted([(row.change_version, row.id, 'spec', row) for row in specs]
+                         + [(row.change_version, row.spec_id, 'deleted', row) for row in deleted],
+                         key=lambda entry: entry[:2])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        active, removed = [], []
+        for _, row_id, kind, row in entries:
+            if kind == 'deleted':
+                removed.append({'id': row_id, 'spec_code': row.spec_code, 'status': 'deleted'})
+            elif row.status == 'active':
+                active.append(row)
+            else:
+                removed.append({'id': row_id, 'spec_code': row.spec_code, 'status': row.status})
+
+        if has_more:
+            next_since = f"{entries[-1][0]}.{entries[-1][1]}"
+        elif since[0] > version:
+            # 其他 worker 快取的計數較舊時維持原位置
+            next_since = request.args.get('since')
+        else:
+            next_since = str(version)
+        fields, items = _serialize(active, _compact())
+        body = {'version': version, 'next_since': next_since, 'has_more': has_more,
+                'items': items, 'removed': removed}
+        if fields:
+            body['fields'] = fields
+        return body
+
+    return _conditional(build)
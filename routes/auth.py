@@ -1,10 +1,11 @@
+import logging
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required
-from werkzeug.security import check_password_hash
-from models import User, db
-from datetime import datetime
+from models import User
+from login_service import login_service, LoginBusy
 
 auth_bp = Blueprint('auth', __name__)
+logger = logging.getLogger(__name__)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -13,19 +14,20 @@ def login():
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
 
-        if user:
-            print(f"🔍 嘗試登入使用者：{username}")
-        else:
-            print("⚠️ 使用者不存在")
+        # 密碼雜湊在驗證執行緒池中計算；last_login 由背景批次寫入
+        try:
+            verified = user is not None and login_service.verify(user, password)
+        except LoginBusy as e:
+            flash(str(e), 'warning')
+            return render_template('login.html'), 503
 
-        if user and check_password_hash(user.password_hash, password):
+        if verified:
             login_user(user)
-            user.last_login = datetime.now()
-            db.session.commit()
-            print("✅ 登入成功")
+            login_service.record_login(user.id)
+            logger.info("登入成功: %s", username)
             return redirect(url_for('temp_spec.spec_list'))
         else:
-            print("❌ 登入失敗，帳號或密碼錯誤")
+            logger.warning("登入失敗: %s (%s)", username, '密碼錯誤' if user else '使用者不存在')
             flash('帳號或密碼錯誤，請重新輸入', 'danger')
 
     return render_template('login.html')
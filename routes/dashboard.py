@@ -0,0 +1,23 @@
+from flask import Blueprint, render_template, jsonify, current_app
+from flask_login import login_required
+from dashboard import dashboard_summary
+
+dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
+
+@dashboard_bp.before_request
+@login_required
+def before_request():
+    pass
+
+def _summary():
+    # 統計值由 spec_stat 彙總表讀取，不對 temp_spec 做 GROUP BY
+    return dashboard_summary(expiring_days=current_app.config.get('DASHBOARD_EXPIRING_DAYS', 7),
+                             months=current_app.config.get('DASHBOARD_TREND_MONTHS', 12))
+
+@dashboard_bp.route('')
+def dashboard():
+    return render_template('dashboard.html', summary=_summary())
+
+@dashboard_bp.route('/data')
+def dashboard_data():
+    return jsonify(_summary())
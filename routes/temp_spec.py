@@ -1,15 +1,27 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app, jsonify, abort, Response, stream_with_context
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from models import TempSpec, db, Upload, SpecHistory
-from utils import fill_template, editor_or_admin_required, add_history_log, admin_required
+from utils import fill_template, editor_or_admin_required, add_history_log, admin_required, _resolve_image_path
+from converter import ConversionQueueFull
+from preview_cache import preview_cache, normalize_values
+from preview_jobs import preview_jobs, PreviewQueueFull, DONE, FINISHED_STATES
+from storage import storage, document_key, signed_key
+from search import index_spec, remove_spec, search_spec_ids, like_filter
+from spec_codes import allocate_spec_code, peek_next_spec_code
+from lifecycle import bulk_extend, bulk_terminate, OK as BULK_OK
+from rendering import document_keys, compute_render_hash, render_documents
+from file_gc import file_sweeper, mark_spec_files, record_spec_images
+from dashboard import record_change, snapshot
+from pagination import KeysetPage, RankedPage, cached_count, invalidate_counts
+from sqlalchemy.orm import undefer, joinedload
+import io
+import json
 import os
 import tempfile
 from werkzeug.utils import secure_filename
 from bs4 import BeautifulSoup
-import re
-import mistune
 
 temp_spec_bp = Blueprint('temp_spec', __name__)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -20,33 +32,9 @@ def before_request():
     """在處理此藍圖中的任何請求之前，確保使用者已登入。"""
     pass
 
-def _generate_next_spec_code():
-    """
-    產生下一個暫時規範編號。
-    規則: PE + 民國年(3碼) + 月份(2碼) + 流水號(2碼)
-    """
-    now = datetime.now()
-    roc_year = now.year - 1911
-    prefix = f"PE{roc_year}{now.strftime('%m')}"
-
-    latest_spec = TempSpec.query.filter(
-        TempSpec.spec_code.startswith(prefix)
-    ).order_by(TempSpec.spec_code.desc()).first()
-
-    if latest_spec:
-        last_seq = int(latest_spec.spec_code[-2:])
-        new_seq = last_seq + 1
-    else:
-        new_seq = 1
-    
-    return f"{prefix}{new_seq:02d}"
-
-@temp_spec_bp.route('/preview', methods=['POST'])
-def preview_spec():
-    """產生預覽 PDF 並返回"""
-    data = request.json
-    
-    values = {
+def _build_preview_values(data):
+    """由預覽請求的 JSON 建立模板所需的欄位值"""
+    return {
         'serial_number': data.get('serial_number', 'PREVIEW-SN'),
         'theme': data.get('theme', 'PREVIEW-THEME'),
         'applicant': data.get('applicant', ''),
@@ -63,36 +51,109 @@ def preview_spec():
         'data_needs': data.get('data_needs', ''),
     }
 
-    temp_docx_path = tempfile.mktemp(suffix=".docx")
-    temp_pdf_path = tempfile.mktemp(suffix=".pdf")
+@temp_spec_bp.route('/preview', methods=['POST'])
+def preview_spec():
+    """產生預覽 PDF 並返回"""
+    values = _build_preview_values(request.json)
 
     try:
-        template_path = os.path.join(BASE_DIR, 'template_with_placeholders.docx')
-        fill_template(values, template_path, temp_docx_path, temp_pdf_path)
+        pdf_data, cache_hit = _render_preview_pdf(values)
+    except ConversionQueueFull as e:
+        # 轉檔 worker 池忙碌中，請前端稍後重試而不是佔住 web worker 等待
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        current_app.logger.error(f"預覽生成失敗: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        with open(temp_pdf_path, 'rb') as f:
-            pdf_data = f.read()
-        
-        import io
-        return_data = io.BytesIO(pdf_data)
+    response = send_file(io.BytesIO(pdf_data), mimetype='application/pdf')
+    response.headers['X-Preview-Cache'] = 'hit' if cache_hit else 'miss'
+    return response
 
-        try:
-            if os.path.exists(temp_docx_path):
-                os.remove(temp_docx_path)
-            if os.path.exists(temp_pdf_path):
-                os.remove(temp_pdf_path)
-        except Exception as e:
-            current_app.logger.error(f"無法刪除暫存檔: {e}")
+def _render_preview_pdf(values):
+    """
+    產生預覽 PDF 的位元組內容，回傳 (pdf_data, cache_hit)。
+    相同的表單內容、模板與圖片會直接由預覽快取取得，不重新渲染。
+    """
+    values = normalize_values(values)
+    template_path = os.path.join(BASE_DIR, 'template_with_placeholders.docx')
+    cache_key = preview_cache.make_key(values, template_path, _resolve_image_path)
 
-        return send_file(return_data, mimetype='application/pdf')
+    pdf_data = preview_cache.get(cache_key)
+    if pdf_data is not None:
+        return pdf_data, True
 
-    except Exception as e:
-        current_app.logger.error(f"預覽生成失敗: {e}")
-        if os.path.exists(temp_docx_path):
-            os.remove(temp_docx_path)
-        if os.path.exists(temp_pdf_path):
-            os.remove(temp_pdf_path)
-        return jsonify({"error": str(e)}), 500
+    with tempfile.TemporaryDirectory(prefix='preview_') as tmp_dir:
+        temp_docx_path = os.path.join(tmp_dir, 'preview.docx')
+        temp_pdf_path = os.path.join(tmp_dir, 'preview.pdf')
+        fill_template(values, template_path, temp_docx_path, temp_pdf_path)
+        with open(temp_pdf_path, 'rb') as f:
+            pdf_data = f.read()
+
+    preview_cache.put(cache_key, pdf_data)
+    return pdf_data, False
+
+def _preview_job_payload(job):
+    data = job.to_dict()
+    data['status_url'] = url_for('temp_spec.preview_job_status', job_id=job.id)
+    data['events_url'] = url_for('temp_spec.preview_job_events', job_id=job.id)
+    if job.status == DONE:
+        data['pdf_url'] = url_for('temp_spec.preview_job_pdf', job_id=job.id)
+    return data
+
+def _get_own_preview_job(job_id):
+    job = preview_jobs.get(job_id)
+    if job is None or job.owner[0] != current_user.id:
+        abort(404)
+    return job
+
+@temp_spec_bp.route('/preview/jobs', methods=['POST'])
+def create_preview_job():
+    """
+    建立非同步預覽工作，回傳 job id。
+    同一使用者、同一編輯頁面 (client_id) 的新預覽會取代尚未完成的舊預覽。
+    """
+    data = request.json or {}
+    values = _build_preview_values(data)
+    owner = (current_user.id, str(data.get('client_id', '')))
+    try:
+        job = preview_jobs.submit(owner, values, lambda v: _render_preview_pdf(v)[0])
+    except PreviewQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify(_preview_job_payload(job)), 202
+
+@temp_spec_bp.route('/preview/jobs/<job_id>')
+def preview_job_status(job_id):
+    """查詢預覽工作狀態 (輪詢用)"""
+    return jsonify(_preview_job_payload(_get_own_preview_job(job_id)))
+
+@temp_spec_bp.route('/preview/jobs/<job_id>/events')
+def preview_job_events(job_id):
+    """以 Server-Sent Events 推送預覽工作狀態，直到工作結束"""
+    job = _get_own_preview_job(job_id)
+
+    def stream():
+        last_status = None
+        while True:
+            status = job.status
+            if status != last_status:
+                last_status = status
+                yield f"event: status\ndata: {json.dumps(_preview_job_payload(job))}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if status in FINISHED_STATES:
+                break
+            job.wait(status, timeout=15)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@temp_spec_bp.route('/preview/jobs/<job_id>/pdf')
+def preview_job_pdf(job_id):
+    """下載已完成的預覽 PDF"""
+    job = _get_own_preview_job(job_id)
+    if job.status != DONE:
+        return jsonify(_preview_job_payload(job)), 409
+    return send_file(io.BytesIO(job.result), mimetype='application/pdf')
 
 @temp_spec_bp.route('/create', methods=['GET', 'POST'])
 @editor_or_admin_required
@@ -100,7 +161,8 @@ def create_temp_spec():
     if request.method == 'POST':
         data = request.form
         now = datetime.now()
-        serial_number = _generate_next_spec_code()
+        # 編號由計數列原子地配發，與規範在同一個交易中寫入
+        serial_number = allocate_spec_code(now)
         stations = request.form.getlist('station')
         if '其他' in stations and data.get('station_other'):
             stations[stations.index('其他')] = data.get('station_other')
@@ -123,10 +185,7 @@ def create_temp_spec():
             'data_needs': data.get('data_needs', ''),
         }
 
-        generated_folder = os.path.join(BASE_DIR, current_app.config['GENERATED_FOLDER'])
-        os.makedirs(generated_folder, exist_ok=True)
-        word_path = os.path.join(generated_folder, f"{values['serial_number']}.docx")
-        pdf_path = os.path.join(generated_folder, f"{values['serial_number']}.pdf")
+        word_key, pdf_key = document_keys(values['serial_number'], now)
 
         db_content_parts = []
         db_content_parts.append("變更前：\n")
@@ -153,51 +212,69 @@ def create_temp_spec():
             start_date=start_date_obj,
             end_date=end_date_obj,
             created_at=now,
-            status='pending_approval'
+            status='pending_approval',
+            lot_number=values['lot_number'],
+            equipment_type=values['equipment_type'],
+            # 保存產生文件的表單值，模板更新後可重新產生文件
+            render_inputs=json.dumps(values, ensure_ascii=False),
+            render_hash=compute_render_hash(values)
         )
+        record_spec_images(spec, values)
         db.session.add(spec)
         db.session.flush()
+        index_spec(spec)
+        record_change(None, snapshot(spec))
         add_history_log(spec.id, '建立', f"建立暫時規範，編號為 {spec.spec_code}")
         db.session.commit()
+        invalidate_counts()
 
-        # 在產生用於下載的 PDF 前，需將 Markdown 轉為 HTML
-        values['change_before'] = mistune.html(values['change_before'])
-        values['change_after'] = mistune.html(values['change_after'])
+        # fill_template 直接由 Markdown 產生段落/圖片/表格，不需先轉為 HTML
         try:
-            fill_template(values, os.path.join(BASE_DIR, 'template_with_placeholders.docx'), word_path, pdf_path)
+            render_documents(values, word_key, pdf_key)
         except Exception as e:
             current_app.logger.error(f"檔案生成失敗: {e}")
             flash('檔案生成失敗，可能是 Word 模板或 PDF 轉換器問題，請聯絡管理員。', 'danger')
             return redirect(url_for('temp_spec.create_temp_spec'))
             
-        return send_file(word_path, as_attachment=True)
+        return storage.serve(word_key)
 
-    next_spec_code = _generate_next_spec_code()
+    next_spec_code = peek_next_spec_code()
     return render_template('create_temp_spec.html', next_spec_code=next_spec_code)
 
 @temp_spec_bp.route('/list')
 def spec_list():
-    page = request.args.get('page', 1, type=int)
     query = request.args.get('query', '')
     status_filter = request.args.get('status', '')
-    specs_query = TempSpec.query
-
-    if query:
-        search_term = f"%{query}%"
-        specs_query = specs_query.filter(
-            db.or_(
-                TempSpec.spec_code.ilike(search_term),
-                TempSpec.title.ilike(search_term)
-            )
-        )
-    
+    per_page = 15
+    # 上傳筆數與最新上傳時間以子查詢一起載入，不再逐筆 lazy load spec.uploads
+    specs_query = TempSpec.query.options(
+        undefer(TempSpec.upload_count),
+        undefer(TempSpec.latest_upload_time)
+    )
     if status_filter:
         specs_query = specs_query.filter(TempSpec.status == status_filter)
 
-    pagination = specs_query.order_by(TempSpec.created_at.desc()).paginate(
-        page=page, per_page=15, error_out=False
-    )
-    
+    # 多取一筆以判斷結果是否超過上限
+    max_results = current_app.config.get('SEARCH_MAX_RESULTS', 1000)
+    ranked_ids = search_spec_ids(query, limit=max_results + 1) if query else None
+    if ranked_ids is not None:
+        # 全文檢索：依相關度排序的 id 清單 (有上限) 依頁碼切片；超過上限時在頁面上提示
+        truncated = len(ranked_ids) > max_results
+        ranked_ids = ranked_ids[:max_results]
+        if status_filter and ranked_ids:
+            matched = {row.id for row in specs_query.with_entities(TempSpec.id).filter(TempSpec.id.in_(ranked_ids))}
+            ranked_ids = [spec_id for spec_id in ranked_ids if spec_id in matched]
+        pagination = RankedPage(specs_query, TempSpec.id, ranked_ids, per_page,
+                                page=request.args.get('page', 1, type=int), truncated=truncated)
+    else:
+        if query:
+            # 字詞過短無法使用全文索引時退回 LIKE
+            specs_query = specs_query.filter(like_filter(query))
+        total = cached_count(('spec_list', status_filter, query), specs_query)
+        pagination = KeysetPage(specs_query, TempSpec.created_at, TempSpec.id, per_page,
+                                after=request.args.get('after'), before=request.args.get('before'),
+                                total=total)
+
     specs = pagination.items
     return render_template('spec_list.html', specs=specs, pagination=pagination, query=query, status=status_filter)
 
@@ -212,21 +289,23 @@ def activate_spec(spec_id):
             return redirect(url_for('temp_spec.activate_spec', spec_id=spec.id))
 
         filename = secure_filename(f"{spec.spec_code}_signed_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf")
-        upload_folder = os.path.join(BASE_DIR, current_app.config['UPLOAD_FOLDER'])
-        os.makedirs(upload_folder, exist_ok=True)
-        file_path = os.path.join(upload_folder, filename)
-        uploaded_file.save(file_path)
+        sha256, size_bytes = storage.save(signed_key(spec.spec_code, filename, spec.created_at), uploaded_file)
 
         new_upload = Upload(
             temp_spec_id=spec.id,
             filename=filename,
-            upload_time=datetime.now()
+            upload_time=datetime.now(),
+            sha256=sha256,
+            size_bytes=size_bytes
         )
         db.session.add(new_upload)
 
+        before = snapshot(spec)
         spec.status = 'active'
+        record_change(before, snapshot(spec))
         add_history_log(spec.id, '啟用', f"上傳已簽核檔案 '{filename}'")
         db.session.commit()
+        invalidate_counts()
         flash(f"規範 '{spec.spec_code}' 已生效！", 'success')
         return redirect(url_for('temp_spec.spec_list'))
 
@@ -242,11 +321,15 @@ def terminate_spec(spec_id):
             flash('請填寫提早結束的原因。', 'danger')
             return redirect(url_for('temp_spec.terminate_spec', spec_id=spec.id))
         
+        before = snapshot(spec)
         spec.status = 'terminated'
         spec.termination_reason = reason
         spec.end_date = datetime.today().date()
+        record_change(before, snapshot(spec))
+        index_spec(spec)
         add_history_log(spec.id, '終止', f"原因: {reason}")
         db.session.commit()
+        invalidate_counts()
         flash(f"規範 '{spec.spec_code}' 已被提早終止。", 'warning')
         return redirect(url_for('temp_spec.spec_list'))
 
@@ -255,14 +338,13 @@ def terminate_spec(spec_id):
 @temp_spec_bp.route('/download_initial/<int:spec_id>')
 def download_initial_pdf(spec_id):
     spec = TempSpec.query.get_or_404(spec_id)
-    generated_folder = os.path.join(BASE_DIR, current_app.config['GENERATED_FOLDER'])
-    pdf_path = os.path.join(generated_folder, f"{spec.spec_code}.pdf")
+    pdf_key = document_key(spec.spec_code, 'pdf', spec.created_at)
 
-    if not os.path.exists(pdf_path):
+    if not storage.exists(pdf_key):
         flash('找不到最初產生的 PDF 檔案，可能已被刪除或移動。', 'danger')
         return redirect(url_for('temp_spec.spec_list'))
 
-    return send_file(pdf_path, as_attachment=True)
+    return storage.serve(pdf_key)
 
 @temp_spec_bp.route('/download_initial_word/<int:spec_id>')
 @login_required
@@ -273,14 +355,13 @@ def download_initial_word(spec_id):
         flash('權限不足，無法下載 Word 檔案。', 'danger')
         abort(403)
 
-    generated_folder = os.path.join(BASE_DIR, current_app.config['GENERATED_FOLDER'])
-    word_path = os.path.join(generated_folder, f"{spec.spec_code}.docx")
+    word_key = document_key(spec.spec_code, 'docx', spec.created_at)
 
-    if not os.path.exists(word_path):
+    if not storage.exists(word_key):
         flash('找不到最初產生的 Word 檔案，可能已被刪除或移動。', 'danger')
         return redirect(url_for('temp_spec.spec_list'))
 
-    return send_file(word_path, as_attachment=True)
+    return storage.serve(word_key)
 
 @temp_spec_bp.route('/download_signed/<int:spec_id>')
 def download_signed_pdf(spec_id):
@@ -290,8 +371,14 @@ def download_signed_pdf(spec_id):
         flash('找不到任何已上傳的簽核檔案。', 'danger')
         return redirect(url_for('temp_spec.spec_list'))
 
-    upload_folder = os.path.join(BASE_DIR, current_app.config['UPLOAD_FOLDER'])
-    return send_file(os.path.join(upload_folder, latest_upload.filename), as_attachment=True)
+    spec = latest_upload.spec
+    file_key = signed_key(spec.spec_code, latest_upload.filename, spec.created_at)
+    if not storage.exists(file_key):
+        flash('找不到已簽核的檔案，可能已被刪除或移動。', 'danger')
+        return redirect(url_for('temp_spec.spec_list'))
+
+    # 以上傳時計算的 SHA-256 作為 ETag，重複下載時可直接回應 304
+    return storage.serve(file_key, etag=latest_upload.sha256)
 
 @temp_spec_bp.route('/extend/<int:spec_id>', methods=['GET', 'POST'])
 @editor_or_admin_required
@@ -306,21 +393,22 @@ def extend_spec(spec_id):
             flash('請選擇新的結束日期', 'danger')
             return redirect(url_for('temp_spec.extend_spec', spec_id=spec.id))
 
+        before = snapshot(spec)
         spec.end_date = datetime.strptime(new_end_date_str, '%Y-%m-%d').date()
         spec.extension_count += 1
         spec.status = 'active'
+        record_change(before, snapshot(spec))
 
         if uploaded_file and uploaded_file.filename != '':
             filename = secure_filename(uploaded_file.filename)
-            upload_folder = os.path.join(BASE_DIR, current_app.config['UPLOAD_FOLDER'])
-            os.makedirs(upload_folder, exist_ok=True)
-            file_path = os.path.join(upload_folder, filename)
-            uploaded_file.save(file_path)
+            sha256, size_bytes = storage.save(signed_key(spec.spec_code, filename, spec.created_at), uploaded_file)
 
             new_upload = Upload(
                 temp_spec_id=spec.id,
                 filename=filename,
-                upload_time=datetime.now()
+                upload_time=datetime.now(),
+                sha256=sha256,
+                size_bytes=size_bytes
             )
             db.session.add(new_upload)
         
@@ -328,19 +416,83 @@ def extend_spec(spec_id):
         if 'new_upload' in locals():
             details += f"，並上傳新檔案 '{new_upload.filename}'"
         add_history_log(spec.id, '展延', details)
+        index_spec(spec)
         
         db.session.commit()
+        invalidate_counts()
         flash(f"規範 '{spec.spec_code}' 已成功展延！", 'success')
         return redirect(url_for('temp_spec.spec_list'))
 
     default_new_end_date = spec.end_date + timedelta(days=30)
     return render_template('extend_spec.html', spec=spec, default_new_end_date=default_new_end_date)
 
+@temp_spec_bp.route('/bulk', methods=['POST'])
+@editor_or_admin_required
+def bulk_lifecycle():
+    """
+    批次展延或終止規範，一次請求、一個交易。
+    JSON: {"action": "extend"|"terminate", "ids": [...], "new_end_date": "YYYY-MM-DD", "reason": "..."}
+    回傳每筆規範的結果；由總表頁面的表單送出時改以訊息顯示結果。
+    """
+    wants_json = request.is_json
+    data = (request.get_json(silent=True) or {}) if wants_json else request.form
+    action = data.get('action')
+    try:
+        spec_ids = [int(spec_id) for spec_id in (data.get('ids') if wants_json else data.getlist('ids')) or []]
+    except (TypeError, ValueError):
+        spec_ids = None
+
+    error = None
+    max_items = current_app.config.get('BULK_MAX_ITEMS', 500)
+    if action not in ('extend', 'terminate'):
+        error = '未知的批次操作。'
+    elif not spec_ids:
+        error = '請至少選擇一筆規範。'
+    elif len(spec_ids) > max_items:
+        error = f'一次最多處理 {max_items} 筆規範。'
+    elif action == 'extend':
+        try:
+            new_end_date = datetime.strptime(data.get('new_end_date') or '', '%Y-%m-%d').date()
+        except ValueError:
+            error = '請選擇新的結束日期。'
+    elif not (data.get('reason') or '').strip():
+        error = '請填寫提早結束的原因。'
+
+    if error:
+        if wants_json:
+            return jsonify({'error': error}), 400
+        flash(error, 'danger')
+        return redirect(request.referrer or url_for('temp_spec.spec_list'))
+
+    if action == 'extend':
+        results = bulk_extend(spec_ids, new_end_date, current_user.id)
+    else:
+        results = bulk_terminate(spec_ids, data.get('reason').strip(), current_user.id)
+
+    succeeded = [r for r in results if r.outcome == BULK_OK]
+    failed = [r for r in results if r.outcome != BULK_OK]
+    if wants_json:
+        return jsonify({
+            'action': action,
+            'succeeded': len(succeeded),
+            'failed': len(failed),
+            'results': [r.to_dict() for r in results],
+        })
+
+    label = '展延' if action == 'extend' else '終止'
+    if succeeded:
+        flash(f"已{label} {len(succeeded)} 筆規範。", 'success')
+    for r in failed:
+        flash(f"{r.spec_code or r.spec_id}: {r.message}", 'warning')
+    return redirect(request.referrer or url_for('temp_spec.spec_list'))
+
 @temp_spec_bp.route('/history/<int:spec_id>')
 def spec_history(spec_id):
     spec = TempSpec.query.get_or_404(spec_id)
-    history = SpecHistory.query.filter_by(spec_id=spec_id).order_by(SpecHistory.timestamp.desc()).all()
-    return render_template('spec_history.html', spec=spec, history=history)
+    history_query = SpecHistory.query.filter_by(spec_id=spec_id).options(joinedload(SpecHistory.user))
+    pagination = KeysetPage(history_query, SpecHistory.timestamp, SpecHistory.id, 50,
+                            after=request.args.get('after'), before=request.args.get('before'))
+    return render_template('spec_history.html', spec=spec, history=pagination.items, pagination=pagination)
 
 @temp_spec_bp.route('/delete/<int:spec_id>', methods=['POST'])
 @admin_required
@@ -348,32 +500,15 @@ def delete_spec(spec_id):
     spec = TempSpec.query.get_or_404(spec_id)
     spec_code = spec.spec_code
 
-    files_to_delete = []
-    generated_folder = os.path.join(BASE_DIR, current_app.config['GENERATED_FOLDER'])
-    files_to_delete.append(os.path.join(generated_folder, f"{spec.spec_code}.docx"))
-    files_to_delete.append(os.path.join(generated_folder, f"{spec.spec_code}.pdf"))
-
-    upload_folder = os.path.join(BASE_DIR, current_app.config['UPLOAD_FOLDER'])
-    for upload_record in spec.uploads:
-        files_to_delete.append(os.path.join(upload_folder, upload_record.filename))
-
-    image_folder = os.path.join(BASE_DIR, 'static', 'uploads', 'images')
-    if spec.content:
-        image_urls = re.findall(r'!\[.*?\]\((.*?)\)', spec.content)
-        for url in image_urls:
-            if url.startswith('/static/uploads/images/'):
-                img_filename = os.path.basename(url)
-                files_to_delete.append(os.path.join(image_folder, img_filename))
-
-    for f_path in files_to_delete:
-        try:
-            if os.path.exists(f_path):
-                os.remove(f_path)
-        except Exception as e:
-            current_app.logger.error(f"刪除檔案失敗: {f_path}, 原因: {e}")
+    # 檔案只標記為待清除 (與刪除規範同一個交易)，由背景清除刪除；引用的圖片在沒有其他規範使用後才會被清除
+    mark_spec_files(spec)
 
+    record_change(snapshot(spec), None)
+    remove_spec(spec.id)
     db.session.delete(spec)
     db.session.commit()
+    invalidate_counts()
+    file_sweeper.wake()
 
     flash(f"規範 '{spec_code}' 及其所有相關檔案已成功刪除。", 'success')
     return redirect(url_for('temp_spec.spec_list'))
\ No newline at end of file
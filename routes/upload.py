@@ -1,7 +1,6 @@
-from flask import Blueprint, request, jsonify, current_app
-from werkzeug.utils import secure_filename
-import os
-import time
+from flask import Blueprint, request, jsonify
+from images import image_pipeline, image_url, thumbnail_url, IMAGE_URL_PREFIX
+from storage import storage, image_key, thumbnail_key
 
 upload_bp = Blueprint('upload', __name__)
 
@@ -11,19 +10,21 @@ def upload_image():
     if not file:
         return jsonify({'error': 'No file part'}), 400
 
-    # 建立一個獨特的檔名
-    extension = os.path.splitext(file.filename)[1]
-    filename = f"{int(time.time())}_{secure_filename(file.filename)}"
-    
-    # 確保上傳資料夾存在
-    # 為了讓圖片能被網頁存取，我們將它存在 static 資料夾下
-    image_folder = os.path.join(current_app.static_folder, 'uploads', 'images')
-    os.makedirs(image_folder, exist_ok=True)
-    
-    file_path = os.path.join(image_folder, filename)
-    file.save(file_path)
+    # 以內容雜湊命名並去除重複，縮小/重新壓縮/縮圖由背景執行緒完成
+    try:
+        filename, _ = image_pipeline.ingest(file.read())
+    except ValueError:
+        return jsonify({'error': '不支援的圖片格式'}), 400
 
     # 回傳 TinyMCE 需要的 JSON 格式
     # 路徑必須是相對於網域根目錄的 URL
-    location = f"/static/uploads/images/{filename}"
-    return jsonify({'location': location})
+    return jsonify({'location': image_url(filename), 'thumbnail': thumbnail_url(filename)})
+
+# 圖片網址維持 /static/uploads/images/ 不變 (已存在於規範內容中)，實際檔案由 storage 提供
+@upload_bp.route(IMAGE_URL_PREFIX + 'thumbs/<filename>')
+def image_thumbnail(filename):
+    return storage.serve(thumbnail_key(filename), as_attachment=False)
+
+@upload_bp.route(IMAGE_URL_PREFIX + '<filename>')
+def image_file(filename):
+    return storage.serve(image_key(filename), as_attachment=False)
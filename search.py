@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+暫時規範全文檢索
+
+- MySQL: InnoDB FULLTEXT 索引搭配 ngram parser (支援中日韓文字)，由資料庫自動維護。
+- SQLite: FTS5 虛擬資料表 (trigram tokenizer)，於建立/展延/終止/刪除時同步更新。
+- 其他資料庫或查詢字串短於 n-gram 長度時，退回 LIKE 查詢 (比對規範編號、標題、內容、批號與設備，與全文索引的欄位相同)。
+
+    python search.py    # 重建索引 (SQLite 重新匯入 FTS5 資料表；MySQL 確認 FULLTEXT 索引存在)
+"""
+import re
+
+from flask import current_app
+from sqlalchemy import text
+
+from models import db, TempSpec
+
+FTS_TABLE = 'temp_spec_fts'
+FULLTEXT_INDEX = 'ft_temp_spec'
+
+# 索引的欄位與 FTS5 bm25 權重：編號與主題命中時排序較前
+INDEXED_COLUMNS = ('spec_code', 'title', 'content', 'lot_number', 'equipment_type')
+_BM25_WEIGHTS = '10.0, 5.0, 1.0, 3.0, 3.0'
+
+# 各 tokenizer 能比對的最短字串長度
+_MIN_TERM_LENGTH = {'sqlite': 3, 'mysql': 2}
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def _terms(query):
+    return [term for term in re.split(r'\s+', query.strip()) if term]
+
+
+def ensure_search_index():
+    """建立全文檢索索引 (已存在時略過)"""
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        columns = ', '.join(INDEXED_COLUMNS)
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({columns}, tokenize='trigram')"
+        ))
+    elif dialect == 'mysql':
+        exists = db.session.execute(text(
+            "SELECT COUNT(*) FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'temp_spec' AND index_name = :name"
+        ), {'name': FULLTEXT_INDEX}).scalar()
+        if not exists:
+            db.session.execute(text(
+                f"ALTER TABLE temp_spec ADD FULLTEXT INDEX {FULLTEXT_INDEX} "
+                f"({', '.join(INDEXED_COLUMNS)}) WITH PARSER ngram"
+            ))
+    db.session.commit()
+
+
+def index_spec(spec):
+    """將規範寫入檢索索引 (與目前的交易一起 commit)。MySQL 的 FULLTEXT 索引由資料庫自動維護。"""
+    if _dialect() != 'sqlite':
+        return
+    params = {column: getattr(spec, column) or '' for column in INDEXED_COLUMNS}
+    params['id'] = spec.id
+    columns = ', '.join(INDEXED_COLUMNS)
+    values = ', '.join(f":{column}" for column in INDEXED_COLUMNS)
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': spec.id})
+    db.session.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (:id, {values})"), params)
+
+
+def remove_spec(spec_id):
+    if _dialect() != 'sqlite':
+        return
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': spec_id})
+
+
+def rebuild_search_index():
+    """重新建立索引內容"""
+    ensure_search_index()
+    if _dialect() == 'sqlite':
+        columns = ', '.join(INDEXED_COLUMNS)
+        coalesced = ', '.join(f"COALESCE({column}, '')" for column in INDEXED_COLUMNS)
+        db.session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        db.session.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, {columns}) SELECT id, {coalesced} FROM temp_spec"
+        ))
+        db.session.commit()
+
+
+def search_spec_ids(query, limit=None):
+    """
+    以全文檢索找出符合的規範 id，依相關度排序。
+    查詢字串無法使用索引時 (資料庫不支援或字詞過短) 回傳 None，由呼叫端改用 LIKE 查詢。
+    """
+    terms = _terms(query)
+    dialect = _dialect()
+    min_length = _MIN_TERM_LENGTH.get(dialect)
+    if not terms or min_length is None or any(len(term) < min_length for term in terms):
+        return None
+    limit = limit or current_app.config.get('SEARCH_MAX_RESULTS', 1000)
+
+    if dialect == 'sqlite':
+        match = ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        rows = db.session.execute(text(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+            f"ORDER BY bm25({FTS_TABLE}, {_BM25_WEIGHTS}) LIMIT :limit"
+        ), {'match': match, 'limit': limit})
+    else:
+        match = ' '.join('+"' + term.replace('"', ' ') + '"' for term in terms)
+        columns = ', '.join(INDEXED_COLUMNS)
+        rows = db.session.execute(text(
+            f"SELECT id FROM temp_spec WHERE MATCH ({columns}) AGAINST (:match IN BOOLEAN MODE) "
+            f"ORDER BY MATCH ({columns}) AGAINST (:match IN BOOLEAN MODE) DESC LIMIT :limit"
+        ), {'match': match, 'limit': limit})
+    return [row[0] for row in rows]
+
+
+def like_filter(query):
+    """無法使用全文索引時的 LIKE 條件"""
+    search_term = f"%{query}%"
+    return db.or_(
+        TempSpec.spec_code.ilike(search_term),
+        TempSpec.title.ilike(search_term),
+        TempSpec.content.ilike(search_term),
+        TempSpec.lot_number.ilike(search_term),
+        TempSpec.equipment_type.ilike(search_term),
+    )
+
+
+if __name__ == '__main__':
+    from flask import Flask
+    from config import Config
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+
+    with app.app_context():
+        print("🔄 重建全文檢索索引...")
+        rebuild_search_index()
+        print("✅ 完成")
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+暫時規範編號配發
+
+編號規則: PE + 民國年(3碼) + 月份(2碼) + 流水號 (至少 SPEC_CODE_SEQUENCE_WIDTH 碼，超過時自動加寬)。
+每個月份前綴在 spec_code_sequence 資料表有一筆計數列，配發時以單一 upsert 原子地遞增，
+不需掃描 temp_spec，多個 worker 同時建立也不會拿到相同編號。
+計數列不存在時 (新月份或升級前已有的資料)，以該月份既有的最大流水號作為起點。
+"""
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+from models import db, TempSpec, SpecCodeSequence
+
+
+def spec_code_prefix(now=None):
+    now = now or datetime.now()
+    return f"PE{now.year - 1911}{now.strftime('%m')}"
+
+
+def format_spec_code(prefix, sequence):
+    width = current_app.config.get('SPEC_CODE_SEQUENCE_WIDTH', 2)
+    return f"{prefix}{sequence:0{width}d}"
+
+
+def _existing_max_sequence(prefix):
+    """升級前以舊方式產生的編號中最大的流水號 (只在建立計數列時查詢一次)"""
+    codes = db.session.query(TempSpec.spec_code).filter(TempSpec.spec_code.startswith(prefix, autoescape=True))
+    sequences = [int(code[len(prefix):]) for (code,) in codes if code[len(prefix):].isdigit()]
+    return max(sequences, default=0)
+
+
+def _increment(prefix, seed):
+    """將計數加一並回傳新值；計數列不存在時以 seed + 1 建立"""
+    dialect = db.session.get_bind().dialect.name
+    params = {'prefix': prefix, 'first': seed + 1}
+    if dialect == 'sqlite':
+        return db.session.execute(text(
+            "INSERT INTO spec_code_sequence (prefix, last_value) VALUES (:prefix, :first) "
+            "ON CONFLICT (prefix) DO UPDATE SET last_value = last_value + 1 "
+            "RETURNING last_value"
+        ), params).scalar()
+    if dialect == 'mysql':
+        # LAST_INSERT_ID(expr) 讓同一連線取回本次寫入的值，不受其他連線影響
+        db.session.execute(text(
+            "INSERT INTO spec_code_sequence (prefix, last_value) VALUES (:prefix, LAST_INSERT_ID(:first)) "
+            "ON DUPLICATE KEY UPDATE last_value = LAST_INSERT_ID(last_value + 1)"
+        ), params)
+        return db.session.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+
+    # 其他資料庫：鎖定計數列後更新
+    row = db.session.query(SpecCodeSequence).filter_by(prefix=prefix).with_for_update().first()
+    if row is None:
+        row = SpecCodeSequence(prefix=prefix, last_value=seed)
+        db.session.add(row)
+    row.last_value += 1
+    db.session.flush()
+    return row.last_value
+
+
+def allocate_spec_code(now=None):
+    """
+    配發下一個編號。計數列與規範在同一個交易中寫入，
+    交易 rollback 時計數也一併還原。
+    """
+    prefix = spec_code_prefix(now)
+    exists = db.session.query(SpecCodeSequence.prefix).filter_by(prefix=prefix).first()
+    seed = 0 if exists else _existing_max_sequence(prefix)
+    return format_spec_code(prefix, _increment(prefix, seed))
+
+
+def peek_next_spec_code(now=None):
+    """預估下一個編號供畫面顯示 (不保留編號，實際編號於送出時配發)"""
+    prefix = spec_code_prefix(now)
+    row = db.session.query(SpecCodeSequence.last_value).filter_by(prefix=prefix).first()
+    last_value = row[0] if row else _existing_max_sequence(prefix)
+    return format_spec_code(prefix, last_value + 1)
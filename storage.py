@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+檔案儲存
+
+產生的文件、簽核檔案與上傳圖片都透過 storage 以 key 存取，不再直接組合本地路徑。
+key 依類別 / 年 / 月 / 雜湊前綴分層，單一資料夾中的檔案數不會無限增加：
+
+    specs/2025/01/3f/PE11401001/PE11401001.docx   產生的 Word / PDF
+    specs/2025/01/3f/PE11401001/signed/<檔名>      簽核檔案
+    images/a7/<檔名>                               上傳圖片 (依內容命名、可被多份規範共用，只依雜湊前綴分層)
+    images/thumbs/a7/<檔名>.jpg                    圖片縮圖
+
+後端以 STORAGE_BACKEND 選擇：
+- local: 存放在 STORAGE_ROOT 資料夾
+- s3: S3 相容的物件儲存 (AWS S3、MinIO 等，需安裝 boto3)；STORAGE_S3_ENDPOINT_URL 可指向本地的測試服務
+
+尚未以 migrate_storage.py 搬移的舊檔案 (平坦的 generated/、uploads/、static/uploads/images/)
+在 STORAGE_LEGACY_FALLBACK 開啟時仍可讀取與刪除。
+"""
+import contextlib
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+from urllib.parse import quote
+
+from flask import abort, redirect
+
+from file_serving import CHUNK_SIZE, save_upload, serve_file
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEGACY_IMAGE_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads', 'images')
+
+# 編號中的民國年月 (PE + 3 碼年 + 2 碼月)
+_SPEC_CODE_DATE = re.compile(r'^PE(\d{3})(\d{2})')
+
+
+# ---------------------------------------------------------------------------
+# key 配置
+# ---------------------------------------------------------------------------
+
+def _shard(name):
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:2]
+
+
+def spec_folder(spec_code, created_at=None):
+    """規範檔案所在的 key 前綴；年月取自編號 (不會變動)，舊格式的編號才使用建立時間"""
+    match = _SPEC_CODE_DATE.match(spec_code)
+    if match:
+        year_month = f"{int(match.group(1)) + 1911}/{match.group(2)}"
+    elif created_at is not None:
+        year_month = created_at.strftime('%Y/%m')
+    else:
+        year_month = 'undated'
+    return f"specs/{year_month}/{_shard(spec_code)}/{spec_code}"
+
+
+def document_key(spec_code, ext, created_at=None):
+    """產生的 Word / PDF；ext 為 'docx' 或 'pdf'"""
+    return f"{spec_folder(spec_code, created_at)}/{spec_code}.{ext}"
+
+
+def signed_key(spec_code, filename, created_at=None):
+    return f"{spec_folder(spec_code, created_at)}/signed/{filename}"
+
+
+def image_key(filename):
+    return f"images/{_shard(filename)}/{filename}"
+
+
+def thumbnail_key(filename):
+    stem = os.path.splitext(filename)[0]
+    return f"images/thumbs/{_shard(stem)}/{stem}.jpg"
+
+
+# ---------------------------------------------------------------------------
+# 後端
+# ---------------------------------------------------------------------------
+
+BACKENDS = {}
+
+
+def register_backend(cls):
+    """註冊儲存後端，讓設定值 STORAGE_BACKEND 可以用名稱選用。"""
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+class StorageBackend:
+    """儲存後端基底類別；key 一律以 / 分隔"""
+    name = None
+
+    def __init__(self, config):
+        self.config = config
+
+    def stat(self, key):
+        """回傳 (size, mtime)；不存在時回傳 None"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    def open(self, key):
+        """以二進位模式開啟供讀取；不存在時拋出 FileNotFoundError"""
+        raise NotImplementedError
+
+    def save(self, key, stream):
+        """分塊寫入 stream 的內容 (完成後才可見)，回傳 (sha256, size)"""
+        raise NotImplementedError
+
+    def save_file(self, key, path, move=False):
+        """儲存本地檔案；move=True 時完成後刪除來源檔"""
+        with open(path, 'rb') as f:
+            self.save(key, f)
+        if move:
+            os.remove(path)
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def iter_keys(self, prefix=''):
+        """依序產生 (key, size, mtime)"""
+        raise NotImplementedError
+
+    def filesystem_path(self, key):
+        """檔案在本機檔案系統上的路徑；遠端後端回傳 None"""
+        return None
+
+    def local_path(self, key):
+        """取得可在本機開啟的路徑 (遠端後端會下載到快取資料夾)；不存在時回傳 None"""
+        raise NotImplementedError
+
+    def url(self, key, download_name, as_attachment=True):
+        """可直接下載的網址；本地後端回傳 None"""
+        return None
+
+
+def _validate_key(key):
+    parts = key.split('/')
+    if not key or key.startswith('/') or any(part in ('', '.', '..') for part in parts):
+        raise ValueError(f"無效的檔案 key: {key!r}")
+    return parts
+
+
+@register_backend
+class LocalStorage(StorageBackend):
+    """存放在本機資料夾 (STORAGE_ROOT)"""
+    name = 'local'
+
+    def __init__(self, config):
+        super().__init__(config)
+        root = config['STORAGE_ROOT']
+        self.root = root if os.path.isabs(root) else os.path.join(BASE_DIR, root)
+
+    def filesystem_path(self, key):
+        return os.path.join(self.root, *_validate_key(key))
+
+    def stat(self, key):
+        try:
+            st = os.stat(self.filesystem_path(key))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime
+
+    def open(self, key):
+        return open(self.filesystem_path(key), 'rb')
+
+    def save(self, key, stream):
+        return save_upload(stream, self.filesystem_path(key))
+
+    def save_file(self, key, path, move=False):
+        target = self.filesystem_path(key)
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        if move and os.stat(path).st_dev == os.stat(directory).st_dev:
+            os.replace(path, target)
+            return
+        # 先複製到目的資料夾中的暫存檔再 rename，讀取端不會看到寫一半的檔案
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        os.close(fd)
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if move:
+            os.remove(path)
+
+    def delete(self, key):
+        try:
+            os.remove(self.filesystem_path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_keys(self, prefix=''):
+        base = os.path.join(self.root, *_validate_key(prefix.rstrip('/'))) if prefix else self.root
+        for directory, dirnames, filenames in os.walk(base):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.part'):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), st.st_size, st.st_mtime
+
+    def local_path(self, key):
+        path = self.filesystem_path(key)
+        return path if os.path.isfile(path) else None
+
+
+@register_backend
+class S3Storage(StorageBackend):
+    """S3 相容的物件儲存；認證資訊使用 boto3 的標準設定 (環境變數、~/.aws 等)"""
+    name = 's3'
+
+    def __init__(self, config):
+        super().__init__(config)
+        try:
+            import boto3
+            from botocore.config import Config as BotoConfig
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("使用 S3 儲存需要安裝 boto3: pip install boto3")
+        self._client_error = ClientError
+        self.bucket = config['STORAGE_S3_BUCKET']
+        if not self.bucket:
+            raise ValueError("未設定 STORAGE_S3_BUCKET")
+        self.prefix = config['STORAGE_S3_PREFIX'].strip('/')
+        self.client = boto3.client(
+            's3',
+            endpoint_url=config['STORAGE_S3_ENDPOINT_URL'] or None,
+            region_name=config['STORAGE_S3_REGION'] or None,
+            config=BotoConfig(signature_version='s3v4', retries={'max_attempts': 5, 'mode': 'standard'}),
+        )
+        cache = config['STORAGE_CACHE_FOLDER']
+        self.cache_folder = cache if os.path.isabs(cache) else os.path.join(BASE_DIR, cache)
+
+    def _object_key(self, key):
+        _validate_key(key)
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self._client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def stat(self, key):
+        head = self._head(key)
+        if head is None:
+            return None
+        return head['ContentLength'], head['LastModified'].timestamp()
+
+    def open(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self._client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(key)
+            raise
+        return contextlib.closing(response['Body'])
+
+    def save(self, key, stream):
+        stream = getattr(stream, 'stream', stream)
+        hashing = _HashingReader(stream)
+        self.client.upload_fileobj(hashing, self.bucket, self._object_key(key))
+        return hashing.digest.hexdigest(), hashing.size
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def iter_keys(self, prefix=''):
+        full_prefix = self._object_key(prefix.rstrip('/')) + '/' if prefix else (f"{self.prefix}/" if self.prefix else '')
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=full_prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'][strip:], item['Size'], item['LastModified'].timestamp()
+
+    def local_path(self, key):
+        # 快取路徑包含 ETag，物件被覆寫 (例如圖片重新壓縮) 後會下載新版本
+        head = self._head(key)
+        if head is None:
+            return None
+        path = os.path.join(self.cache_folder, head['ETag'].strip('"'), *_validate_key(key))
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+            os.close(fd)
+            try:
+                self.client.download_file(self.bucket, self._object_key(key), tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return path
+
+    def url(self, key, download_name, as_attachment=True):
+        disposition = 'attachment' if as_attachment else 'inline'
+        return self.client.generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket,
+            'Key': self._object_key(key),
+            'ResponseContentDisposition': f"{disposition}; filename*=UTF-8''{quote(download_name)}",
+        }, ExpiresIn=self.config['STORAGE_S3_URL_TTL'])
+
+
+class _HashingReader:
+    """讀取時同時計算 SHA-256 與大小"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        chunk = self._stream.read(CHUNK_SIZE if size is None or size < 0 else size)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+
+# ---------------------------------------------------------------------------
+# 對外介面
+# ---------------------------------------------------------------------------
+
+class FileStorage:
+    """
+    設定的後端加上舊檔案位置的讀取。
+    用法與 Flask 擴充套件相同；未呼叫 init_app 時 (例如程序池的 worker) 使用 config.py 的設定。
+    """
+
+    DEFAULTS = {
+        'STORAGE_BACKEND': 'local',
+        'STORAGE_ROOT': 'storage',
+        'STORAGE_LEGACY_FALLBACK': True,
+        'STORAGE_S3_BUCKET': '',
+        'STORAGE_S3_PREFIX': '',
+        'STORAGE_S3_ENDPOINT_URL': '',
+        'STORAGE_S3_REGION': '',
+        'STORAGE_S3_URL_TTL': 300,
+        'STORAGE_CACHE_FOLDER': os.path.join('cache', 'storage'),
+        'UPLOAD_FOLDER': 'uploads',
+        'GENERATED_FOLDER': 'generated',
+    }
+
+    def __init__(self, app=None):
+        self._backend = None
+        self.config = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.configure(app.config)
+        app.extensions['storage'] = self
+
+    def configure(self, mapping):
+        config = {key: mapping.get(key, default) for key, default in self.DEFAULTS.items()}
+        name = config['STORAGE_BACKEND']
+        if name not in BACKENDS:
+            raise ValueError(f"未知的儲存後端: {name}")
+        self.config = config
+        self._backend = BACKENDS[name](config)
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            from config import Config
+            self.configure(vars(Config))
+        return self._backend
+
+    def legacy_path(self, key):
+        """搬移到分層配置前的檔案位置；不適用或已停用時回傳 None"""
+        config = self.backend.config
+        if not config['STORAGE_LEGACY_FALLBACK']:
+            return None
+        parts = _validate_key(key)
+        name = parts[-1]
+        if parts[0] == 'specs':
+            folder = config['UPLOAD_FOLDER'] if parts[-2] == 'signed' else config['GENERATED_FOLDER']
+            return os.path.join(BASE_DIR, folder, name)
+        if parts[0] == 'images':
+            if parts[1] == 'thumbs':
+                return os.path.join(LEGACY_IMAGE_FOLDER, 'thumbs', name)
+            return os.path.join(LEGACY_IMAGE_FOLDER, name)
+        return None
+
+    def _legacy_file(self, key):
+        path = self.legacy_path(key)
+        return path if path and os.path.isfile(path) else None
+
+    def stat(self, key):
+        found = self.backend.stat(key)
+        if found is None:
+            legacy = self._legacy_file(key)
+            if legacy:
+                st = os.stat(legacy)
+                return st.st_size, st.st_mtime
+        return found
+
+    def exists(self, key):
+        return self.backend.exists(key) or self._legacy_file(key) is not None
+
+    def open(self, key):
+        try:
+            return self.backend.open(key)
+        except FileNotFoundError:
+            legacy = self._legacy_file(key)
+            if legacy is None:
+                raise
+            return open(legacy, 'rb')
+
+    def local_path(self, key):
+        return self.backend.local_path(key) or self._legacy_file(key)
+
+    def save(self, key, stream):
+        return self.backend.save(key, stream)
+
+    def save_bytes(self, key, data):
+        return self.backend.save(key, io.BytesIO(data))
+
+    def save_file(self, key, path, move=False):
+        self.backend.save_file(key, path, move=move)
+
+    def delete(self, key):
+        """刪除檔案 (包含尚未搬移的舊檔案)"""
+        self.backend.delete(key)
+        legacy = self._legacy_file(key)
+        if legacy:
+            os.remove(legacy)
+
+    def iter_keys(self, prefix=''):
+        return self.backend.iter_keys(prefix)
+
+    def serve(self, key, download_name=None, etag=None, as_attachment=True):
+        """
+        回應檔案下載：本機檔案交給 serve_file (支援 304 / Range / X-Accel)，
+        遠端物件則轉址到有時效的下載網址。找不到時回應 404。
+        """
+        download_name = download_name or key.rsplit('/', 1)[-1]
+        path = self.backend.filesystem_path(key)
+        if path is None or not os.path.isfile(path):
+            path = self._legacy_file(key)
+        if path is not None:
+            return serve_file(path, download_name=download_name, etag=etag, as_attachment=as_attachment)
+        if self.backend.filesystem_path(key) is None and self.backend.exists(key):
+            return redirect(self.backend.url(key, download_name, as_attachment))
+        abort(404)
+
+
+storage = FileStorage()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+清除已刪除規範的檔案與未被任何規範引用的上傳圖片，適合由 cron / 工作排程器定期執行。
+
+    python sweep_files.py --dry-run        # 只列出可回收的檔案數與大小
+    python sweep_files.py
+    python sweep_files.py --scan-storage   # 一併列出整個 storage，找出沒有對應資料的舊檔案
+"""
+import argparse
+from flask import Flask
+from models import db
+from config import Config
+from storage import storage
+from file_gc import sweep_files, metrics
+
+
+def format_bytes(size):
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='清除已刪除規範的檔案與未被引用的圖片')
+    parser.add_argument('--dry-run', action='store_true', help='只產生報告，不刪除')
+    parser.add_argument('--scan-storage', action='store_true',
+                        help='列出整個 storage，清除沒有對應規範或圖片紀錄的檔案 (檔案多時較慢)')
+    parser.add_argument('--grace-hours', type=int, default=Config.FILE_GC_IMAGE_GRACE_HOURS,
+                        help='未被引用的圖片在最後一次上傳後保留的時數')
+    parser.add_argument('--batch-size', type=int, default=Config.FILE_GC_BATCH_SIZE, help='每批處理的筆數')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    storage.init_app(app)
+
+    with app.app_context():
+        report = sweep_files(dry_run=args.dry_run, batch_size=args.batch_size, image_grace_hours=args.grace_hours,
+                             max_attempts=Config.FILE_GC_MAX_ATTEMPTS, scan_storage=args.scan_storage,
+                             deleted_spec_retention_days=Config.API_DELETED_SPEC_RETENTION_DAYS)
+        if args.dry_run:
+            print("🔍 可回收的檔案 (僅統計):")
+            print(f"   - 已刪除規範的檔案: {report.tombstones} 個，{format_bytes(report.tombstone_bytes)}")
+            print(f"   - 未被引用的圖片: {report.orphan_images} 張，{format_bytes(report.orphan_image_bytes)}")
+            if args.scan_storage:
+                print(f"   - 沒有對應資料的檔案: {report.stray_files} 個，{format_bytes(report.stray_bytes)}")
+            print(f"   合計 {format_bytes(report.reclaimable_bytes)}")
+            print(f"   - 超過保留期間的已刪除規範紀錄 (API 同步用): {report.deleted_specs} 筆")
+        else:
+            print(f"✅ 已清除 {report.files_deleted} 個檔案，共 {format_bytes(report.bytes_deleted)} "
+                  f"(其中未被引用的圖片 {report.orphan_images} 張"
+                  f"{f'、沒有對應資料的檔案 {report.stray_files} 個' if args.scan_storage else ''})，"
+                  f"耗時 {metrics['last_duration_ms']} ms")
+            if report.deleted_specs:
+                print(f"🧹 已刪除 {report.deleted_specs} 筆超過保留期間的已刪除規範紀錄 (API 同步用)")
+            if report.failed:
+                print(f"⚠️  {report.failed} 個檔案刪除失敗，下次執行時重試")
+        if report.stuck:
+            print(f"⚠️  {report.stuck} 個檔案已重試 {Config.FILE_GC_MAX_ATTEMPTS} 次仍無法刪除，"
+                  f"請檢查 file_tombstone 資料表的 last_error")
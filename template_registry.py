@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Word 模板註冊表
+
+每個模板檔只讀取、前處理 (docxtpl 的 patch_xml) 與編譯 Jinja 一次，
+檔案的 mtime/size 變動時自動重新載入。每次渲染取得一份獨立的 DocxTemplate，
+其 Document 由記憶體中的位元組建立，不再重複讀檔與編譯。
+"""
+import io
+import logging
+import os
+import threading
+
+from docxtpl import DocxTemplate
+from jinja2 import Environment
+
+logger = logging.getLogger(__name__)
+
+# 單一模板快取的 XML 區塊數上限 (本文 + 頁首/頁尾 + 文件屬性)，避免異常情況下無限成長
+_MAX_CACHED_PARTS = 64
+
+
+class _CachingEnvironment(Environment):
+    """以原始碼為 key 快取 from_string 編譯結果的 Jinja 環境。"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._compiled = {}
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals is not None or template_class is not None:
+            return super().from_string(source, globals, template_class)
+        template = self._compiled.get(source)
+        if template is None:
+            template = super().from_string(source)
+            if len(self._compiled) >= _MAX_CACHED_PARTS:
+                self._compiled.clear()
+            self._compiled[source] = template
+        return template
+
+
+class _TemplateEntry:
+    """同一個模板版本 (path + mtime + size) 的快取內容。"""
+
+    def __init__(self, path, signature, blob):
+        self.path = path
+        self.signature = signature
+        self.blob = blob
+        self.jinja_env = _CachingEnvironment()
+        self.patched = {}
+
+    def patch_xml(self, src_xml, patch):
+        patched = self.patched.get(src_xml)
+        if patched is None:
+            patched = patch(src_xml)
+            if len(self.patched) >= _MAX_CACHED_PARTS:
+                self.patched.clear()
+            self.patched[src_xml] = patched
+        return patched
+
+
+class PrecompiledDocxTemplate(DocxTemplate):
+    """
+    由 TemplateRegistry 產生的 DocxTemplate。
+    Document 由快取的位元組建立，patch_xml 與 Jinja 編譯結果在同一模板版本間共用。
+    """
+
+    def __init__(self, entry):
+        super().__init__(io.BytesIO(entry.blob))
+        self._entry = entry
+
+    def init_docx(self, reload=True):
+        self.template_file.seek(0)
+        super().init_docx(reload)
+
+    def patch_xml(self, src_xml):
+        return self._entry.patch_xml(src_xml, super().patch_xml)
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        if jinja_env is None and not autoescape:
+            jinja_env = self._entry.jinja_env
+        super().render(context, jinja_env, autoescape)
+
+
+class TemplateRegistry:
+    """以檔案路徑管理已載入的 Word 模板。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _load(self, path, signature):
+        with open(path, 'rb') as f:
+            entry = _TemplateEntry(path, signature, f.read())
+        # 先以空的 context 渲染一次，讓本文、頁首/頁尾的前處理與編譯結果進入快取
+        try:
+            PrecompiledDocxTemplate(entry).render({})
+        except Exception as e:
+            logger.warning("模板預先編譯失敗 (%s): %s", path, e)
+        return entry
+
+    def get(self, path):
+        """取得模板的獨立副本，檔案變動時自動重新載入。"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+        entry = self._entries.get(path)
+        if entry is None or entry.signature != signature:
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is None or entry.signature != signature:
+                    entry = self._load(path, signature)
+                    self._entries[path] = entry
+                    logger.info("已載入 Word 模板: %s", path)
+        return PrecompiledDocxTemplate(entry)
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+
+template_registry = TemplateRegistry()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+登入使用者快取
+
+Flask-Login 每個請求都會呼叫 user_loader；這裡以行程內的 TTL/LRU 快取保存
+使用者的精簡快照 (id、帳號、角色)，已登入的頁面不再每次查詢資料庫。
+
+管理者修改或刪除使用者時會明確移除快取，並將使用者 id 附加到訊號檔 (USER_CACHE_SIGNAL_FILE)；
+其他 worker 在讀取快取前檢查訊號檔是否有新內容，藉此同步失效。未設定訊號檔時
+其他 worker 最晚在 USER_CACHE_TTL 秒後重新讀取。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 訊號檔超過此大小時換成新檔，所有 worker 會因此清除整個快取
+_SIGNAL_MAX_BYTES = 64 * 1024
+
+
+class CachedUser:
+    """current_user 使用的使用者快照，提供 Flask-Login 所需的屬性"""
+    __slots__ = ('id', 'username', 'role')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, username, role):
+        self.id = id
+        self.username = username
+        self.role = role
+
+    @classmethod
+    def from_model(cls, user):
+        return cls(user.id, user.username, user.role)
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, CachedUser) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class UserCache:
+    """行程內的使用者快取。用法與 Flask 擴充套件相同。"""
+
+    DEFAULTS = {
+        'USER_CACHE_TTL': 300,
+        'USER_CACHE_SIZE': 1024,
+        'USER_CACHE_SIGNAL_FILE': os.path.join('cache', 'user_cache.signal'),
+    }
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._signal_position = None
+        self.signal_path = None
+        self.config = dict(self.DEFAULTS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.config = {key: app.config.get(key, default) for key, default in self.DEFAULTS.items()}
+        signal_file = self.config['USER_CACHE_SIGNAL_FILE']
+        self.signal_path = os.path.join(BASE_DIR, signal_file) if signal_file else None
+        if self.signal_path:
+            os.makedirs(os.path.dirname(self.signal_path), exist_ok=True)
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id):
+        """回傳使用者快照；使用者不存在時回傳 None"""
+        self._apply_signals()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                return entry[0]
+
+        from models import db, User
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = CachedUser.from_model(user)
+        with self._lock:
+            self._entries[user_id] = (snapshot, now + self.config['USER_CACHE_TTL'])
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.config['USER_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        """移除使用者的快取 (修改角色、密碼或刪除使用者後呼叫)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if not self.signal_path:
+            return
+        try:
+            if os.path.exists(self.signal_path) and os.path.getsize(self.signal_path) > _SIGNAL_MAX_BYTES:
+                rotated = f"{self.signal_path}.{os.getpid()}.tmp"
+                open(rotated, 'wb').close()
+                os.replace(rotated, self.signal_path)
+            with open(self.signal_path, 'ab') as f:
+                f.write(f"{user_id}\n".encode('ascii'))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _apply_signals(self):
+        """讀取其他 worker 附加到訊號檔的使用者 id 並移除對應的快取"""
+        if not self.signal_path:
+            return
+        try:
+            st = os.stat(self.signal_path)
+            inode, size = st.st_ino, st.st_size
+        except OSError:
+            inode, size = None, 0
+        with self._lock:
+            position = self._signal_position
+            self._signal_position = (inode, size)
+            if position is None:
+                # 第一次讀取：只記錄目前位置，之前的訊號與本行程無關
+                return
+            if position == (inode, size):
+                return
+            if position[0] != inode or size < position[1]:
+                # 訊號檔已換新，無法得知遺漏的內容，清除整個快取
+                self._entries.clear()
+                return
+            offset = position[1]
+        try:
+            with open(self.signal_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+        except OSError:
+            return
+        # 只處理完整的行，寫入到一半的內容留待下次讀取
+        complete = data[:data.rfind(b'\n') + 1]
+        with self._lock:
+            for line in complete.split():
+                if line.isdigit():
+                    self._entries.pop(int(line), None)
+            self._signal_position = (inode, offset + len(complete))
+
+
+user_cache = UserCache()
@@ -1,23 +1,35 @@
-from docxtpl import DocxTemplate, InlineImage
+from docxtpl import InlineImage
 from docx.shared import Mm
-from docx2pdf import convert
+import hashlib
+import html as html_lib
 import os
 import re
+import threading
+from collections import OrderedDict
 from functools import wraps
 from flask_login import current_user
 from flask import abort
 from bs4 import BeautifulSoup, NavigableString, Tag
-import pythoncom
 import mistune
-from PIL import Image
+from converter import conversion_pool
+from images import image_sizes, IMAGE_URL_PREFIX
+from storage import storage, image_key, LEGACY_IMAGE_FOLDER
+from template_registry import template_registry
+from metrics import render_stage_seconds
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 def _resolve_image_path(src: str) -> str:
     """
     將 HTML 圖片 src 轉換為本地檔案絕對路徑
-    支援 /static/... 路徑與相對路徑
+    上傳的圖片由 storage 取得 (遠端儲存時下載到本機快取)，其他支援 /static/... 路徑與相對路徑
     """
+    index = src.find(IMAGE_URL_PREFIX)
+    if index != -1:
+        filename = os.path.basename(src[index + len(IMAGE_URL_PREFIX):].split('?', 1)[0])
+        if filename:
+            # 找不到時回傳舊的圖片位置，呼叫端會視為圖片不存在
+            return storage.local_path(image_key(filename)) or os.path.join(LEGACY_IMAGE_FOLDER, filename)
     if src.startswith('/'):
         static_index = src.find('/static/')
         if static_index != -1:
@@ -27,26 +39,25 @@ def _resolve_image_path(src: str) -> str:
 
 import logging
 
-DEBUG_LOG = True  # 設定為 False 可關閉 debug 訊息
+# 除錯訊息改用 logging：未開啟 DEBUG 等級時 (LOG_LEVEL) 不會組出訊息字串
+logger = logging.getLogger(__name__)
 
-def _process_markdown_sections(doc, md_content):
-    from bs4 import BeautifulSoup, Tag
-    from PIL import Image
-    from docxtpl import InlineImage
-    from docx.shared import Mm
-
-    def log(msg):
-        if DEBUG_LOG:
-            print(f"[DEBUG] {msg}")
-
-    def resolve_image(src):
-        if src.startswith('/'):
-            static_index = src.find('/static/')
-            if static_index != -1:
-                path_rel = src[static_index + 1:]
-                return os.path.join(BASE_DIR, path_rel)
-        return os.path.join(BASE_DIR, src.lstrip('/'))
+# 與 mistune.html 相同的 plugin 設定，確保 AST 與原本的 HTML 轉換結果一致
+_markdown_ast = mistune.create_markdown(
+    renderer=None, escape=False, plugins=['strikethrough', 'footnotes', 'table', 'speedup'])
+
+# AST 快速路徑支援的行內元素；其他型別 (例如行內 HTML、註腳) 改走 HTML 路徑
+_INLINE_TAG_TYPES = ('strong', 'emphasis', 'codespan', 'strikethrough', 'link')
+_BR_HTML = re.compile(r'^<br\s*/?>$', re.IGNORECASE)
+
+class _UnsupportedMarkdown(Exception):
+    """AST 中含有快速路徑無法保證與 HTML 路徑結果一致的元素"""
 
+def _html_sections(html):
+    """
+    原本的 HTML 路徑：以 BeautifulSoup 走訪 mistune 產生的 HTML。
+    用於含有原始 HTML 的內容，回傳 ('text', str) / ('image', src) 的 section 描述。
+    """
     def extract_table_text(table_tag):
         lines = []
         for i, row in enumerate(table_tag.find_all("tr")):
@@ -58,75 +69,219 @@ def _process_markdown_sections(doc, md_content):
         return "\n".join(lines)
 
     results = []
-    if not md_content:
-        log("Markdown content is empty")
-        return results
-
-    html = mistune.html(md_content)
     soup = BeautifulSoup(html, 'lxml')
+    if soup.body is None:
+        return results
 
     for elem in soup.body.children:
         if isinstance(elem, Tag):
             if elem.name == 'table':
-                table_text = extract_table_text(elem)
-                log(f"[表格] {table_text}")
-                results.append({'text': table_text, 'image': None})
+                results.append(('text', extract_table_text(elem)))
                 continue
 
             if elem.name in ['p', 'div']:
                 for child in elem.children:
                     if isinstance(child, Tag) and child.name == 'img' and child.has_attr('src'):
-                        try:
-                            img_path = resolve_image(child['src'])
-                            if os.path.exists(img_path):
-                                with Image.open(img_path) as im:
-                                    width_px = im.width
-                                    width_mm = min(width_px * 25.4 / 96, 130)
-                                    image = InlineImage(doc, img_path, width=Mm(width_mm))
-                                    log(f"[圖片] {img_path}, 寬: {width_mm:.2f} mm")
-                                    results.append({'text': None, 'image': image})
-                            else:
-                                log(f"[警告] 圖片不存在: {img_path}")
-                        except Exception as e:
-                            log(f"[錯誤] 圖片處理失敗: {e}")
+                        results.append(('image', child['src']))
                     else:
                         text = child.get_text(strip=True) if hasattr(child, 'get_text') else str(child).strip()
                         if text:
-                            log(f"[文字] {text}")
-                            results.append({'text': text, 'image': None})
+                            results.append(('text', text))
     return results
 
+def _inline_strings(tokens):
+    """
+    依 HTML 文字節點的切分方式回傳行內 token 的文字片段：
+    相鄰的文字與軟換行屬於同一個節點，遇到標籤時切開。
+    """
+    strings = []
+    run = None
+    for tok in tokens:
+        t = tok['type']
+        if t == 'text':
+            run = (run or '') + html_lib.unescape(mistune.util.safe_entity(tok['raw']))
+        elif t == 'softbreak':
+            run = (run or '') + '\n'
+        elif t == 'linebreak' or (t == 'inline_html' and _BR_HTML.match(tok['raw'])):
+            if run is not None:
+                strings.append(run)
+            run = None
+        elif t == 'image':
+            if run is not None:
+                strings.append(run)
+            run = None
+        elif t == 'codespan':
+            if run is not None:
+                strings.append(run)
+            run = None
+            strings.append(tok['raw'])
+        elif t in _INLINE_TAG_TYPES:
+            if run is not None:
+                strings.append(run)
+            run = None
+            strings.extend(_inline_strings(tok['children']))
+        else:
+            raise _UnsupportedMarkdown(t)
+    if run is not None:
+        strings.append(run)
+    return strings
+
+def _inline_text(tokens):
+    """等同 BeautifulSoup 的 get_text(strip=True)"""
+    return ''.join(s.strip() for s in _inline_strings(tokens))
 
+def _paragraph_sections(tokens, results):
+    run = None
 
+    def flush():
+        if run is not None and run.strip():
+            results.append(('text', run.strip()))
 
+    for tok in tokens:
+        t = tok['type']
+        if t == 'text':
+            run = (run or '') + html_lib.unescape(mistune.util.safe_entity(tok['raw']))
+        elif t == 'softbreak':
+            run = (run or '') + '\n'
+        elif t == 'linebreak' or (t == 'inline_html' and _BR_HTML.match(tok['raw'])):
+            flush()
+            run = None
+        elif t == 'image':
+            flush()
+            run = None
+            results.append(('image', tok['attrs']['url']))
+        elif t == 'codespan' or t in _INLINE_TAG_TYPES:
+            flush()
+            run = None
+            text = _inline_text([tok])
+            if text:
+                results.append(('text', text))
+        else:
+            raise _UnsupportedMarkdown(t)
+    flush()
 
-def fill_template(values, template_path, output_word_path, output_pdf_path):
-    from docxtpl import DocxTemplate
-    import pythoncom
-    from docx2pdf import convert
+def _table_text(table_token):
+    rows = []
+    for part in table_token['children']:
+        if part['type'] == 'table_head':
+            rows.append(part['children'])
+        else:
+            rows.extend(row['children'] for row in part['children'])
 
-    doc = DocxTemplate(template_path)
+    lines = []
+    for i, cells in enumerate(rows):
+        lines.append(" | ".join(_inline_text(cell['children']) for cell in cells))
+        if i == 0:
+            lines.append(" | ".join(["---"] * len(cells)))
+    return "\n".join(lines)
 
-    # 填入 context，None 改為空字串
-    context = {k: (v if v is not None else '') for k, v in values.items()}
+def _markdown_ast_sections(md_content):
+    """單次走訪 mistune AST 產生 section 描述，結果與 _html_sections(mistune.html(...)) 相同"""
+    results = []
+    for tok in _markdown_ast(md_content):
+        t = tok['type']
+        if t == 'paragraph':
+            _paragraph_sections(tok['children'], results)
+        elif t == 'table':
+            results.append(('text', _table_text(tok)))
+        elif t == 'block_html':
+            # 原始 HTML 區塊可能包住後續內容，無法逐區塊處理
+            raise _UnsupportedMarkdown(t)
+    return results
 
-    # 更新後版本：處理 Markdown → sections（支援圖片+表格+段落）
-    context["change_before_sections"] = _process_markdown_sections(doc, context.get("change_before", ""))
-    context["change_after_sections"] = _process_markdown_sections(doc, context.get("change_after", ""))
+_SECTION_CACHE_SIZE = 256
+_section_cache = OrderedDict()
+_section_cache_lock = threading.Lock()
 
-    # 渲染
-    doc.render(context)
-    doc.save(output_word_path)
+def _markdown_section_specs(md_content):
+    """
+    將 Markdown 轉為 section 描述 (以內容雜湊快取)。
+    一般內容走單次 AST 路徑，含原始 HTML 時退回原本的 HTML 路徑。
+    """
+    key = hashlib.sha1(md_content.encode('utf-8')).digest()
+    with _section_cache_lock:
+        specs = _section_cache.get(key)
+        if specs is not None:
+            _section_cache.move_to_end(key)
+            return specs
 
-    # 轉 PDF
     try:
-        pythoncom.CoInitialize()
-        convert(output_word_path, output_pdf_path)
-    except Exception as e:
-        print(f"PDF conversion failed: {e}")
-        raise
-    finally:
-        pythoncom.CoUninitialize()
+        specs = tuple(_markdown_ast_sections(md_content))
+    except _UnsupportedMarkdown:
+        specs = tuple(_html_sections(mistune.html(md_content)))
+
+    with _section_cache_lock:
+        _section_cache[key] = specs
+        while len(_section_cache) > _SECTION_CACHE_SIZE:
+            _section_cache.popitem(last=False)
+    return specs
+
+def _process_markdown_sections(doc, md_content):
+    results = []
+    if not md_content:
+        logger.debug("Markdown content is empty")
+        return results
+
+    debug = logger.isEnabledFor(logging.DEBUG)
+    with render_stage_seconds.time('markdown'):
+        specs = _markdown_section_specs(md_content)
+
+    with render_stage_seconds.time('images'):
+        # 圖片尺寸由上傳時記錄的中繼資料一次查出，不再逐張開啟圖片
+        image_paths = {value: _resolve_image_path(value) for kind, value in specs if kind == 'image'}
+        sizes = image_sizes(image_paths.values()) if image_paths else {}
+
+        for kind, value in specs:
+            if kind == 'text':
+                if debug:
+                    logger.debug("[文字] %s", value)
+                results.append({'text': value, 'image': None})
+                continue
+
+            img_path = image_paths[value]
+            if img_path not in sizes or not os.path.exists(img_path):
+                logger.warning("圖片不存在: %s", img_path)
+                continue
+            try:
+                width_px = sizes[img_path][0]
+                width_mm = min(width_px * 25.4 / 96, 130)
+                image = InlineImage(doc, img_path, width=Mm(width_mm))
+                if debug:
+                    logger.debug("[圖片] %s, 寬: %.2f mm", img_path, width_mm)
+                results.append({'text': None, 'image': image})
+            except Exception as e:
+                logger.warning("圖片處理失敗: %s: %s", img_path, e)
+    return results
+
+
+
+
+def fill_template(values, template_path, output_word_path, output_pdf_path):
+    with render_stage_seconds.time('total'):
+        # 模板只在第一次使用或檔案變動時解析與編譯，每次渲染取得記憶體中的獨立副本
+        with render_stage_seconds.time('template'):
+            doc = template_registry.get(template_path)
+
+        # 填入 context，None 改為空字串
+        context = {k: (v if v is not None else '') for k, v in values.items()}
+
+        # 更新後版本：處理 Markdown → sections（支援圖片+表格+段落）
+        context["change_before_sections"] = _process_markdown_sections(doc, context.get("change_before", ""))
+        context["change_after_sections"] = _process_markdown_sections(doc, context.get("change_after", ""))
+
+        # 渲染
+        with render_stage_seconds.time('render'):
+            doc.render(context)
+        with render_stage_seconds.time('save'):
+            doc.save(output_word_path)
+
+        # 轉 PDF：交由常駐的轉檔 worker 池處理，不在請求執行緒中啟動 Word/LibreOffice
+        try:
+            with render_stage_seconds.time('pdf'):
+                conversion_pool.convert(output_word_path, output_pdf_path)
+        except Exception as e:
+            logger.error("PDF 轉檔失敗: %s", e)
+            raise
 
 
 
@@ -148,13 +303,7 @@ def editor_or_admin_required(f):
     return decorated_function
 
 def add_history_log(spec_id, action, details=""):
-    """新增一筆操作歷史紀錄"""
-    from models import db, SpecHistory
-    
-    history_entry = SpecHistory(
-        spec_id=spec_id,
-        user_id=current_user.id,
-        action=action,
-        details=details
-    )
-    db.session.add(history_entry)
+    """新增一筆操作歷史紀錄 (暫存後於 commit 前批次寫入)"""
+    from audit import record_history
+
+    record_history(spec_id, action, details, user_id=current_user.id)